@@ -1,6 +1,8 @@
 from django.contrib import admin
+from .cache import invalider_sites
+from .statistiques import reconstruire_statistiques
 from .models import (
-    Operateur,Emplacement,Departement,Commune,Localite,Technologie,Site,Conformite,SiteTechnologie,UploadedFile,
+    Operateur,Emplacement,Departement,Commune,Localite,Technologie,Site,Conformite,SiteTechnologie,UploadedFile,ImportJob,
     )
 
 @admin.register(Operateur)
@@ -55,10 +57,15 @@ class ConformiteAdmin(admin.ModelAdmin):
 
     def mark_as_compliant(self, request, queryset):
         queryset.update(statut=True)
+        # update() ne déclenche pas les signaux : resynchronise les agrégats
+        reconstruire_statistiques()
+        invalider_sites()
         self.message_user(request, "Sélectionné(s) marqué(s) comme conforme(s).")
 
     def mark_as_non_compliant(self, request, queryset):
         queryset.update(statut=False)
+        reconstruire_statistiques()
+        invalider_sites()
         self.message_user(request, "Sélectionné(s) marqué(s) comme non conforme(s).")
 
     mark_as_compliant.short_description = "Marquer comme conforme"
@@ -72,3 +79,9 @@ class SiteTechnologieAdmin(admin.ModelAdmin):
     list_filter = ('site', 'technologie')
     search_fields = ('site__nom', 'technologie__nom')
     ordering = ('-date_ajout',)
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('fichier', 'statut', 'simulation', 'lignes_traitees', 'lignes_en_erreur', 'cree_le', 'fin')
+    list_filter = ('statut', 'simulation')
+    readonly_fields = ('lignes_traitees', 'lignes_en_erreur', 'erreurs', 'rapport', 'worker', 'debut', 'actif_le', 'fin')
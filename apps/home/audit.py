@@ -0,0 +1,290 @@
+# -*- encoding: utf-8 -*-
+"""
+Audit des coordonnées des sites par rapport aux limites administratives.
+
+La commune et le département déclarés d'un site (Localite -> Commune ->
+Departement) sont comparés à ceux qui contiennent géométriquement ses
+coordonnées, d'après BENIN_COMMUNE.json et BENIN_DEPARTEMENT.json.
+
+Les polygones d'une couche sont rangés dans un R-tree statique de leurs
+boîtes englobantes ; chaque lot de sites y est localisé d'un bloc : le
+R-tree réduit chaque polygone aux points de sa boîte, puis le test du rayon
+(règle pair-impair) est calculé par NumPy sur tous ces points à la fois.
+Les noms sont comparés après normalisation (voir
+recherche.normaliser_texte), les couches étant en majuscules sans accents.
+"""
+import json
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from .geojson import chemin_couche
+from .models import Site
+from .recherche import normaliser_texte
+
+TAILLE_LOT = 50000
+# Nombre maximal de couples (point, arête) calculés d'un bloc
+TAILLE_BLOC = 2_000_000
+
+# Motifs d'écart
+HORS_BENIN = "hors-benin"
+HORS_COMMUNE = "hors-commune"
+DEPARTEMENT_DIFFERENT = "departement-different"
+COMMUNE_DIFFERENTE = "commune-differente"
+
+CHAMPS_RAPPORT = [
+    "site_id",
+    "site",
+    "latitude",
+    "longitude",
+    "commune_declaree",
+    "departement_declare",
+    "commune_geometrique",
+    "departement_geometrique",
+    "motif",
+]
+
+
+class _Noeud:
+    __slots__ = ("boite", "enfants", "indice")
+
+    def __init__(self, boite, enfants=None, indice=None):
+        self.boite = boite
+        self.enfants = enfants
+        self.indice = indice
+
+
+class ArbreR:
+    """
+    R-tree statique de boîtes englobantes, construit par tri en tuiles
+    (Sort-Tile-Recursive).
+    """
+
+    def __init__(self, boites, capacite=8):
+        """
+        Args:
+            boites (array): Les boîtes (xmin, ymin, xmax, ymax), une par ligne.
+            capacite (int): Le nombre maximal d'enfants par nœud.
+        """
+        niveau = [_Noeud(np.asarray(boite, dtype=float), indice=i) for i, boite in enumerate(boites)]
+        while len(niveau) > capacite:
+            niveau = self._regrouper(niveau, capacite)
+        self.racine = _Noeud(self._englober(niveau), enfants=niveau)
+
+    @staticmethod
+    def _englober(noeuds):
+        boites = np.array([noeud.boite for noeud in noeuds])
+        return np.concatenate([boites[:, :2].min(axis=0), boites[:, 2:].max(axis=0)])
+
+    def _regrouper(self, noeuds, capacite):
+        """Regroupe un niveau en tranches verticales, puis en tuiles."""
+        nombre_tranches = math.ceil(math.sqrt(math.ceil(len(noeuds) / capacite)))
+        par_tranche = nombre_tranches * capacite
+        noeuds = sorted(noeuds, key=lambda n: n.boite[0] + n.boite[2])
+        parents = []
+        for debut in range(0, len(noeuds), par_tranche):
+            tranche = sorted(noeuds[debut : debut + par_tranche], key=lambda n: n.boite[1] + n.boite[3])
+            for i in range(0, len(tranche), capacite):
+                enfants = tranche[i : i + capacite]
+                parents.append(_Noeud(self._englober(enfants), enfants=enfants))
+        return parents
+
+    def candidats(self, x, y):
+        """
+        Parcourt les boîtes contenant des points.
+
+        Args:
+            x, y (array): Les coordonnées des points.
+
+        Yields:
+            tuple: L'indice d'une boîte et les positions des points qu'elle
+            contient.
+        """
+        pile = [(self.racine, np.arange(len(x)))]
+        while pile:
+            noeud, positions = pile.pop()
+            xmin, ymin, xmax, ymax = noeud.boite
+            px, py = x[positions], y[positions]
+            positions = positions[(px >= xmin) & (px <= xmax) & (py >= ymin) & (py <= ymax)]
+            if not len(positions):
+                continue
+            if noeud.indice is not None:
+                yield noeud.indice, positions
+            else:
+                pile.extend((enfant, positions) for enfant in noeud.enfants)
+
+
+def points_dans_polygone(x, y, anneaux):
+    """
+    Teste l'appartenance de points à un polygone par lancer de rayon.
+
+    Les traversées sont comptées sur tous les anneaux à la fois : un point
+    dans un trou traverse un anneau de plus et se retrouve dehors.
+
+    Args:
+        x, y (array): Les coordonnées des points.
+        anneaux (list): Les anneaux du polygone, tableaux (n, 2) fermés.
+
+    Returns:
+        array: Le masque des points dans le polygone.
+    """
+    aretes = np.concatenate([np.hstack([a[:-1], a[1:]]) for a in anneaux])
+    x1, y1, x2, y2 = (aretes[:, i] for i in range(4))
+    dedans = np.zeros(len(x), dtype=bool)
+    bloc = max(1, TAILLE_BLOC // len(aretes))
+    for debut in range(0, len(x), bloc):
+        px = x[debut : debut + bloc, None]
+        py = y[debut : debut + bloc, None]
+        traverse = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_intersection = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        traversees = np.count_nonzero(traverse & (px < x_intersection), axis=1)
+        dedans[debut : debut + bloc] = traversees % 2 == 1
+    return dedans
+
+
+def _anneaux(geometrie):
+    """Retourne les anneaux fermés d'un Polygon ou d'un MultiPolygon."""
+    if geometrie["type"] == "Polygon":
+        polygones = [geometrie["coordinates"]]
+    elif geometrie["type"] == "MultiPolygon":
+        polygones = geometrie["coordinates"]
+    else:
+        return []
+    anneaux = []
+    for polygone in polygones:
+        for anneau in polygone:
+            anneau = np.asarray(anneau, dtype=float)[:, :2]
+            if not np.array_equal(anneau[0], anneau[-1]):
+                anneau = np.vstack([anneau, anneau[:1]])
+            anneaux.append(anneau)
+    return anneaux
+
+
+@dataclass
+class Zone:
+    nom: str
+    anneaux: list
+
+
+class Couche:
+    """Les polygones d'une couche GeoJSON, indexés par un R-tree."""
+
+    def __init__(self, nom_couche, propriete_nom="NOM"):
+        chemin = chemin_couche(nom_couche)
+        if chemin is None:
+            raise FileNotFoundError(f"Couche GeoJSON introuvable : {nom_couche}")
+        with open(chemin, "r", encoding="utf-8") as fichier:
+            donnees = json.load(fichier)
+
+        self.zones = []
+        for feature in donnees.get("features", []):
+            anneaux = _anneaux(feature.get("geometry") or {"type": None})
+            if anneaux:
+                nom = (feature.get("properties") or {}).get(propriete_nom) or ""
+                self.zones.append(Zone(nom, anneaux))
+        boites = [
+            np.concatenate([np.vstack(z.anneaux).min(axis=0), np.vstack(z.anneaux).max(axis=0)])
+            for z in self.zones
+        ]
+        self.arbre = ArbreR(boites)
+        # Noms normalisés, suivis de "" : l'indice -1 (aucune zone) y renvoie
+        self.noms = np.array([z.nom for z in self.zones] + [""], dtype=object)
+        self.noms_normalises = np.array(
+            [normaliser_texte(z.nom) for z in self.zones] + [""], dtype=object
+        )
+
+    def localiser(self, x, y):
+        """
+        Retourne, pour chaque point, l'indice de la zone qui le contient, ou
+        -1. Un point de plusieurs zones (chevauchement) reçoit la première.
+        """
+        resultat = np.full(len(x), -1)
+        for indice, positions in self.arbre.candidats(x, y):
+            positions = positions[resultat[positions] < 0]
+            if len(positions):
+                dedans = points_dans_polygone(x[positions], y[positions], self.zones[indice].anneaux)
+                resultat[positions[dedans]] = indice
+        return resultat
+
+
+def _lots(iterable, taille):
+    lot = []
+    for element in iterable:
+        lot.append(element)
+        if len(lot) >= taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+def auditer_sites(sites=None, taille_lot=TAILLE_LOT, compteurs=None):
+    """
+    Compare la commune et le département déclarés des sites à ceux qui
+    contiennent leurs coordonnées.
+
+    Args:
+        sites (QuerySet): Les sites à auditer (tous par défaut). Les sites
+            sans coordonnées sont ignorés.
+        taille_lot (int): Le nombre de sites localisés d'un bloc.
+        compteurs (dict): Complété avec le nombre de sites audités
+            (``audites``) et le nombre d'écarts par motif.
+
+    Yields:
+        dict: Un écart, avec les champs de CHAMPS_RAPPORT.
+    """
+    communes = Couche("BENIN_COMMUNE")
+    departements = Couche("BENIN_DEPARTEMENT")
+    compteurs = {} if compteurs is None else compteurs
+    compteurs.setdefault("audites", 0)
+    normalises = {}
+
+    def normaliser(valeurs):
+        for valeur in set(valeurs) - normalises.keys():
+            normalises[valeur] = normaliser_texte(valeur)
+        return np.array([normalises[v] for v in valeurs], dtype=object)
+
+    lignes = (
+        (Site.objects.all() if sites is None else sites)
+        .filter(latitude__isnull=False, longitude__isnull=False)
+        .order_by("id")
+        .values_list(
+            "id",
+            "nom",
+            "latitude",
+            "longitude",
+            "localite__commune__nom",
+            "localite__commune__departement__nom",
+        )
+    )
+    for lot in _lots(lignes.iterator(chunk_size=taille_lot), taille_lot):
+        ids, noms, latitudes, longitudes, communes_declarees, departements_declares = zip(*lot)
+        y = np.array(latitudes, dtype=float)
+        x = np.array(longitudes, dtype=float)
+        commune = communes.localiser(x, y)
+        departement = departements.localiser(x, y)
+
+        motifs = np.full(len(lot), None, dtype=object)
+        motifs[normaliser(communes_declarees) != communes.noms_normalises[commune]] = COMMUNE_DIFFERENTE
+        motifs[
+            normaliser(departements_declares) != departements.noms_normalises[departement]
+        ] = DEPARTEMENT_DIFFERENT
+        motifs[commune < 0] = HORS_COMMUNE
+        motifs[(commune < 0) & (departement < 0)] = HORS_BENIN
+
+        compteurs["audites"] += len(lot)
+        for i in np.flatnonzero(motifs != None):  # noqa: E711 (comparaison élément par élément)
+            compteurs[motifs[i]] = compteurs.get(motifs[i], 0) + 1
+            yield {
+                "site_id": ids[i],
+                "site": noms[i],
+                "latitude": latitudes[i],
+                "longitude": longitudes[i],
+                "commune_declaree": communes_declarees[i] or "",
+                "departement_declare": departements_declares[i] or "",
+                "commune_geometrique": communes.noms[commune[i]],
+                "departement_geometrique": departements.noms[departement[i]],
+                "motif": motifs[i],
+            }
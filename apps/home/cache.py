@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+"""
+Version des données des sites, partagée entre les processus via le cache Django.
+
+Les résultats calculés à partir des sites (clusters de la carte, statistiques,
+etc.) sont mis en cache sous une clé qui inclut cette version. Toute
+modification d'un site ou de ses données liées change la version, ce qui
+rend obsolètes toutes les entrées précédentes sans avoir à les énumérer.
+
+Une seconde version, celle des positions, ne change que quand les
+coordonnées, les opérateurs ou les technologies des sites changent : les
+données qui n'en dépendent que (index de proximité) survivent aux autres
+écritures (conformité, description, photo...).
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+CLE_VERSION_SITES = "home:sites:version"
+CLE_VERSION_POSITIONS = "home:sites:positions"
+
+
+def _version(cle):
+    version = cache.get(cle)
+    if version is None:
+        cache.add(cle, time.time_ns(), None)
+        version = cache.get(cle)
+    return version
+
+
+def version_sites():
+    """Retourne la version courante des données des sites."""
+    return _version(CLE_VERSION_SITES)
+
+
+def invalider_sites():
+    """Change la version des données des sites (après une écriture)."""
+    cache.set(CLE_VERSION_SITES, time.time_ns(), None)
+
+
+def version_positions():
+    """Retourne la version courante des positions des sites (voir le module)."""
+    return _version(CLE_VERSION_POSITIONS)
+
+
+def invalider_positions():
+    """
+    Change la version des positions des sites (après une écriture de
+    coordonnées, d'opérateur ou de technologies).
+    """
+    cache.set(CLE_VERSION_POSITIONS, time.time_ns(), None)
+
+
+def cle_cache(prefixe, **parametres):
+    """
+    Construit une clé de cache liée à la version courante des sites.
+
+    Args:
+        prefixe (str): Le nom du résultat mis en cache.
+        **parametres: Les paramètres (normalisés) dont dépend le résultat.
+
+    Returns:
+        str: La clé de cache.
+    """
+    empreinte = hashlib.sha1(
+        json.dumps(parametres, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"home:{prefixe}:{version_sites()}:{empreinte}"
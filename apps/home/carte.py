@@ -0,0 +1,182 @@
+# -*- encoding: utf-8 -*-
+"""
+Formats compacts des sites de la carte (``map_view``, paramètre ``format``).
+
+Le format ``objets`` (par défaut) renvoie un objet JSON par site, répétant
+le nom et le logo de l'opérateur et les coordonnées en chaînes décimales.
+Les formats compacts envoient une seule fois les dictionnaires des
+opérateurs et des localités, puis les sites en colonnes parallèles :
+
+- ``ids`` : identifiants des sites ;
+- ``latitudes``, ``longitudes`` : coordonnées quantifiées en entiers 32 bits
+  (degrés × ECHELLE_COORDONNEES, soit ~0,1 m) ;
+- ``operateurs_index`` : rang de l'opérateur dans ``operateurs`` ;
+- ``localites_index`` : rang de la localité dans ``localites``, ou -1 ;
+- ``conformites`` : code de conformité (voir CODES_CONFORMITE) ;
+- ``noms`` : noms des sites.
+
+Le format ``compact`` est ce dictionnaire en JSON. Le format ``binaire``
+(``application/octet-stream``) se lit par des tableaux typés JavaScript :
+
+- un entier non signé de 32 bits : la longueur L de l'en-tête ;
+- l'en-tête, L octets de JSON UTF-8 complétés d'espaces jusqu'à un multiple
+  de 4 : tout sauf les colonnes numériques, plus ``nombre`` (de sites) ;
+- les colonnes, dans l'ordre de COLONNES_BINAIRES, chacune de ``nombre``
+  valeurs du type indiqué.
+
+Tous les entiers sont petit-boutistes, l'ordre natif des navigateurs : le
+client crée ses Int32Array directement sur le tampon reçu. Les colonnes de 4
+octets précèdent les plus courtes, ce qui garde chacune alignée.
+"""
+import json
+import struct
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .models import Operateur
+
+FORMAT_OBJETS = "objets"
+FORMAT_COMPACT = "compact"
+FORMAT_BINAIRE = "binaire"
+FORMATS_CARTE = (FORMAT_OBJETS, FORMAT_COMPACT, FORMAT_BINAIRE)
+
+ECHELLE_COORDONNEES = 10**6
+
+# Statut de conformité -> code : sans rapport, conforme, non conforme
+CODES_CONFORMITE = {None: 0, True: 1, False: 2}
+
+# Colonne -> type NumPy (petit-boutiste) ; les types à 4 octets d'abord
+COLONNES_BINAIRES = (
+    ("ids", "<i4"),
+    ("latitudes", "<i4"),
+    ("longitudes", "<i4"),
+    ("localites_index", "<i4"),
+    ("operateurs_index", "<u2"),
+    ("conformites", "u1"),
+)
+
+
+def parse_format_carte(valeur):
+    """
+    Analyse le format de réponse demandé à ``map_view``.
+
+    Raises:
+        ValueError: Si le format est inconnu.
+    """
+    if not valeur:
+        return FORMAT_OBJETS
+    if valeur not in FORMATS_CARTE:
+        raise ValueError(f"Format inconnu : {valeur} (formats : {', '.join(FORMATS_CARTE)})")
+    return valeur
+
+
+def colonnes_sites(sites):
+    """
+    Met des sites en colonnes parallèles, sans instancier de modèles.
+
+    Args:
+        sites (QuerySet): Les sites à afficher ; ceux sans coordonnées sont
+            ignorés.
+
+    Returns:
+        dict: Les dictionnaires ``operateurs`` (id, nom, couleur, logo) et
+        ``localites`` (noms), et les colonnes décrites dans le module, en
+        tableaux NumPy.
+    """
+    lignes = (
+        sites.filter(latitude__isnull=False, longitude__isnull=False)
+        .annotate(lat=Cast("latitude", FloatField()), lon=Cast("longitude", FloatField()))
+        .order_by("id")
+        .values_list(
+            "id",
+            "nom",
+            "lat",
+            "lon",
+            "operateur_id",
+            "localite_id",
+            "localite__localite",
+            "conformite__statut",
+        )
+    )
+    ids, noms, latitudes, longitudes, operateurs, localites, noms_localites, statuts = (
+        list(zip(*lignes)) or [()] * 8
+    )
+
+    rangs_operateurs = {}
+    for operateur_id in operateurs:
+        rangs_operateurs.setdefault(operateur_id, len(rangs_operateurs))
+    rangs_localites = {None: -1}
+    dictionnaire_localites = []
+    for localite_id, nom in zip(localites, noms_localites):
+        if localite_id not in rangs_localites:
+            rangs_localites[localite_id] = len(dictionnaire_localites)
+            dictionnaire_localites.append(nom)
+
+    details = {
+        operateur.pk: operateur for operateur in Operateur.objects.filter(pk__in=rangs_operateurs)
+    }
+    dictionnaire_operateurs = []
+    for operateur_id in rangs_operateurs:
+        operateur = details[operateur_id]
+        logo = operateur.logo_marqueur
+        dictionnaire_operateurs.append(
+            {
+                "id": operateur.pk,
+                "nom": operateur.nom,
+                "couleur": operateur.couleur,
+                "logo": logo["webp"] or logo["jpeg"],
+            }
+        )
+
+    return {
+        "operateurs": dictionnaire_operateurs,
+        "localites": dictionnaire_localites,
+        "noms": list(noms),
+        "ids": np.array(ids, dtype=np.int32),
+        "latitudes": np.rint(np.array(latitudes, dtype=float) * ECHELLE_COORDONNEES).astype(np.int32),
+        "longitudes": np.rint(np.array(longitudes, dtype=float) * ECHELLE_COORDONNEES).astype(np.int32),
+        "operateurs_index": np.array([rangs_operateurs[o] for o in operateurs], dtype=np.uint16),
+        "localites_index": np.array([rangs_localites[l] for l in localites], dtype=np.int32),
+        "conformites": np.array([CODES_CONFORMITE[s] for s in statuts], dtype=np.uint8),
+    }
+
+
+def _entete(colonnes, zoom):
+    return {
+        "mode": "sites",
+        "zoom": zoom,
+        "echelle": ECHELLE_COORDONNEES,
+        "operateurs": colonnes["operateurs"],
+        "localites": colonnes["localites"],
+        "noms": colonnes["noms"],
+    }
+
+
+def donnees_compactes(colonnes, zoom):
+    """Retourne la réponse au format ``compact`` : l'en-tête et les colonnes en listes."""
+    donnees = _entete(colonnes, zoom)
+    donnees["format"] = FORMAT_COMPACT
+    for nom, _ in COLONNES_BINAIRES:
+        donnees[nom] = colonnes[nom].tolist()
+    return donnees
+
+
+def encoder_binaire(colonnes, zoom):
+    """
+    Encode les colonnes au format ``binaire`` (voir la description du module).
+
+    Returns:
+        bytes: Le tampon à servir en ``application/octet-stream``.
+    """
+    entete = _entete(colonnes, zoom)
+    entete["format"] = FORMAT_BINAIRE
+    entete["nombre"] = len(colonnes["ids"])
+    entete = json.dumps(entete, cls=DjangoJSONEncoder, separators=(",", ":")).encode("utf-8")
+    # Espaces de fin (valides en JSON) : les colonnes commencent alignées
+    entete += b" " * (-len(entete) % 4)
+    parties = [struct.pack("<I", len(entete)), entete]
+    parties.extend(colonnes[nom].astype(type_, copy=False).tobytes() for nom, type_ in COLONNES_BINAIRES)
+    return b"".join(parties)
@@ -4,4 +4,9 @@ from django.apps import AppConfig
 
 class MyConfig(AppConfig):
     name = 'apps.home'
-    label = 'apps_home'
+    # Libellé historique utilisé par les migrations existantes
+    label = 'home'
+
+    def ready(self):
+        # Branche les signaux d'invalidation des caches
+        from . import signals  # noqa: F401
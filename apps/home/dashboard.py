@@ -0,0 +1,111 @@
+# -*- encoding: utf-8 -*-
+"""
+Agrégats du tableau de bord (vue index).
+
+Tous les chiffres sont calculés en un nombre constant de requêtes, quel que
+soit le nombre d'opérateurs ou de sites, puis mis en cache jusqu'à la
+prochaine modification des données des sites.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+from .cache import cle_cache
+from .models import Operateur, Site
+
+
+@dataclass
+class InstantaneTableauDeBord:
+    """Chiffres du tableau de bord à un instant donné."""
+
+    annee: int
+    total_sites: int = 0
+    total_conformes: int = 0
+    total_non_conformes: int = 0
+    nouveaux_sites_par_mois: dict = field(default_factory=dict)
+    operateurs: list = field(default_factory=list)
+
+    @property
+    def nouveaux_sites(self):
+        return sum(self.nouveaux_sites_par_mois.values())
+
+    @property
+    def pourcentage_conformite(self):
+        if self.total_sites == 0:
+            return 0
+        return (self.total_conformes / self.total_sites) * 100
+
+    def contexte(self):
+        """Retourne les variables attendues par le template home/index.html."""
+        return {
+            "total_sites": self.total_sites,
+            "new_sites_count": self.nouveaux_sites,
+            "compliance_percentage": self.pourcentage_conformite,
+            "non_compliant_sites_count": self.total_non_conformes,
+            "operator_statistics_labels": [op["nom"] for op in self.operateurs],
+            "operator_statistics_counts": [op["total"] for op in self.operateurs],
+            "operator_statistics_non_conform_counts": [
+                op["non_conformes"] for op in self.operateurs
+            ],
+            "operator_statistics_colors": [op["couleur"] for op in self.operateurs],
+            "new_sites_per_month": self.nouveaux_sites_par_mois,
+        }
+
+
+def calculer_instantane(annee=None):
+    """
+    Calcule les chiffres du tableau de bord en trois requêtes.
+
+    Args:
+        annee (int): L'année des nouveaux sites (par défaut l'année en cours).
+
+    Returns:
+        InstantaneTableauDeBord: Les chiffres calculés.
+    """
+    annee = annee or datetime.now().year
+    instantane = InstantaneTableauDeBord(annee=annee)
+
+    # Totaux globaux par agrégation conditionnelle
+    totaux = Site.objects.aggregate(
+        total=Count("id"),
+        conformes=Count("id", filter=Q(conformite__statut=True)),
+        non_conformes=Count("id", filter=Q(conformite__statut=False)),
+    )
+    instantane.total_sites = totaux["total"]
+    instantane.total_conformes = totaux["conformes"]
+    instantane.total_non_conformes = totaux["non_conformes"]
+
+    # Nombre de sites et de sites non conformes par opérateur
+    instantane.operateurs = list(
+        Operateur.objects.annotate(
+            total=Count("site"),
+            non_conformes=Count("site", filter=Q(site__conformite__statut=False)),
+        ).values("nom", "couleur", "total", "non_conformes")
+    )
+
+    # Nouveaux sites autorisés dans l'année, par mois
+    par_mois = {mois: 0 for mois in range(1, 13)}
+    lignes = (
+        Site.objects.filter(date_autorisation__year=annee)
+        .annotate(mois=TruncMonth("date_autorisation"))
+        .values("mois")
+        .annotate(nombre=Count("id"))
+        .order_by()
+    )
+    for ligne in lignes:
+        par_mois[ligne["mois"].month] += ligne["nombre"]
+    instantane.nouveaux_sites_par_mois = par_mois
+
+    return instantane
+
+
+def obtenir_instantane(annee=None):
+    """Retourne l'instantané du tableau de bord, depuis le cache si possible."""
+    annee = annee or datetime.now().year
+    return cache.get_or_set(
+        cle_cache("tableau_de_bord", annee=annee),
+        lambda: calculer_instantane(annee),
+    )
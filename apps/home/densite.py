@@ -0,0 +1,237 @@
+# -*- encoding: utf-8 -*-
+"""
+Grille de densité des sites, pour la carte de chaleur.
+
+Le Bénin est découpé en une grille fixe de PAS_DENSITE degrés ; la table
+DensiteSite compte les sites de chaque cellule, avec une couche par
+opérateur et une couche par technologie (via SiteTechnologie). La couche de
+tous les sites est la somme des couches des opérateurs.
+
+La table est reconstruite d'un bloc par reconstruire_densites() (histogramme
+NumPy des cellules, aussi disponible via la commande
+``reconstruire_densites``), puis tenue à jour de façon incrémentale par les
+signaux de Site et SiteTechnologie (voir signals.py) : chaque écriture
+retire le site de ses anciennes cellules et l'ajoute aux nouvelles. Les
+écritures en masse contournent les signaux et doivent être suivies d'une
+reconstruction.
+"""
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import DensiteSite, Site, SiteTechnologie
+
+# Emprise de la grille (degrés), un peu plus large que le Bénin
+SUD, OUEST, NORD, EST = 6.0, 0.6, 12.5, 4.0
+# Pas de la grille en degrés (~2,2 km)
+PAS_DENSITE = 0.02
+NB_LIGNES_DENSITE = int(round((NORD - SUD) / PAS_DENSITE))
+NB_COLONNES_DENSITE = int(round((EST - OUEST) / PAS_DENSITE))
+NB_CELLULES = NB_LIGNES_DENSITE * NB_COLONNES_DENSITE
+
+
+def cellules_densite(latitudes, longitudes):
+    """
+    Calcule les cellules de la grille de densité de points.
+
+    Args:
+        latitudes, longitudes (array): Les coordonnées en degrés.
+
+    Returns:
+        array: Le numéro de cellule de chaque point, ou -1 hors de la grille.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    lignes = np.floor((latitudes - SUD) / PAS_DENSITE)
+    colonnes = np.floor((longitudes - OUEST) / PAS_DENSITE)
+    dedans = (
+        (lignes >= 0)
+        & (lignes < NB_LIGNES_DENSITE)
+        & (colonnes >= 0)
+        & (colonnes < NB_COLONNES_DENSITE)
+    )
+    cellules = np.where(dedans, lignes * NB_COLONNES_DENSITE + colonnes, -1)
+    return cellules.astype(np.int64)
+
+
+def cellule_densite(lat, lon):
+    """Retourne la cellule de densité d'un point, ou None (hors grille, coordonnée manquante)."""
+    if lat is None or lon is None:
+        return None
+    cellule = int(cellules_densite([lat], [lon])[0])
+    return cellule if cellule >= 0 else None
+
+
+def cles_site(site_id):
+    """
+    Retourne les clés de densité d'un site, lues en base.
+
+    Returns:
+        list: Les clés (operateur_id, technologie_id, cellule) : une pour son
+        opérateur et une par technologie. Vide si le site n'existe pas ou
+        n'est pas dans la grille.
+    """
+    ligne = Site.objects.filter(pk=site_id).values_list("operateur_id", "latitude", "longitude").first()
+    if ligne is None:
+        return []
+    operateur_id, latitude, longitude = ligne
+    cellule = cellule_densite(latitude, longitude)
+    if cellule is None:
+        return []
+    technologies = SiteTechnologie.objects.filter(site_id=site_id).values_list("technologie_id", flat=True)
+    return [(operateur_id, None, cellule)] + [(None, t, cellule) for t in technologies]
+
+
+def cles_technologies(liens):
+    """
+    Retourne les clés de densité de liens entre sites et technologies.
+
+    Args:
+        liens (iterable): Des couples (site_id, technologie_id).
+    """
+    liens = list(liens)
+    coordonnees = Site.objects.filter(pk__in={site_id for site_id, _ in liens}).values_list(
+        "id", "latitude", "longitude"
+    )
+    cellules = {site_id: cellule_densite(lat, lon) for site_id, lat, lon in coordonnees}
+    return [
+        (None, technologie_id, cellules[site_id])
+        for site_id, technologie_id in liens
+        if cellules.get(site_id) is not None
+    ]
+
+
+def appliquer_deltas(cles, delta):
+    """
+    Ajoute ``delta`` aux compteurs des lignes correspondant à ``cles`` ; les
+    lignes ramenées à zéro sont supprimées.
+    """
+    for (operateur_id, technologie_id, cellule), nombre in Counter(cles).items():
+        filtres = {"operateur_id": operateur_id, "technologie_id": technologie_id, "cellule": cellule}
+        ligne = DensiteSite.objects.filter(**filtres).values_list("pk", flat=True).first()
+        if ligne is not None:
+            DensiteSite.objects.filter(pk=ligne).update(nombre=F("nombre") + delta * nombre)
+            DensiteSite.objects.filter(pk=ligne, nombre=0).delete()
+        # Une ligne absente à décrémenter a été supprimée en cascade avec son
+        # opérateur ou sa technologie : il n'y a rien à retirer.
+        elif delta > 0:
+            DensiteSite.objects.create(nombre=delta * nombre, **filtres)
+
+
+def deplacer_cles(anciennes, nouvelles):
+    """Retire un site de ses anciennes cellules et l'ajoute aux nouvelles."""
+    anciennes, nouvelles = Counter(anciennes), Counter(nouvelles)
+    retirees, ajoutees = anciennes - nouvelles, nouvelles - anciennes
+    if not (retirees or ajoutees):
+        return
+    with transaction.atomic():
+        appliquer_deltas(retirees.elements(), -1)
+        appliquer_deltas(ajoutees.elements(), 1)
+
+
+def _histogramme(couches, cellules):
+    """
+    Compte les points par couche et par cellule.
+
+    Args:
+        couches (array): L'id de couche (opérateur ou technologie) de chaque point.
+        cellules (array): La cellule de chaque point, dans la grille.
+
+    Yields:
+        tuple: (id de couche, cellule, nombre) pour chaque cellule non vide.
+    """
+    for couche in np.unique(couches):
+        nombres = np.bincount(cellules[couches == couche], minlength=NB_CELLULES)
+        for cellule in np.flatnonzero(nombres):
+            yield int(couche), int(cellule), int(nombres[cellule])
+
+
+def reconstruire_densites(modele_site=Site, modele_site_technologie=SiteTechnologie, modele_densite=DensiteSite):
+    """
+    Recalcule entièrement la table de densité à partir des sites.
+
+    Args:
+        modele_site: Le modèle Site (modèle historique dans une migration).
+        modele_site_technologie: Le modèle SiteTechnologie.
+        modele_densite: Le modèle DensiteSite.
+
+    Returns:
+        int: Le nombre de lignes créées.
+    """
+    lignes = (
+        modele_site.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .order_by("id")
+        .values_list("id", "operateur_id", "latitude", "longitude")
+    )
+    colonnes = list(zip(*lignes.iterator(chunk_size=10000))) or [(), (), (), ()]
+    ids = np.array(colonnes[0], dtype=np.int64)
+    operateurs = np.array(colonnes[1], dtype=np.int64)
+    cellules = cellules_densite(colonnes[2], colonnes[3])
+
+    liens = modele_site_technologie.objects.values_list("site_id", "technologie_id")
+    liens = np.array(list(liens.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+    # Cellule du site de chaque lien (ids triés : recherche dichotomique) ;
+    # les liens des sites sans coordonnées restent hors grille
+    cellules_liens = np.full(len(liens), -1, dtype=np.int64)
+    if len(ids):
+        positions = np.minimum(np.searchsorted(ids, liens[:, 0]), len(ids) - 1)
+        cellules_liens = np.where(ids[positions] == liens[:, 0], cellules[positions], -1)
+
+    dedans = cellules >= 0
+    dedans_liens = cellules_liens >= 0
+    densites = [
+        modele_densite(operateur_id=operateur, cellule=cellule, nombre=nombre)
+        for operateur, cellule, nombre in _histogramme(operateurs[dedans], cellules[dedans])
+    ] + [
+        modele_densite(technologie_id=technologie, cellule=cellule, nombre=nombre)
+        for technologie, cellule, nombre in _histogramme(liens[dedans_liens, 1], cellules_liens[dedans_liens])
+    ]
+    with transaction.atomic():
+        modele_densite.objects.all().delete()
+        modele_densite.objects.bulk_create(densites, batch_size=1000)
+    return len(densites)
+
+
+def couche_densite(operateur_id=None, technologie_id=None):
+    """
+    Retourne une couche de la carte de chaleur, sous forme compacte.
+
+    Args:
+        operateur_id (int | None): La couche d'un opérateur.
+        technologie_id (int | None): La couche d'une technologie. Sans l'un
+            ni l'autre, la couche de tous les sites.
+
+    Returns:
+        dict: La grille (``sud``, ``ouest``, ``pas``, ``lignes``,
+        ``colonnes``), les cellules non vides par numéro croissant
+        (ligne * colonnes + colonne) et leurs nombres de sites, et le
+        nombre maximal d'une cellule.
+    """
+    densites = DensiteSite.objects.all()
+    if technologie_id:
+        densites = densites.filter(technologie_id=technologie_id)
+    else:
+        densites = densites.filter(technologie__isnull=True)
+        if operateur_id:
+            densites = densites.filter(operateur_id=operateur_id)
+    lignes = list(
+        densites.values("cellule")
+        .annotate(total=Sum("nombre"))
+        .filter(total__gt=0)
+        .order_by("cellule")
+        .values_list("cellule", "total")
+    )
+    cellules = [cellule for cellule, _ in lignes]
+    nombres = [nombre for _, nombre in lignes]
+    return {
+        "sud": SUD,
+        "ouest": OUEST,
+        "pas": PAS_DENSITE,
+        "lignes": NB_LIGNES_DENSITE,
+        "colonnes": NB_COLONNES_DENSITE,
+        "cellules": cellules,
+        "nombres": nombres,
+        "maximum": max(nombres, default=0),
+    }
@@ -0,0 +1,252 @@
+# -*- encoding: utf-8 -*-
+"""
+Export des sites en CSV, XLSX, GeoJSON et GeoJSON délimité par lignes.
+
+Les sites sont lus par lots (``iterator``) en ne projetant que les colonnes
+exportées : la mémoire utilisée ne dépend pas du nombre de sites. Le CSV
+est produit au fil de la lecture et peut être envoyé par une
+StreamingHttpResponse ; le XLSX est écrit en mode ``write_only`` d'openpyxl
+dans un fichier temporaire, le format zip ne pouvant être envoyé qu'une
+fois complet.
+
+Les en-têtes sont ceux du fichier d'importation (voir
+utils.normalize_column_name et utils.SITE_COLUMNS) : un export peut être
+réimporté tel quel.
+
+Le flux GeoJSON (FeatureCollection ou une entité par ligne, pour QGIS) est
+lui aussi produit au fil de la lecture, avec les propriétés demandées.
+"""
+import csv
+import json
+import tempfile
+
+import openpyxl
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .models import StatistiqueSite
+from .statistiques import annoter_etat
+
+TAILLE_LOT = 2000
+
+# (en-tête, champ projeté)
+COLONNES_EXPORT = [
+    ("ID du site", "nom"),
+    ("Département", "localite__commune__departement__nom"),
+    ("Communes", "localite__commune__nom"),
+    ("Localité", "localite__localite"),
+    ("Emplacement", "emplacement__type_emplacement"),
+    ("Opérateur", "operateur__nom"),
+    ("Latitude du candidat", "latitude"),
+    ("Longitude du candidat", "longitude"),
+    ("Date autorisation", "date_autorisation"),
+    ("Date mise en service", "date_mise_en_service"),
+    ("Camouflage", "camouflage"),
+    ("Type pylône", "type_pylone"),
+    ("Hauteur antenne", "hauteur_antenne"),
+    ("Propriétaire site", "proprietaire"),
+    ("N° dossier", "num_dossier"),
+    ("Réf courrier", "ref_courrier"),
+    ("Description", "description"),
+    ("Observations", "observation"),
+    ("Avis de l'ARCEP Bénin", "avis_arcep"),
+    ("Conformité", "etat"),
+]
+
+ENTETES = [entete for entete, _ in COLONNES_EXPORT]
+LIBELLES_ETAT = dict(StatistiqueSite.ETAT_CHOICES)
+POSITION_CAMOUFLAGE = ENTETES.index("Camouflage")
+POSITION_ETAT = ENTETES.index("Conformité")
+
+
+# Propriétés proposées par le flux GeoJSON : nom -> champ projeté
+PROPRIETES_FLUX = {
+    "nom": "nom",
+    "operateur": "operateur__nom",
+    "departement": "localite__commune__departement__nom",
+    "commune": "localite__commune__nom",
+    "localite": "localite__localite",
+    "emplacement": "emplacement__type_emplacement",
+    "conformite": "etat",
+    "date_autorisation": "date_autorisation",
+    "date_mise_en_service": "date_mise_en_service",
+    "camouflage": "camouflage",
+    "type_pylone": "type_pylone",
+    "hauteur_antenne": "hauteur_antenne",
+    "proprietaire": "proprietaire",
+    "num_dossier": "num_dossier",
+    "description": "description",
+}
+PROPRIETES_DEFAUT = ["nom", "operateur", "departement", "commune", "localite", "conformite"]
+
+
+def parcourir(sites, champs):
+    """
+    Parcourt les sites par lots de TAILLE_LOT, dans l'ordre des ids.
+
+    Args:
+        sites (QuerySet): Les sites (voir utils.get_filtered_sites).
+        champs (iterable): Les champs projetés ; ``etat`` est l'état de
+            conformité (voir statistiques.annoter_etat).
+
+    Yields:
+        tuple: Les valeurs des champs d'un site.
+    """
+    lignes = annoter_etat(sites.select_related(None)).order_by("id").values_list(*champs)
+    return lignes.iterator(chunk_size=TAILLE_LOT)
+
+
+def lignes_export(sites):
+    """
+    Parcourt les sites par lots, projetés sur les colonnes exportées.
+
+    Args:
+        sites (QuerySet): Les sites à exporter (voir utils.get_filtered_sites).
+
+    Yields:
+        list: Les valeurs d'un site, dans l'ordre de COLONNES_EXPORT.
+    """
+    for ligne in parcourir(sites, (champ for _, champ in COLONNES_EXPORT)):
+        ligne = list(ligne)
+        ligne[POSITION_CAMOUFLAGE] = "Oui" if ligne[POSITION_CAMOUFLAGE] else "Non"
+        ligne[POSITION_ETAT] = LIBELLES_ETAT.get(ligne[POSITION_ETAT], "")
+        yield ligne
+
+
+class _Tampon:
+    """Pseudo-fichier renvoyant ce que csv.writer y écrit."""
+
+    def write(self, valeur):
+        return valeur
+
+
+def flux_csv(sites, separateur=";"):
+    """
+    Produit l'export CSV des sites, par blocs de TAILLE_LOT lignes.
+
+    Le fichier commence par un BOM UTF-8 pour qu'Excel en reconnaisse
+    l'encodage ; le point-virgule est le séparateur attendu par un Excel
+    français.
+
+    Yields:
+        str: Les blocs du fichier.
+    """
+    ecrivain = csv.writer(_Tampon(), delimiter=separateur)
+    yield "\ufeff" + ecrivain.writerow(ENTETES)
+    bloc = []
+    for ligne in lignes_export(sites):
+        bloc.append(ecrivain.writerow(ligne))
+        if len(bloc) >= TAILLE_LOT:
+            yield "".join(bloc)
+            bloc = []
+    if bloc:
+        yield "".join(bloc)
+
+
+def fichier_xlsx(sites):
+    """
+    Écrit l'export XLSX des sites dans un fichier temporaire.
+
+    Returns:
+        file: Le fichier temporaire, rembobiné ; il est supprimé à sa
+        fermeture.
+    """
+    classeur = openpyxl.Workbook(write_only=True)
+    feuille = classeur.create_sheet("Sites")
+    feuille.append(ENTETES)
+    for ligne in lignes_export(sites):
+        # Caractères de contrôle refusés par le format XLSX
+        feuille.append(
+            [
+                ILLEGAL_CHARACTERS_RE.sub("", valeur) if isinstance(valeur, str) else valeur
+                for valeur in ligne
+            ]
+        )
+    fichier = tempfile.TemporaryFile()
+    classeur.save(fichier)
+    fichier.seek(0)
+    return fichier
+
+
+def parse_proprietes(valeur):
+    """
+    Analyse la liste des propriétés demandées (noms séparés par des virgules).
+
+    Raises:
+        ValueError: Si une propriété est inconnue.
+    """
+    if not valeur:
+        return PROPRIETES_DEFAUT
+    proprietes = [nom.strip() for nom in valeur.split(",") if nom.strip()]
+    inconnues = [nom for nom in proprietes if nom not in PROPRIETES_FLUX]
+    if inconnues:
+        raise ValueError(
+            f"Propriété(s) inconnue(s) : {', '.join(inconnues)} "
+            f"(disponibles : {', '.join(PROPRIETES_FLUX)})"
+        )
+    return proprietes
+
+
+def entites_geojson(sites, proprietes=PROPRIETES_DEFAUT):
+    """
+    Encode les sites en entités GeoJSON (points), une par une.
+
+    Un site sans coordonnées a une géométrie nulle.
+
+    Yields:
+        str: Une entité GeoJSON encodée en JSON.
+    """
+    champs = ["id", "longitude", "latitude", *(PROPRIETES_FLUX[nom] for nom in proprietes)]
+    conformite = proprietes.index("conformite") if "conformite" in proprietes else None
+    encodeur = json.JSONEncoder(default=str, ensure_ascii=False, separators=(",", ":"))
+    for identifiant, longitude, latitude, *valeurs in parcourir(sites, champs):
+        if conformite is not None:
+            valeurs[conformite] = LIBELLES_ETAT.get(valeurs[conformite], "")
+        geometrie = "null"
+        if longitude is not None and latitude is not None:
+            geometrie = (
+                f'{{"type":"Point","coordinates":[{float(longitude)!r},{float(latitude)!r}]}}'
+            )
+        yield (
+            f'{{"type":"Feature","id":{identifiant},"geometry":{geometrie},'
+            f'"properties":{encodeur.encode(dict(zip(proprietes, valeurs)))}}}'
+        )
+
+
+def flux_geojson(sites, proprietes=PROPRIETES_DEFAUT):
+    """
+    Produit une FeatureCollection GeoJSON des sites, par blocs de TAILLE_LOT
+    entités.
+
+    Yields:
+        str: Les blocs du document.
+    """
+    yield '{"type":"FeatureCollection","features":['
+    bloc = []
+    premier = True
+    for entite in entites_geojson(sites, proprietes):
+        bloc.append(entite)
+        if len(bloc) >= TAILLE_LOT:
+            yield ("" if premier else ",") + ",".join(bloc)
+            premier = False
+            bloc = []
+    if bloc:
+        yield ("" if premier else ",") + ",".join(bloc)
+    yield "]}"
+
+
+def flux_ndjson(sites, proprietes=PROPRIETES_DEFAUT):
+    """
+    Produit les entités GeoJSON des sites, une par ligne (GeoJSON délimité
+    par lignes), par blocs de TAILLE_LOT entités.
+
+    Yields:
+        str: Les blocs du document.
+    """
+    bloc = []
+    for entite in entites_geojson(sites, proprietes):
+        bloc.append(entite + "\n")
+        if len(bloc) >= TAILLE_LOT:
+            yield "".join(bloc)
+            bloc = []
+    if bloc:
+        yield "".join(bloc)
@@ -0,0 +1,486 @@
+# -*- encoding: utf-8 -*-
+"""
+Service des contours administratifs du Bénin (fichiers de apps/static/geojson).
+
+Les fichiers d'origine sont en pleine résolution (plusieurs centaines de Ko
+par département). Pour chaque niveau de zoom de la carte, on sert une version
+simplifiée par l'algorithme de Douglas-Peucker, avec des coordonnées
+arrondies à la précision utile à ce zoom. La simplification préserve la
+topologie : une frontière commune à deux polygones n'est simplifiée qu'une
+fois (voir Topologie), les voisins restent jointifs. Chaque version est calculée une
+seule fois par processus puis gardée en mémoire, déjà encodée en JSON et
+compressée en gzip et en brotli (le module brotli est dans requirements.txt ;
+sans lui, seul gzip est proposé).
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Dépendance optionnelle : sans elle, seul gzip est proposé
+    brotli = None
+
+GEOJSON_DIR = os.path.join(settings.BASE_DIR, "apps", "static", "geojson")
+EXTENSIONS_GEOJSON = (".geojson", ".json")
+
+# Niveaux de simplification : (zoom maximal, tolérance en degrés, décimales)
+# Une tolérance de 0,01° (~1 km) reste invisible à l'échelle du pays.
+NIVEAUX_SIMPLIFICATION = [
+    (7, 0.01, 3),
+    (9, 0.003, 4),
+    (11, 0.001, 4),
+    (13, 0.0003, 5),
+    (None, 0.0, 6),
+]
+
+_verrou = threading.Lock()
+# (chemin, mtime) -> données GeoJSON analysées
+_sources = {}
+# (chemin, niveau) -> (mtime, ActifGeoJSON)
+_actifs = {}
+
+
+def niveau_pour_zoom(zoom):
+    """Retourne l'indice du niveau de simplification adapté au zoom."""
+    if zoom is None:
+        return 0
+    for indice, (zoom_max, _tolerance, _decimales) in enumerate(NIVEAUX_SIMPLIFICATION):
+        if zoom_max is None or zoom <= zoom_max:
+            return indice
+    return len(NIVEAUX_SIMPLIFICATION) - 1
+
+
+def chemin_couche(nom):
+    """
+    Retourne le chemin du fichier GeoJSON correspondant à un nom de couche.
+
+    Seuls les fichiers présents dans GEOJSON_DIR sont acceptés, ce qui exclut
+    toute tentative de sortie du répertoire.
+
+    Args:
+        nom (str): Le nom de la couche (ex. "ATACORA", "BENIN_COMMUNE").
+
+    Returns:
+        str or None: Le chemin du fichier, ou None si la couche n'existe pas.
+    """
+    nom = (nom or "").upper()
+    for extension in EXTENSIONS_GEOJSON:
+        fichier = f"{nom}{extension}"
+        if fichier in os.listdir(GEOJSON_DIR):
+            return os.path.join(GEOJSON_DIR, fichier)
+    return None
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Simplifie une polyligne par l'algorithme de Douglas-Peucker.
+
+    Args:
+        points (ndarray): Tableau (N, 2) des coordonnées.
+        tolerance (float): Écart maximal toléré, en degrés.
+
+    Returns:
+        ndarray: Masque booléen des points conservés.
+    """
+    nb_points = len(points)
+    garder = np.zeros(nb_points, dtype=bool)
+    garder[0] = garder[-1] = True
+    if nb_points < 3:
+        garder[:] = True
+        return garder
+
+    pile = [(0, nb_points - 1)]
+    while pile:
+        debut, fin = pile.pop()
+        if fin - debut < 2:
+            continue
+        segment = points[fin] - points[debut]
+        interieurs = points[debut + 1 : fin] - points[debut]
+        longueur = np.hypot(segment[0], segment[1])
+        if longueur == 0:
+            distances = np.hypot(interieurs[:, 0], interieurs[:, 1])
+        else:
+            distances = (
+                np.abs(segment[0] * interieurs[:, 1] - segment[1] * interieurs[:, 0])
+                / longueur
+            )
+        indice = int(np.argmax(distances))
+        if distances[indice] > tolerance:
+            milieu = debut + 1 + indice
+            garder[milieu] = True
+            pile.append((debut, milieu))
+            pile.append((milieu, fin))
+    return garder
+
+
+class Topologie:
+    """
+    Arcs des anneaux d'une collection, simplifiés une seule fois chacun.
+
+    Un sommet où se rejoignent ou se séparent des anneaux (plus de deux
+    sommets voisins distincts, tous anneaux confondus) est un nœud. Les
+    anneaux sont découpés en arcs entre nœuds : une frontière commune à deux
+    polygones est le même arc, parcouru dans un sens ou dans l'autre, et
+    chaque arc est simplifié une fois, dans un sens canonique, avec ses
+    extrémités fixes. Les deux polygones gardent ainsi les mêmes sommets le
+    long de leur frontière.
+    """
+
+    def __init__(self, anneaux, tolerance):
+        """
+        Args:
+            anneaux (iterable): Les anneaux (listes de coordonnées, fermés) de
+                la collection.
+            tolerance (float): Tolérance de Douglas-Peucker, en degrés.
+        """
+        self.tolerance = tolerance
+        voisins = {}
+        for anneau in anneaux:
+            points = self._points(anneau)
+            for indice, point in enumerate(points):
+                voisins.setdefault(point, set()).update(
+                    (points[indice - 1], points[(indice + 1) % len(points)])
+                )
+        self.noeuds = {point for point, autour in voisins.items() if len(autour) > 2}
+        # Arc canonique -> masque des points conservés
+        self._arcs = {}
+
+    @staticmethod
+    def _points(anneau):
+        """Les sommets d'un anneau, sans le point de fermeture."""
+        points = [(float(p[0]), float(p[1])) for p in anneau]
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        return points
+
+    def _simplifier_arc(self, arc):
+        inverse = arc[::-1]
+        canonique = min(arc, inverse)
+        garder = self._arcs.get(canonique)
+        if garder is None:
+            garder = douglas_peucker(np.array(canonique), self.tolerance)
+            self._arcs[canonique] = garder
+        if canonique is inverse:
+            garder = garder[::-1]
+        return [point for point, garde in zip(arc, garder) if garde]
+
+    def simplifier(self, anneau):
+        """
+        Simplifie un anneau de la collection.
+
+        Returns:
+            ndarray: Les points (N, 2) de l'anneau simplifié, fermé.
+        """
+        points = self._points(anneau)
+        if len(points) < 3:
+            return np.asarray(anneau, dtype=float)[:, :2]
+        coupures = [indice for indice, point in enumerate(points) if point in self.noeuds]
+        if not coupures:
+            # Anneau sans voisin, ou identique à un autre (enclave) : il
+            # commence à son plus petit sommet, le même pour les deux
+            coupures = [points.index(min(points))]
+        debut = coupures[0]
+        points = points[debut:] + points[:debut]
+        coupures = [indice - debut for indice in coupures] + [len(points)]
+        points.append(points[0])
+
+        resultat = [points[0]]
+        for premier, dernier in zip(coupures, coupures[1:]):
+            resultat.extend(self._simplifier_arc(tuple(points[premier : dernier + 1]))[1:])
+        return np.array(resultat)
+
+
+def anneaux_collection(donnees):
+    """Les anneaux de tous les polygones d'une FeatureCollection GeoJSON."""
+    geometries = [feature.get("geometry") for feature in donnees.get("features", [])]
+    while geometries:
+        geometrie = geometries.pop()
+        if not geometrie:
+            continue
+        if geometrie["type"] == "GeometryCollection":
+            geometries.extend(geometrie["geometries"])
+        elif geometrie["type"] == "Polygon":
+            yield from geometrie["coordinates"]
+        elif geometrie["type"] == "MultiPolygon":
+            for polygone in geometrie["coordinates"]:
+                yield from polygone
+
+
+def simplifier_anneau(anneau, tolerance, decimales, topologie=None):
+    """
+    Simplifie et arrondit un anneau de polygone (fermé).
+
+    Args:
+        topologie (Topologie): Les arcs partagés de la collection ; sans
+            elle, l'anneau est simplifié seul.
+
+    Returns:
+        list or None: L'anneau simplifié, ou None s'il devient dégénéré.
+    """
+    points = np.asarray(anneau, dtype=float)[:, :2]
+    if tolerance > 0 and len(points) > 4:
+        if topologie is not None:
+            points = topologie.simplifier(anneau)
+        else:
+            points = points[douglas_peucker(points, tolerance)]
+    points = np.round(points, decimales)
+
+    # Supprime les doublons consécutifs introduits par l'arrondi
+    if len(points) > 1:
+        distincts = np.any(points[1:] != points[:-1], axis=1)
+        points = points[np.concatenate(([True], distincts))]
+    if len(points) < 4:
+        return None
+    return points.tolist()
+
+
+def simplifier_ligne(ligne, tolerance, decimales):
+    points = np.asarray(ligne, dtype=float)[:, :2]
+    if tolerance > 0 and len(points) > 2:
+        points = points[douglas_peucker(points, tolerance)]
+    return np.round(points, decimales).tolist()
+
+
+def simplifier_polygone(anneaux, tolerance, decimales, topologie=None):
+    resultat = []
+    for indice, anneau in enumerate(anneaux):
+        simplifie = simplifier_anneau(anneau, tolerance, decimales, topologie)
+        if simplifie is None:
+            if indice > 0:
+                # Un trou devenu trop petit disparaît
+                continue
+            # L'anneau extérieur est conservé, seulement arrondi
+            simplifie = simplifier_anneau(anneau, 0, decimales) or anneau
+        resultat.append(simplifie)
+    return resultat
+
+
+def simplifier_geometrie(geometrie, tolerance, decimales, topologie=None):
+    """
+    Simplifie une géométrie GeoJSON.
+
+    Args:
+        geometrie (dict): La géométrie GeoJSON.
+        tolerance (float): Tolérance de Douglas-Peucker, en degrés.
+        decimales (int): Nombre de décimales conservées.
+        topologie (Topologie): Les arcs partagés des polygones de la collection.
+
+    Returns:
+        dict: Une nouvelle géométrie simplifiée.
+    """
+    if not geometrie:
+        return geometrie
+
+    type_geometrie = geometrie["type"]
+    coordonnees = geometrie.get("coordinates")
+
+    if type_geometrie == "Point":
+        coordonnees = [round(c, decimales) for c in coordonnees[:2]]
+    elif type_geometrie == "MultiPoint":
+        coordonnees = [[round(c, decimales) for c in p[:2]] for p in coordonnees]
+    elif type_geometrie == "LineString":
+        coordonnees = simplifier_ligne(coordonnees, tolerance, decimales)
+    elif type_geometrie == "MultiLineString":
+        coordonnees = [simplifier_ligne(l, tolerance, decimales) for l in coordonnees]
+    elif type_geometrie == "Polygon":
+        coordonnees = simplifier_polygone(coordonnees, tolerance, decimales, topologie)
+    elif type_geometrie == "MultiPolygon":
+        coordonnees = [
+            simplifier_polygone(p, tolerance, decimales, topologie) for p in coordonnees
+        ]
+    elif type_geometrie == "GeometryCollection":
+        return {
+            "type": type_geometrie,
+            "geometries": [
+                simplifier_geometrie(g, tolerance, decimales, topologie)
+                for g in geometrie["geometries"]
+            ],
+        }
+
+    return {"type": type_geometrie, "coordinates": coordonnees}
+
+
+def simplifier_collection(donnees, niveau):
+    """Applique un niveau de simplification à une FeatureCollection GeoJSON."""
+    _zoom_max, tolerance, decimales = NIVEAUX_SIMPLIFICATION[niveau]
+    topologie = Topologie(anneaux_collection(donnees), tolerance) if tolerance > 0 else None
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": feature.get("properties") or {},
+                "geometry": simplifier_geometrie(
+                    feature.get("geometry"), tolerance, decimales, topologie
+                ),
+            }
+            for feature in donnees.get("features", [])
+        ],
+    }
+
+
+class ActifGeoJSON:
+    """
+    Couche GeoJSON pré-encodée : octets JSON, variantes compressées et ETag.
+
+    Les variantes sont calculées une seule fois ; servir la couche ne coûte
+    ensuite ni analyse, ni encodage, ni compression.
+    """
+
+    __slots__ = ("identite", "gzip", "brotli", "etag")
+
+    def __init__(self, contenu):
+        self.identite = contenu
+        self.gzip = gzip.compress(contenu, compresslevel=9, mtime=0)
+        self.brotli = brotli.compress(contenu) if brotli is not None else None
+        self.etag = hashlib.sha256(contenu).hexdigest()[:32]
+
+    def variante(self, encodages_acceptes):
+        """
+        Choisit la variante à envoyer selon l'en-tête Accept-Encoding.
+
+        Returns:
+            tuple: (contenu, Content-Encoding ou None, ETag de la variante)
+        """
+        if self.brotli is not None and "br" in encodages_acceptes:
+            return self.brotli, "br", f'"{self.etag}-br"'
+        if "gzip" in encodages_acceptes:
+            return self.gzip, "gzip", f'"{self.etag}-gz"'
+        return self.identite, None, f'"{self.etag}"'
+
+
+def encodages_acceptes(en_tete):
+    """Retourne les encodages acceptés (q > 0) d'un en-tête Accept-Encoding."""
+    acceptes = set()
+    for element in (en_tete or "").split(","):
+        nom, _, parametres = element.strip().partition(";")
+        nom = nom.strip().lower()
+        if not nom:
+            continue
+        qualite = 1.0
+        parametres = parametres.strip()
+        if parametres.startswith("q="):
+            try:
+                qualite = float(parametres[2:])
+            except ValueError:
+                qualite = 0.0
+        if qualite > 0:
+            acceptes.add(nom)
+    return acceptes
+
+
+def _charger_source(chemin, mtime):
+    """Analyse un fichier GeoJSON, une seule fois par version du fichier."""
+    cle = (chemin, mtime)
+    donnees = _sources.get(cle)
+    if donnees is None:
+        with open(chemin, "r", encoding="utf-8") as fichier:
+            donnees = json.load(fichier)
+        for ancienne in [c for c in _sources if c[0] == chemin]:
+            del _sources[ancienne]
+        _sources[cle] = donnees
+    return donnees
+
+
+def actif_geojson(chemin, niveau=None):
+    """
+    Retourne la couche pré-encodée d'un fichier GeoJSON.
+
+    Le résultat est gardé en mémoire pour la durée du processus et recalculé
+    si la date de modification du fichier change.
+
+    Args:
+        chemin (str): Le chemin du fichier GeoJSON.
+        niveau (int | None): Le niveau de simplification, ou None pour la
+            pleine résolution.
+
+    Returns:
+        ActifGeoJSON: La couche encodée.
+    """
+    mtime = os.path.getmtime(chemin)
+    cle = (chemin, niveau)
+    entree = _actifs.get(cle)
+    if entree is not None and entree[0] == mtime:
+        return entree[1]
+
+    with _verrou:
+        entree = _actifs.get(cle)
+        if entree is None or entree[0] != mtime:
+            donnees = _charger_source(chemin, mtime)
+            if niveau is not None:
+                donnees = simplifier_collection(donnees, niveau)
+            contenu = json.dumps(
+                donnees, ensure_ascii=False, separators=(",", ":")
+            ).encode("utf-8")
+            entree = (mtime, ActifGeoJSON(contenu))
+            _actifs[cle] = entree
+    return entree[1]
+
+
+def couche_simplifiee(nom, zoom):
+    """
+    Retourne la couche de contours simplifiée adaptée à un niveau de zoom.
+
+    Args:
+        nom (str): Le nom de la couche (ex. "ATACORA", "BENIN_COMMUNE").
+        zoom (int | None): Le niveau de zoom de la carte.
+
+    Returns:
+        ActifGeoJSON or None: La couche, ou None si elle n'existe pas.
+    """
+    chemin = chemin_couche(nom)
+    if chemin is None:
+        return None
+    return actif_geojson(chemin, niveau_pour_zoom(zoom))
+
+
+def couche_benin(type_couche):
+    """
+    Retourne une couche BENIN_*.json en pleine résolution.
+
+    Args:
+        type_couche (str): Le type de couche (ex. "commune", "departement").
+
+    Returns:
+        ActifGeoJSON or None: La couche, ou None si elle n'existe pas.
+    """
+    chemin = os.path.join(GEOJSON_DIR, f"BENIN_{(type_couche or '').upper()}.json")
+    if chemin_couche(f"BENIN_{(type_couche or '').upper()}") != chemin:
+        return None
+    return actif_geojson(chemin)
+
+
+def reponse_geojson(request, actif):
+    """
+    Construit la réponse HTTP d'une couche pré-encodée.
+
+    Renvoie 304 si le client possède déjà cette version (If-None-Match),
+    sinon la variante compressée acceptée par le client, avec un ETag fort.
+    """
+    contenu, encodage, etag = actif.variante(
+        encodages_acceptes(request.headers.get("Accept-Encoding"))
+    )
+    etags_client = {
+        e.strip().removeprefix("W/") for e in request.headers.get("If-None-Match", "").split(",")
+    }
+    connus = {f'"{actif.etag}"', f'"{actif.etag}-gz"', f'"{actif.etag}-br"', "*"}
+
+    if etags_client & connus:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(contenu, content_type="application/json")
+        if encodage:
+            response["Content-Encoding"] = encodage
+    response["ETag"] = etag
+    patch_vary_headers(response, ("Accept-Encoding",))
+    # Le navigateur garde la couche mais la revalide (304) à chaque visite
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
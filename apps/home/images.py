@@ -0,0 +1,177 @@
+# -*- encoding: utf-8 -*-
+"""
+Dérivés redimensionnés des images téléversées (photos de sites, logos
+d'opérateurs).
+
+À chaque nouvelle image, le signal post_save (voir signals.py) fait calculer
+avec Pillow, après la validation de la transaction et dans un thread, une
+version de chaque taille de DERIVES, en WebP et en JPEG. Les
+dérivés sont réorientés selon l'EXIF puis réencodés sans les métadonnées
+(EXIF, coordonnées GPS de l'appareil). Ils sont nommés d'après l'empreinte
+de leur contenu (``Sites/derives/detail-<empreinte>.webp``) : une URL
+désigne toujours le même fichier et peut être servie avec un cache
+« immutable ».
+
+Les noms des dérivés sont enregistrés dans le champ ``<champ>_derives`` du
+modèle, avec le nom de l'image source : des dérivés d'une autre source sont
+ignorés et l'image originale est servie en attendant leur calcul (commande
+``generer_derives``).
+
+calculer_derives() ne dépend que de Pillow et peut s'exécuter dans un pool
+de processus (voir jeu_essai.py).
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Champ image -> taille -> dimensions maximales (px), proportions conservées
+DERIVES = {
+    "photo": {"vignette": (320, 240), "detail": (1280, 960)},
+    "logo": {"marqueur": (40, 40), "vignette": (160, 160)},
+}
+# Format -> (format Pillow, extension, options d'encodage)
+FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+LONGUEUR_EMPREINTE = 20
+
+
+def _encoder(image, format_):
+    """Encode une image sans métadonnées ; le JPEG, sans transparence, est aplati sur du blanc."""
+    format_pillow, _, options = FORMATS[format_]
+    if format_ == "jpeg" and image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        fond = Image.new("RGB", image.size, "white")
+        fond.paste(image, mask=image.getchannel("A"))
+        image = fond
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    tampon = BytesIO()
+    image.save(tampon, format=format_pillow, **options)
+    return tampon.getvalue()
+
+
+def calculer_derives(contenu, tailles):
+    """
+    Calcule les dérivés d'une image.
+
+    Args:
+        contenu (bytes): L'image source, dans un format lu par Pillow.
+        tailles (dict): Nom de taille -> dimensions maximales (largeur, hauteur).
+
+    Returns:
+        dict: Nom de taille -> format (``webp``, ``jpeg``) -> octets.
+
+    Raises:
+        UnidentifiedImageError: Si le contenu n'est pas une image.
+    """
+    image = Image.open(BytesIO(contenu))
+    # Décodage JPEG à résolution réduite : bien plus rapide sur une photo
+    # d'appareil ; les deux dimensions couvrent une image à pivoter
+    cote = max(max(dimensions) for dimensions in tailles.values())
+    image.draft("RGB", (cote, cote))
+    image = ImageOps.exif_transpose(image)
+    if image.mode == "P":
+        image = image.convert("RGBA")
+
+    derives = {}
+    for taille, dimensions in tailles.items():
+        reduite = image.copy()
+        reduite.thumbnail(dimensions, Image.Resampling.LANCZOS)
+        derives[taille] = {format_: _encoder(reduite, format_) for format_ in FORMATS}
+    return derives
+
+
+def enregistrer_derives(champ, source, derives):
+    """
+    Écrit des dérivés dans le stockage d'un champ image, sous leur nom d'empreinte.
+
+    Args:
+        champ (ImageField): Le champ du modèle (dossier et stockage).
+        source (str): Le nom de l'image source.
+        derives (dict): Les dérivés calculés par calculer_derives().
+
+    Returns:
+        dict: La valeur du champ ``<champ>_derives`` : le nom de la source et,
+        pour chaque taille et format, le nom du fichier dérivé.
+    """
+    noms = {"source": source}
+    for taille, formats in derives.items():
+        noms[taille] = {}
+        for format_, octets in formats.items():
+            empreinte = hashlib.sha256(octets).hexdigest()[:LONGUEUR_EMPREINTE]
+            nom = f"{champ.upload_to}derives/{taille}-{empreinte}.{FORMATS[format_][1]}"
+            # Même nom, même contenu : un dérivé existant est réutilisé
+            if not champ.storage.exists(nom):
+                nom = champ.storage.save(nom, ContentFile(octets))
+            noms[taille][format_] = nom
+    return noms
+
+
+def derives_a_jour(instance, champ):
+    """Indique, sans lire l'image, si ``<champ>_derives`` correspond à l'image ``champ``."""
+    fichier = getattr(instance, champ)
+    actuels = getattr(instance, f"{champ}_derives") or {}
+    if not fichier:
+        return not actuels
+    return actuels.get("source") == fichier.name
+
+
+def actualiser_derives(instance, champ):
+    """
+    Calcule les dérivés de l'image ``champ`` d'une instance si sa source a
+    changé, et les range dans ``instance.<champ>_derives`` (non enregistré).
+
+    Une image illisible n'a pas de dérivés : l'originale reste servie.
+
+    Returns:
+        bool: True si ``<champ>_derives`` a changé.
+    """
+    fichier = getattr(instance, champ)
+    attribut = f"{champ}_derives"
+    actuels = getattr(instance, attribut) or {}
+    if not fichier:
+        nouveaux = {}
+    elif actuels.get("source") == fichier.name:
+        return False
+    else:
+        try:
+            with fichier.open("rb"):
+                contenu = fichier.read()
+            derives = calculer_derives(contenu, DERIVES[champ])
+            nouveaux = enregistrer_derives(fichier.field, fichier.name, derives)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+            logger.warning("Dérivés non calculés pour %s : %s", fichier.name, e)
+            nouveaux = {"source": fichier.name}
+    if nouveaux == actuels:
+        return False
+    setattr(instance, attribut, nouveaux)
+    return True
+
+
+def urls_derive(fichier, derives, taille):
+    """
+    Retourne les URL d'un dérivé, pour un ``<picture>`` ou une réponse JSON.
+
+    Args:
+        fichier (FieldFile): L'image source.
+        derives (dict): La valeur du champ ``<champ>_derives``.
+        taille (str): Le nom de la taille.
+
+    Returns:
+        dict: ``webp`` et ``jpeg`` : les URL des dérivés. Sans dérivés à
+        jour, ``webp`` vaut None et ``jpeg`` l'URL de l'originale ; les deux
+        valent None sans image.
+    """
+    if not fichier:
+        return {"webp": None, "jpeg": None}
+    noms = derives.get(taille) if derives and derives.get("source") == fichier.name else None
+    if not noms:
+        return {"webp": None, "jpeg": fichier.url}
+    return {format_: fichier.storage.url(nom) for format_, nom in noms.items()}
@@ -0,0 +1,79 @@
+# -*- encoding: utf-8 -*-
+"""
+Images factices des jeux de données : photos de sites et logos d'opérateurs.
+
+Les fonctions de ce module renvoient les octets des images, sans toucher au
+stockage ni à la base : elles peuvent être exécutées dans les processus d'un
+ProcessPoolExecutor, le processus principal se chargeant d'écrire les
+fichiers.
+"""
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from .images import DERIVES, calculer_derives
+
+TAILLE_PHOTO = (800, 600)
+TAILLE_LOGO = (200, 200)
+
+
+def dessiner_photo(graine):
+    """
+    Dessine la photo factice d'un site : un pylône sur fond de ciel.
+
+    Args:
+        graine (int): La graine de l'image ; une même graine donne la même
+            image.
+
+    Returns:
+        bytes: L'image au format JPEG.
+    """
+    generateur = random.Random(graine)
+    largeur, hauteur = TAILLE_PHOTO
+    ciel = tuple(generateur.randint(190, 245) for _ in range(3))
+    image = Image.new("RGB", TAILLE_PHOTO, color=ciel)
+    dessin = ImageDraw.Draw(image)
+
+    # Sol, pylône, traverse et balise
+    sol = generateur.randint(480, 560)
+    dessin.rectangle([0, sol, largeur, hauteur], fill=(120, generateur.randint(100, 160), 70))
+    x = generateur.randint(250, 550)
+    sommet = generateur.randint(150, 300)
+    dessin.line([x, sol, x, sommet], fill=(100, 100, 100), width=8)
+    traverse = sommet + 100
+    dessin.line([x - 50, traverse, x + 50, traverse], fill=(150, 150, 150), width=6)
+    dessin.polygon([x - 20, sommet, x + 20, sommet, x, sommet - 50], fill="red")
+
+    tampon = BytesIO()
+    image.save(tampon, format="JPEG", quality=85)
+    return tampon.getvalue()
+
+
+def dessiner_photo_et_derives(graine):
+    """
+    Dessine la photo factice d'un site et calcule ses dérivés.
+
+    Returns:
+        tuple: La photo (JPEG) et ses dérivés (voir images.calculer_derives).
+    """
+    photo = dessiner_photo(graine)
+    return photo, calculer_derives(photo, DERIVES["photo"])
+
+
+def dessiner_logo(couleur):
+    """
+    Dessine le logo factice d'un opérateur : un disque blanc sur sa couleur.
+
+    Args:
+        couleur (str): La couleur de l'opérateur (``#RRGGBB``).
+
+    Returns:
+        bytes: L'image au format PNG.
+    """
+    image = Image.new("RGB", TAILLE_LOGO, color=couleur)
+    dessin = ImageDraw.Draw(image)
+    dessin.ellipse([40, 40, 160, 160], fill="white", outline="black", width=3)
+    tampon = BytesIO()
+    image.save(tampon, format="PNG")
+    return tampon.getvalue()
@@ -0,0 +1,427 @@
+# -*- encoding: utf-8 -*-
+"""
+Moteur d'importation des sites par lots.
+
+Les lignes, déjà nettoyées et validées (voir utils.process_import_file), sont
+traitées par lots : toutes les valeurs de dimensions d'un lot (département,
+commune, localité, emplacement, opérateur) sont résolues en quelques
+requêtes groupées, les manquantes créées par bulk_create, puis les sites du
+lot sont insérés ou mis à jour en masse dans une seule transaction.
+
+Chaque ligne a une empreinte de son contenu normalisé, enregistrée avec le
+site (Site.empreinte_import). Les sites dont l'empreinte n'a pas changé
+depuis la dernière importation ne sont pas réécrits : la réimportation
+mensuelle d'un inventaire complet n'écrit que les sites modifiés. En
+simulation, les sites sont seulement comparés à la base et comptés.
+
+Les écritures en masse contournent Site.save() et les signaux : la cellule
+de grille est calculée ici, l'index de recherche mis à jour à chaque lot et
+les tables des statistiques et de densité reconstruites par terminer(), une
+importation à la fois (voir reconstruire_donnees_derivees).
+"""
+import hashlib
+import logging
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, OperationalError, transaction
+from django.utils import timezone
+
+from .cache import invalider_positions, invalider_sites
+from .densite import reconstruire_densites
+from .models import Commune, Departement, Emplacement, Localite, Operateur, Site, Verrou
+from .recherche import indexer_sites
+from .spatial import cellule_grille
+from .statistiques import reconstruire_statistiques
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 1000
+VERROU_DONNEES_DERIVEES = "donnees-derivees"
+# Tentatives de prise du verrou : sur SQLite, l'attente d'une autre
+# reconstruction s'arrête au bout du délai de la base (OPTIONS["timeout"])
+TENTATIVES_VERROU = 5
+
+
+@dataclass
+class LigneImport:
+    """Une ligne du fichier, prête à être importée."""
+
+    numero: int
+    departement: str
+    commune: str
+    localite: str
+    operateur: str
+    emplacement: str = None
+    # Champs simples du site ; les valeurs None ne remplacent pas l'existant
+    site: dict = field(default_factory=dict)
+    # Empreinte du site, calculée par l'importateur
+    empreinte: str = None
+
+    def contenu(self):
+        """Représentation stable du contenu de la ligne, pour son empreinte."""
+        return repr(
+            (
+                self.departement,
+                self.commune,
+                self.localite,
+                self.operateur,
+                self.emplacement,
+                sorted(self.site.items()),
+            )
+        )
+
+
+def reconstruire_donnees_derivees():
+    """
+    Reconstruit les tables de statistiques et de densité sous un verrou.
+
+    Les reconstructions vident puis remplissent les tables : deux importations
+    terminées en même temps ne doivent pas les exécuter ensemble (lignes en
+    double sur PostgreSQL, base verrouillée sur SQLite). La mise à jour de la
+    ligne Verrou, en tête de transaction, verrouille la ligne jusqu'à la
+    validation sur PostgreSQL et prend le verrou d'écriture de la base sur
+    SQLite : la seconde reconstruction attend la fin de la première.
+    """
+    Verrou.objects.get_or_create(nom=VERROU_DONNEES_DERIVEES)
+    for tentative in range(1, TENTATIVES_VERROU + 1):
+        try:
+            with transaction.atomic():
+                Verrou.objects.filter(nom=VERROU_DONNEES_DERIVEES).update(pris_le=timezone.now())
+                reconstruire_statistiques()
+                reconstruire_densites()
+            return
+        except OperationalError as e:
+            if tentative == TENTATIVES_VERROU:
+                raise
+            logger.warning(f"Reconstruction des données dérivées en attente ({tentative}) : {e}")
+
+
+def empreinte(lignes):
+    """Empreinte des lignes d'un même site, dans l'ordre du fichier."""
+    contenu = "\n".join(ligne.contenu() for ligne in lignes)
+    return hashlib.blake2b(contenu.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ImportateurSites:
+    """
+    Importe des LigneImport par lots.
+
+    Les dimensions déjà résolues sont gardées d'un lot à l'autre, de sorte
+    qu'un fichier entier ne les interroge qu'une fois.
+    """
+
+    def __init__(self, taille_lot=TAILLE_LOT, progression=None, simulation=False):
+        """
+        Args:
+            taille_lot (int): Le nombre de lignes par lot.
+            progression (callable): Appelée avec l'importateur après chaque lot.
+            simulation (bool): Compter les sites nouveaux, modifiés, inchangés
+                et disparus sans rien écrire.
+        """
+        self.taille_lot = taille_lot
+        self.progression = progression
+        self.simulation = simulation
+        self.departements = {}  # (nom,) -> id
+        self.communes = {}  # (nom, departement_id) -> id
+        self.localites = {}  # (localite,) -> (id, commune_id)
+        self.emplacements = {}  # (type_emplacement,) -> id
+        self.operateurs = {}  # (nom,) -> id
+        self.lignes_traitees = 0
+        self.crees = 0
+        self.mis_a_jour = 0
+        self.inchanges = 0
+        self.disparus = 0
+        self.erreurs = []
+        # Sites et opérateurs présents dans le fichier
+        self.noms_vus = set()
+        self.operateurs_vus = set()
+
+    def importer(self, lignes):
+        """Importe un itérable de LigneImport, lot par lot."""
+        lot = []
+        for ligne in lignes:
+            lot.append(ligne)
+            if len(lot) >= self.taille_lot:
+                self._importer_et_signaler(lot)
+                lot = []
+        if lot:
+            self._importer_et_signaler(lot)
+
+    def _importer_et_signaler(self, lot):
+        self.importer_lot(lot)
+        self.lignes_traitees += len(lot)
+        if self.progression:
+            self.progression(self)
+
+    def importer_lot(self, lignes):
+        """
+        Importe un lot de lignes, sauf les sites inchangés.
+
+        En simulation, le lot est seulement comparé aux sites existants.
+        """
+        lignes = self._lignes_modifiees(lignes)
+        if lignes and not self.simulation:
+            self._ecrire_lot(lignes)
+
+    def _ecrire_lot(self, lignes):
+        """
+        Écrit un lot de lignes dans une transaction.
+
+        Si la base refuse le lot, il est annulé puis rejoué ligne par ligne
+        pour n'écarter que les lignes fautives.
+        """
+        erreurs = []
+        try:
+            with transaction.atomic():
+                self._resoudre_dimensions(lignes)
+                sites = self._preparer_sites(lignes, erreurs)
+                crees, site_ids = self._enregistrer_sites(sites)
+                indexer_sites(site_ids)
+        except DatabaseError as e:
+            # Les dimensions créées dans la transaction annulée n'existent plus
+            self._vider_caches()
+            if len(lignes) == 1:
+                erreurs = [self._erreur(lignes[0], e)]
+            else:
+                for ligne in lignes:
+                    self._ecrire_lot([ligne])
+                return
+        else:
+            self.crees += crees
+            self.mis_a_jour += len(sites) - crees
+        self.erreurs.extend(erreurs)
+
+    def terminer(self):
+        """
+        Compte les sites disparus et met à jour les données dérivées des
+        sites, si l'importation en a écrit.
+        """
+        self.disparus = self._compter_disparus()
+        if self.simulation or not (self.crees or self.mis_a_jour):
+            return
+        reconstruire_donnees_derivees()
+        invalider_sites()
+        invalider_positions()
+
+    def rapport(self):
+        """Les nombres de sites nouveaux, modifiés, inchangés et disparus."""
+        return {
+            "crees": self.crees,
+            "mis_a_jour": self.mis_a_jour,
+            "inchanges": self.inchanges,
+            "disparus": self.disparus,
+        }
+
+    def _erreur(self, ligne, message):
+        return f"Ligne {ligne.numero}: {message}"
+
+    def _vider_caches(self):
+        for cache in (
+            self.departements,
+            self.communes,
+            self.localites,
+            self.emplacements,
+            self.operateurs,
+        ):
+            cache.clear()
+
+    # Empreintes
+    def _lignes_modifiees(self, lignes):
+        """
+        Calcule l'empreinte de chaque site du lot et écarte les sites dont
+        l'empreinte est celle enregistrée en base.
+
+        Les lignes d'un même site sont gardées ou écartées ensemble. Un site
+        n'est compté qu'à sa première apparition dans le fichier.
+        """
+        groupes = {}
+        sans_nom = []
+        for ligne in lignes:
+            self.operateurs_vus.add(ligne.operateur)
+            nom = ligne.site.get("nom")
+            if nom is None:
+                # Ligne refusée par _valeurs_site
+                sans_nom.append(ligne)
+            else:
+                groupes.setdefault(str(nom), []).append(ligne)
+
+        existants = dict(
+            Site.objects.filter(nom__in=list(groupes)).values_list("nom", "empreinte_import")
+        )
+        modifiees = sans_nom
+        for nom, groupe in groupes.items():
+            valeur = empreinte(groupe)
+            nouveau = nom not in self.noms_vus
+            self.noms_vus.add(nom)
+            if existants.get(nom) == valeur:
+                if nouveau:
+                    self.inchanges += 1
+                continue
+            if self.simulation and nouveau:
+                if nom in existants:
+                    self.mis_a_jour += 1
+                else:
+                    self.crees += 1
+            for ligne in groupe:
+                ligne.empreinte = valeur
+            modifiees.extend(groupe)
+        # Ordre du fichier, pour la fusion des lignes d'un même site
+        return sorted(modifiees, key=lambda ligne: ligne.numero)
+
+    def _compter_disparus(self):
+        """
+        Compte les sites des opérateurs du fichier qui n'y figurent plus
+        (l'inventaire d'un opérateur est toujours envoyé complet).
+        """
+        noms = Site.objects.filter(operateur__nom__in=self.operateurs_vus).values_list(
+            "nom", flat=True
+        )
+        return sum(1 for nom in noms.iterator() if nom not in self.noms_vus)
+
+    # Dimensions
+    def _resoudre(self, modele, champs, cles, cache, creation=None, autres=()):
+        """
+        Complète ``cache`` pour les clés ``cles`` (tuples de valeurs de
+        ``champs``) : une requête pour les existantes, un bulk_create et une
+        relecture pour les manquantes.
+
+        Args:
+            creation (dict): Valeurs supplémentaires à la création, par clé.
+            autres (tuple): Champs lus en plus de l'id ; la valeur en cache
+                est alors le tuple (id, *autres).
+        """
+
+        def lire(cles):
+            filtres = {
+                f"{nom}__in": {cle[i] for cle in cles} for i, nom in enumerate(champs)
+            }
+            for valeurs in modele.objects.filter(**filtres).values_list(
+                *champs, "id", *autres
+            ):
+                cle = valeurs[: len(champs)]
+                if cle in cles and cle not in cache:
+                    reste = valeurs[len(champs) :]
+                    cache[cle] = reste if autres else reste[0]
+
+        manquantes = {cle for cle in cles if cle not in cache}
+        if manquantes:
+            lire(manquantes)
+        manquantes = {cle for cle in manquantes if cle not in cache}
+        if manquantes:
+            modele.objects.bulk_create(
+                [
+                    modele(**dict(zip(champs, cle)), **(creation or {}).get(cle, {}))
+                    for cle in manquantes
+                ],
+                ignore_conflicts=True,
+            )
+            lire(manquantes)
+
+    def _resoudre_dimensions(self, lignes):
+        self._resoudre(
+            Departement, ("nom",), {(l.departement,) for l in lignes}, self.departements
+        )
+        communes = {(l.commune, self.departements[(l.departement,)]) for l in lignes}
+        self._resoudre(Commune, ("nom", "departement_id"), communes, self.communes)
+
+        creation = {}
+        for ligne in lignes:
+            commune_id = self.communes[(ligne.commune, self.departements[(ligne.departement,)])]
+            creation.setdefault((ligne.localite,), {"commune_id": commune_id})
+        self._resoudre(
+            Localite,
+            ("localite",),
+            set(creation),
+            self.localites,
+            creation=creation,
+            autres=("commune_id",),
+        )
+
+        self._resoudre(
+            Emplacement,
+            ("type_emplacement",),
+            {(l.emplacement,) for l in lignes if l.emplacement},
+            self.emplacements,
+        )
+        self._resoudre(Operateur, ("nom",), {(l.operateur,) for l in lignes}, self.operateurs)
+
+    # Sites
+    def _preparer_sites(self, lignes, erreurs):
+        """
+        Convertit les lignes en valeurs de champs des sites, par nom.
+
+        Les lignes d'un même site sont fusionnées dans l'ordre du fichier,
+        comme l'auraient fait des update_or_create successifs.
+        """
+        sites = {}
+        for ligne in lignes:
+            try:
+                valeurs = self._valeurs_site(ligne)
+            except ValidationError as ve:
+                erreurs.append(self._erreur(ligne, "; ".join(ve.messages)))
+                continue
+            sites.setdefault(valeurs["nom"], {}).update(valeurs)
+        return sites
+
+    def _valeurs_site(self, ligne):
+        commune_id = self.communes[(ligne.commune, self.departements[(ligne.departement,)])]
+        localite_id, commune_localite = self.localites[(ligne.localite,)]
+        if commune_localite != commune_id:
+            raise ValidationError(
+                f"Erreur d'intégrité: la localité {ligne.localite} appartient "
+                f"à une autre commune que {ligne.commune}"
+            )
+
+        valeurs = {
+            "localite_id": localite_id,
+            "operateur_id": self.operateurs[(ligne.operateur,)],
+        }
+        if ligne.emplacement:
+            valeurs["emplacement_id"] = self.emplacements[(ligne.emplacement,)]
+        if ligne.empreinte:
+            valeurs["empreinte_import"] = ligne.empreinte
+        for nom, valeur in ligne.site.items():
+            if valeur is not None:
+                valeurs[nom] = Site._meta.get_field(nom).to_python(valeur)
+        if not valeurs.get("nom"):
+            raise ValidationError("Identifiant du site manquant")
+        return valeurs
+
+    def _enregistrer_sites(self, sites):
+        """
+        Insère ou met à jour les sites préparés en une requête par lot
+        (INSERT ... ON CONFLICT (nom) DO UPDATE).
+
+        Les valeurs d'un site existant sont d'abord relues puis complétées,
+        pour qu'une valeur absente du fichier ne l'efface pas.
+
+        Returns:
+            tuple: Le nombre de sites créés et les ids de tous les sites.
+        """
+        existants = Site.objects.in_bulk(list(sites), field_name="nom")
+        champs = [
+            f for f in Site._meta.concrete_fields if not f.primary_key and f.name != "add_at"
+        ]
+
+        a_enregistrer = []
+        for nom, valeurs in sites.items():
+            site = Site()
+            if nom in existants:
+                for f in champs:
+                    setattr(site, f.attname, getattr(existants[nom], f.attname))
+            for champ, valeur in valeurs.items():
+                setattr(site, champ, valeur)
+            site.cellule_grille = cellule_grille(site.latitude, site.longitude)
+            a_enregistrer.append(site)
+
+        Site.objects.bulk_create(
+            a_enregistrer,
+            batch_size=self.taille_lot,
+            update_conflicts=True,
+            unique_fields=["nom"],
+            update_fields=[f.name for f in champs if f.name != "nom"],
+        )
+
+        site_ids = Site.objects.filter(nom__in=list(sites)).values_list("id", flat=True)
+        return len(sites) - len(existants), list(site_ids)
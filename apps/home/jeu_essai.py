@@ -0,0 +1,305 @@
+# -*- encoding: utf-8 -*-
+"""
+Jeu de données synthétique et déterministe, à l'échelle voulue.
+
+Pour une même graine et un même nombre de sites, les mêmes départements,
+communes, localités, opérateurs et sites sont produits, avec les mêmes
+coordonnées, technologies et conformités : les mesures de performance faites
+sur deux versions du code portent sur des données identiques.
+
+Les sites sont écrits par lots d'INSERT directs, sans instancier les modèles
+ni déclencher les signaux ; les données dérivées (statistiques, index de
+recherche, grille de densité) sont reconstruites d'un bloc à la fin.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalider_positions, invalider_sites
+from .densite import reconstruire_densites
+from .images import enregistrer_derives
+from .images_factices import dessiner_logo, dessiner_photo_et_derives
+from .models import (
+    Commune,
+    Conformite,
+    Departement,
+    Emplacement,
+    Localite,
+    Operateur,
+    Site,
+    SiteTechnologie,
+    Technologie,
+)
+from .recherche import indexer_sites
+from .spatial import cellule_grille
+from .statistiques import reconstruire_statistiques
+
+TAILLE_LOT = 5000
+LOCALITES_PAR_COMMUNE = 10
+
+# Départements du Bénin : centre approximatif et principales communes
+DEPARTEMENTS = {
+    "Alibori": (11.0, 2.5, ["Kandi", "Gogounou", "Banikoara"]),
+    "Atacora": (10.5, 1.0, ["Natitingou", "Tanguiéta", "Kérou"]),
+    "Atlantique": (6.5, 2.25, ["Abomey-Calavi", "Allada", "Ouidah", "Toffo"]),
+    "Borgou": (9.5, 2.5, ["Parakou", "Nikki", "Bembèrèkè"]),
+    "Collines": (8.0, 2.0, ["Dassa-Zoumè", "Savè", "Glazoué"]),
+    "Couffo": (7.0, 1.75, ["Aplahoué", "Djakotomey", "Klouékanmè"]),
+    "Donga": (9.0, 1.5, ["Djougou", "Copargo", "Bassila"]),
+    "Littoral": (6.35, 2.4, ["Cotonou"]),
+    "Mono": (6.5, 1.75, ["Lokossa", "Athieme", "Comè"]),
+    "Ouémé": (6.5, 2.6, ["Porto-Novo", "Adjohoun", "Dangbo"]),
+    "Plateau": (7.0, 2.5, ["Sakété", "Kétou", "Pobè"]),
+    "Zou": (7.25, 2.0, ["Abomey", "Bohicon", "Za-Kpota"]),
+}
+OPERATEURS = [("MTN", "#FFCC00"), ("MOOV", "#0055A4"), ("Celtiis", "#0099CC")]
+TECHNOLOGIES = ["2G", "3G", "4G", "5G"]
+EMPLACEMENTS = ["Terrain nu", "Bâtiment public", "Colline", "Zone industrielle", "Toit d'immeuble"]
+TYPES_PYLONE = ["Monopôle", "Treillis", "Autoportant", "Camouflé"]
+PROPRIETAIRES = ["État", "Collectivité", "Privé"]
+
+# Emprise des coordonnées générées (degrés)
+SUD, OUEST, NORD, EST = 6.25, 0.8, 12.35, 3.8
+DATE_ORIGINE = date(2015, 1, 1)
+
+
+# Part des graines de photo réservée à chaque jeu : graine * ESPACE_GRAINES + numéro
+ESPACE_GRAINES = 10_000_000
+
+
+def _creer_referentiels(carte=None):
+    """
+    Crée (ou retrouve) les départements, communes, localités et listes de référence.
+
+    Args:
+        carte (callable): Si fournie, ``map`` (ou ``Executor.map``) servant à
+            dessiner le logo des opérateurs qui n'en ont pas.
+    """
+    localites = []
+    for nom_departement, (lat, lon, communes) in DEPARTEMENTS.items():
+        departement, _ = Departement.objects.get_or_create(nom=nom_departement)
+        for nom_commune in communes:
+            commune, _ = Commune.objects.get_or_create(nom=nom_commune, departement=departement)
+            for i in range(LOCALITES_PAR_COMMUNE):
+                localite, _ = Localite.objects.get_or_create(
+                    localite=f"Quartier {i + 1} ({nom_commune})", commune=commune
+                )
+                localites.append((localite.pk, lat, lon))
+    operateurs = [
+        Operateur.objects.get_or_create(nom=nom, defaults={"couleur": couleur})[0]
+        for nom, couleur in OPERATEURS
+    ]
+    if carte is not None:
+        sans_logo = [operateur for operateur in operateurs if not operateur.logo]
+        logos = carte(dessiner_logo, [operateur.couleur or "#CCCCCC" for operateur in sans_logo])
+        for operateur, contenu in zip(sans_logo, logos):
+            operateur.logo.save(f"logo_{operateur.nom.lower()}.png", ContentFile(contenu))
+    technologies = [Technologie.objects.get_or_create(nom=nom)[0].pk for nom in TECHNOLOGIES]
+    emplacements = [
+        Emplacement.objects.get_or_create(type_emplacement=nom)[0].pk for nom in EMPLACEMENTS
+    ]
+    return localites, [operateur.pk for operateur in operateurs], technologies, emplacements
+
+
+def _inserer(modele, champs, lignes):
+    """
+    Insère des lignes par un INSERT exécuté en lot (executemany).
+
+    Plus rapide que bulk_create à grande échelle : aucune instance de modèle
+    n'est construite ni préparée champ par champ. Les valeurs doivent donc
+    être déjà adaptées à la base (voir _adapter).
+
+    Args:
+        modele: Le modèle dont la table reçoit les lignes.
+        champs (list): Les noms des champs, dans l'ordre des valeurs.
+        lignes (list): Les lignes, des tuples de valeurs.
+    """
+    if not lignes:
+        return
+    nom = connection.ops.quote_name
+    colonnes = ", ".join(nom(modele._meta.get_field(champ).column) for champ in champs)
+    valeurs = ", ".join(["%s"] * len(champs))
+    with connection.cursor() as curseur:
+        curseur.executemany(
+            f"INSERT INTO {nom(modele._meta.db_table)} ({colonnes}) VALUES ({valeurs})", lignes
+        )
+
+
+def _adapter_dates(jours):
+    """Convertit des jours depuis DATE_ORIGINE en valeurs de date pour la base."""
+    adapter = connection.ops.adapt_datefield_value
+    return [adapter(DATE_ORIGINE + timedelta(days=jour)) for jour in jours]
+
+
+def generer_jeu_essai(
+    nombre_sites,
+    graine=42,
+    taille_lot=TAILLE_LOT,
+    progression=None,
+    premier_numero=1,
+    part_photos=0.0,
+    logos=False,
+    executeur=None,
+):
+    """
+    Crée un jeu de sites synthétique et déterministe.
+
+    Les sites sont répartis autour des centres des départements, entre les
+    opérateurs, avec une à trois technologies chacun et un rapport de
+    conformité pour un quart d'entre eux.
+
+    Chaque lot est écrit dans sa propre transaction. Les photos sont
+    dessinées par ``executeur`` (un ProcessPoolExecutor, par exemple) pendant
+    que le lot est préparé, puis enregistrées dans le stockage par ce
+    processus.
+
+    Args:
+        nombre_sites (int): Le nombre de sites à créer.
+        graine (int): La graine du générateur pseudo-aléatoire.
+        taille_lot (int): Le nombre de sites écrits par transaction.
+        progression (callable): Appelée après chaque lot avec le nombre de
+            sites créés.
+        premier_numero (int): Le numéro du premier site (noms
+            ``SITE-<opérateur>-<numéro>``), pour compléter une base déjà
+            peuplée sans collision de noms.
+        part_photos (float): La part des sites ayant une photo (0 à 1).
+        logos (bool): Dessiner le logo des opérateurs qui n'en ont pas.
+        executeur (Executor): L'exécuteur dessinant photos et logos ; sans
+            exécuteur, ils sont dessinés dans ce processus.
+
+    Returns:
+        int: Le nombre de sites créés.
+    """
+    carte = executeur.map if executeur is not None else map
+    localites, operateurs, technologies, emplacements = _creer_referentiels(carte if logos else None)
+    generateur = np.random.default_rng(graine)
+    # Tous les tirages sont faits d'avance : le jeu ne dépend pas de la
+    # taille des lots
+    choix_localites = generateur.integers(len(localites), size=nombre_sites)
+    centres = np.array([(lat, lon) for _, lat, lon in localites])[choix_localites]
+    latitudes = np.clip(centres[:, 0] + generateur.normal(0, 0.2, nombre_sites), SUD, NORD).round(6)
+    longitudes = np.clip(centres[:, 1] + generateur.normal(0, 0.2, nombre_sites), OUEST, EST).round(6)
+    choix_operateurs = generateur.integers(len(operateurs), size=nombre_sites)
+    choix_emplacements = generateur.integers(len(emplacements), size=nombre_sites)
+    choix_pylones = generateur.integers(len(TYPES_PYLONE), size=nombre_sites)
+    choix_proprietaires = generateur.integers(len(PROPRIETAIRES), size=nombre_sites)
+    hauteurs = generateur.uniform(25.0, 75.0, nombre_sites).round(2)
+    camouflages = generateur.random(nombre_sites) < 0.5
+    jours_autorisation = generateur.integers(0, 3650, size=nombre_sites)
+    delais_service = generateur.integers(0, 365, size=nombre_sites)
+    nombres_technologies = generateur.integers(1, 4, size=nombre_sites)
+    ordres_technologies = generateur.permuted(
+        np.tile(np.arange(len(technologies)), (nombre_sites, 1)), axis=1
+    )
+    conformites = generateur.random(nombre_sites)
+    # Tirée en dernier : les autres valeurs ne dépendent pas de part_photos
+    photos = generateur.random(nombre_sites) < part_photos
+
+    champ_photo = Site._meta.get_field("photo")
+    champ_derives = Site._meta.get_field("photo_derives")
+    codes = [OPERATEURS[i][0] for i in range(len(operateurs))]
+    crees = 0
+    for debut in range(0, nombre_sites, taille_lot):
+        fin = min(debut + taille_lot, nombre_sites)
+        numeros = range(premier_numero + debut, premier_numero + fin)
+        # Les photos du lot et leurs dérivés sont dessinés pendant sa préparation
+        avec_photo = np.flatnonzero(photos[debut:fin]).tolist()
+        contenus = carte(
+            dessiner_photo_et_derives,
+            [graine * ESPACE_GRAINES + numeros[i] for i in avec_photo],
+        )
+
+        lot_operateurs = choix_operateurs[debut:fin].tolist()
+        noms = [f"SITE-{codes[o]}-{numero:06d}" for o, numero in zip(lot_operateurs, numeros)]
+        lot_latitudes = latitudes[debut:fin].tolist()
+        lot_longitudes = longitudes[debut:fin].tolist()
+        jours = jours_autorisation[debut:fin]
+        ajout = connection.ops.adapt_datetimefield_value(timezone.now())
+        colonnes = [
+            noms,
+            lot_latitudes,
+            lot_longitudes,
+            [cellule_grille(lat, lon) for lat, lon in zip(lot_latitudes, lot_longitudes)],
+            [f"Site synthétique {numero}" for numero in numeros],
+            _adapter_dates(jours.tolist()),
+            _adapter_dates((jours + delais_service[debut:fin]).tolist()),
+            [TYPES_PYLONE[i] for i in choix_pylones[debut:fin].tolist()],
+            hauteurs[debut:fin].tolist(),
+            camouflages[debut:fin].tolist(),
+            [PROPRIETAIRES[i] for i in choix_proprietaires[debut:fin].tolist()],
+            [operateurs[o] for o in lot_operateurs],
+            [emplacements[i] for i in choix_emplacements[debut:fin].tolist()],
+            [localites[i][0] for i in choix_localites[debut:fin].tolist()],
+            [f"DOS-{numero:06d}" for numero in numeros],
+            [ajout] * (fin - debut),
+            [""] * (fin - debut),
+            [None] * (fin - debut),
+            [champ_derives.get_db_prep_save({}, connection)] * (fin - debut),
+        ]
+        for i, (contenu, derives) in zip(avec_photo, contenus):
+            nom_fichier = champ_photo.generate_filename(None, f"site_{numeros[i]:07d}.jpg")
+            nom_fichier = champ_photo.storage.save(nom_fichier, ContentFile(contenu))
+            colonnes[-2][i] = nom_fichier
+            colonnes[-1][i] = champ_derives.get_db_prep_save(
+                enregistrer_derives(champ_photo, nom_fichier, derives), connection
+            )
+
+        with transaction.atomic():
+            _inserer(
+                Site,
+                [
+                    "nom",
+                    "latitude",
+                    "longitude",
+                    "cellule_grille",
+                    "description",
+                    "date_autorisation",
+                    "date_mise_en_service",
+                    "type_pylone",
+                    "hauteur_antenne",
+                    "camouflage",
+                    "proprietaire",
+                    "operateur",
+                    "emplacement",
+                    "localite",
+                    "num_dossier",
+                    "add_at",
+                    "empreinte_import",
+                    "photo",
+                    "photo_derives",
+                ],
+                list(zip(*colonnes)),
+            )
+            # Les ids ne sont pas renvoyés par tous les moteurs : relecture par nom
+            ids = dict(Site.objects.filter(nom__in=noms).values_list("nom", "id"))
+            liens, rapports = [], []
+            for i, nom in zip(range(debut, fin), noms):
+                site_id = ids[nom]
+                for position in ordres_technologies[i, : nombres_technologies[i]].tolist():
+                    liens.append((site_id, technologies[position], ajout))
+                if conformites[i] < 0.25:
+                    inspection = DATE_ORIGINE + timedelta(days=int(jours_autorisation[i]) + 30)
+                    rapports.append(
+                        (
+                            site_id,
+                            "",
+                            connection.ops.adapt_datefield_value(inspection),
+                            bool(conformites[i] < 0.15),
+                        )
+                    )
+            _inserer(SiteTechnologie, ["site", "technologie", "date_ajout"], liens)
+            _inserer(Conformite, ["site", "rapport", "date_inspection", "statut"], rapports)
+        crees += fin - debut
+        if progression:
+            progression(crees)
+
+    # Les INSERT directs contournent les signaux : données dérivées reconstruites
+    reconstruire_statistiques()
+    indexer_sites()
+    reconstruire_densites()
+    invalider_sites()
+    invalider_positions()
+    return crees
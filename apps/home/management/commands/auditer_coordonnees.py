@@ -0,0 +1,57 @@
+# apps/home/management/commands/auditer_coordonnees.py
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.home.audit import CHAMPS_RAPPORT, TAILLE_LOT, auditer_sites
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la commune et le département déclarés des sites à ceux qui "
+        "contiennent leurs coordonnées, et écrit le rapport des écarts en CSV"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sortie",
+            default="audit_coordonnees.csv",
+            help="Fichier CSV du rapport, ou - pour la sortie standard (défaut : audit_coordonnees.csv)",
+        )
+        parser.add_argument(
+            "--taille-lot",
+            type=int,
+            default=TAILLE_LOT,
+            help=f"Nombre de sites localisés d'un bloc (défaut : {TAILLE_LOT})",
+        )
+
+    def handle(self, *args, **options):
+        debut = time.monotonic()
+        compteurs = {}
+        sortie = options["sortie"]
+        fichier = sys.stdout if sortie == "-" else open(sortie, "w", newline="", encoding="utf-8")
+        try:
+            ecrivain = csv.DictWriter(fichier, fieldnames=CHAMPS_RAPPORT)
+            ecrivain.writeheader()
+            ecrivain.writerows(
+                auditer_sites(taille_lot=max(options["taille_lot"], 1), compteurs=compteurs)
+            )
+        finally:
+            if fichier is not sys.stdout:
+                fichier.close()
+
+        audites = compteurs.pop("audites")
+        ecarts = sum(compteurs.values())
+        details = ", ".join(f"{motif} : {nombre}" for motif, nombre in sorted(compteurs.items()))
+        # Le résumé va sur la sortie d'erreur quand le rapport est sur la sortie standard
+        flux = self.stderr if sortie == "-" else self.stdout
+        flux.write(
+            self.style.SUCCESS(
+                f"✅ {audites} site(s) audité(s) en {time.monotonic() - debut:.1f} s, "
+                f"{ecarts} écart(s){f' ({details})' if details else ''}."
+            )
+        )
+        if sortie != "-":
+            flux.write(f"Rapport écrit dans {sortie}.")
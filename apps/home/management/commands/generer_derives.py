@@ -0,0 +1,43 @@
+# apps/home/management/commands/generer_derives.py
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.home.cache import invalider_sites
+from apps.home.images import actualiser_derives
+from apps.home.models import Operateur, Site
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule les dérivés (vignettes WebP/JPEG sans EXIF) des photos de sites et "
+        "des logos d'opérateurs qui n'en ont pas encore"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tous",
+            action="store_true",
+            help="Recalculer aussi les dérivés existants (après un changement de DERIVES)",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for modele, champ in ((Operateur, "logo"), (Site, "photo")):
+            attribut = f"{champ}_derives"
+            instances = (
+                modele.objects.exclude(Q(**{champ: ""}) | Q(**{f"{champ}__isnull": True}))
+                .only("id", champ, attribut)
+                .order_by("id")
+            )
+            nombre = 0
+            for instance in instances.iterator(chunk_size=500):
+                if options["tous"]:
+                    setattr(instance, attribut, {})
+                if actualiser_derives(instance, champ):
+                    modele.objects.filter(pk=instance.pk).update(**{attribut: getattr(instance, attribut)})
+                    nombre += 1
+            self.stdout.write(f"    {modele._meta.verbose_name_plural} : {nombre} image(s) traitée(s)")
+            total += nombre
+        if total:
+            invalider_sites()
+        self.stdout.write(self.style.SUCCESS(f"✅ Dérivés calculés pour {total} image(s)."))
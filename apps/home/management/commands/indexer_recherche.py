@@ -0,0 +1,17 @@
+# apps/home/management/commands/indexer_recherche.py
+from django.core.management.base import BaseCommand
+
+from apps.home.models import IndexRechercheSite
+from apps.home.recherche import indexer_sites
+
+
+class Command(BaseCommand):
+    help = "Reconstruit entièrement l'index de recherche plein texte des sites"
+
+    def handle(self, *args, **options):
+        indexer_sites()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Index de recherche reconstruit ({IndexRechercheSite.objects.count()} sites)."
+            )
+        )
@@ -0,0 +1,268 @@
+# apps/home/management/commands/mesurer_performances.py
+import gc
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from apps.home.export import flux_csv
+from apps.home.jeu_essai import generer_jeu_essai
+from apps.home.metriques import MesureSQL, cout_instrumentation
+from apps.home.models import Site
+from apps.home.utils import process_import_file
+
+AJAX = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+# Emprise du Bénin, et une emprise urbaine (Cotonou) affichée site par site
+EMPRISE_BENIN = "0.7,6.1,3.9,12.5"
+EMPRISE_VILLE = "2.3,6.3,2.5,6.45"
+SITES_IMPORTES = 1000
+SCENARIOS = [
+    "index",
+    "map_view (clusters)",
+    "map_view (sites)",
+    "map_view (compact)",
+    "map_view (binaire)",
+    "site_list",
+    "recherche_ajax",
+    "get_statistics_data",
+    "process_import_file",
+]
+
+
+def _fichier_import(sites):
+    """Export CSV (réimportable) des premiers sites du jeu, nommé pour l'import."""
+    fichier = io.BytesIO("".join(flux_csv(sites)).encode("utf-8"))
+    fichier.name = "sites.csv"
+    return fichier
+
+
+def _scenarios():
+    """
+    Les scénarios mesurés (voir SCENARIOS) : nom -> fonction exécutant une
+    fois le scénario.
+
+    Les vues sont appelées via le client de test, sans serveur HTTP ;
+    l'importation est appelée directement, en simulation pour que le jeu de
+    données reste identique d'une itération à l'autre.
+    """
+    # Certaines vues exigent une connexion
+    utilisateur = get_user_model().objects.create_user("benchmark")
+    client = Client()
+    client.force_login(utilisateur)
+    premiers = Site.objects.order_by("id").values_list("id", flat=True)[:SITES_IMPORTES]
+    contenu_import = _fichier_import(Site.objects.filter(pk__in=list(premiers))).getvalue()
+
+    def importer():
+        fichier = io.BytesIO(contenu_import)
+        fichier.name = "sites.csv"
+        process_import_file(fichier, simulation=True)
+
+    return {
+        "index": lambda: client.get("/"),
+        "map_view (clusters)": lambda: client.get("/map/", {"bbox": EMPRISE_BENIN, "zoom": 8}, **AJAX),
+        "map_view (sites)": lambda: client.get("/map/", {"bbox": EMPRISE_VILLE, "zoom": 14}, **AJAX),
+        "map_view (compact)": lambda: client.get(
+            "/map/", {"bbox": EMPRISE_VILLE, "zoom": 14, "format": "compact"}, **AJAX
+        ),
+        "map_view (binaire)": lambda: client.get(
+            "/map/", {"bbox": EMPRISE_VILLE, "zoom": 14, "format": "binaire"}, **AJAX
+        ),
+        "site_list": lambda: client.get("/site/"),
+        "recherche_ajax": lambda: client.get("/ajax/recherche/", {"q": "cotonou"}, **AJAX),
+        "get_statistics_data": lambda: client.get(
+            "/statistics/data/", {"date_from": "2018-03-15", "date_to": "2023-09-20"}, **AJAX
+        ),
+        "process_import_file": importer,
+    }
+
+
+def _mesurer(scenario, iterations):
+    """
+    Exécute un scénario et mesure latences, requêtes SQL et mémoire.
+
+    La première exécution (caches froids) est mesurée à part. La mémoire est
+    mesurée sur une exécution supplémentaire, tracemalloc ralentissant le
+    code mesuré.
+    """
+    debut = time.perf_counter()
+    scenario()
+    premiere = time.perf_counter() - debut
+
+    latences, requetes = [], []
+    for _ in range(iterations):
+        # Ramasse-miettes hors de la mesure : moins de valeurs aberrantes
+        gc.collect()
+        mesure = MesureSQL()
+        with connection.execute_wrapper(mesure):
+            debut = time.perf_counter()
+            reponse = scenario()
+            latences.append(time.perf_counter() - debut)
+        requetes.append(mesure.nombre)
+        # Une redirection (connexion) ou une erreur ne mesure pas la vue
+        if reponse is not None and reponse.status_code >= 300:
+            raise CommandError(f"Réponse HTTP {reponse.status_code}")
+
+    tracemalloc.start()
+    try:
+        scenario()
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(np.array(latences) * 1000, [50, 95, 99])
+    nombre_sql = int(np.median(requetes))
+    # Travail ajouté par le middleware des métriques, en % de la latence médiane
+    surcout = cout_instrumentation(nombre_sql) * 1000 / p50 * 100 if p50 else 0.0
+    return {
+        "premiere_ms": round(premiere * 1000, 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "requetes_sql": nombre_sql,
+        "memoire_pic_ko": round(pic / 1024),
+        "surcout_metriques_pct": round(float(surcout), 3),
+    }
+
+
+def _regressions(resultats, reference, seuil):
+    """Compare p95 et requêtes SQL à un rapport de référence (seuil en %)."""
+    regressions = []
+    for nom, mesure in resultats.items():
+        avant = reference.get("resultats", {}).get(nom)
+        if not avant:
+            continue
+        for champ in ("p95_ms", "requetes_sql"):
+            limite = avant[champ] * (1 + seuil / 100)
+            if mesure[champ] > limite and mesure[champ] > avant[champ]:
+                regressions.append(f"{nom} : {champ} {avant[champ]} -> {mesure[champ]}")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure les performances des principales vues et de l'importation sur un "
+        "jeu de données synthétique, dans une base de test, et écrit un rapport JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sites",
+            type=int,
+            default=1000,
+            help="Nombre de sites du jeu de données (ex. 1000, 50000, 500000 ; défaut : 1000)",
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=20, help="Exécutions mesurées par scénario (défaut : 20)"
+        )
+        parser.add_argument("--graine", type=int, default=42, help="Graine du jeu de données (défaut : 42)")
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            help="Ne mesurer que ce scénario (répétable)",
+        )
+        parser.add_argument(
+            "--sortie",
+            default="-",
+            help="Fichier du rapport JSON, ou - pour la sortie standard (défaut : -)",
+        )
+        parser.add_argument("--reference", help="Rapport JSON précédent, auquel comparer les mesures")
+        parser.add_argument(
+            "--seuil",
+            type=float,
+            default=20.0,
+            help="Hausse tolérée du p95 et du nombre de requêtes SQL, en %% (défaut : 20)",
+        )
+
+    def handle(self, *args, **options):
+        inconnus = set(options["scenario"] or ()) - set(SCENARIOS)
+        if inconnus:
+            raise CommandError(
+                f"Scénario(s) inconnu(s) : {', '.join(sorted(inconnus))} "
+                f"(disponibles : {', '.join(SCENARIOS)})"
+            )
+        reference = None
+        if options["reference"]:
+            with open(options["reference"], "r", encoding="utf-8") as fichier:
+                reference = json.load(fichier)
+            if reference.get("sites") != options["sites"]:
+                self.stderr.write(
+                    self.style.WARNING(
+                        f"⚠️  La référence porte sur {reference.get('sites')} sites, "
+                        f"la mesure sur {options['sites']}."
+                    )
+                )
+
+        # Base de test et cache dédiés : les données réelles ne sont pas touchées
+        setup_test_environment()
+        nom_base = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        dossier_cache = tempfile.mkdtemp(prefix="benchmark-cache-")
+        caches = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": dossier_cache,
+            }
+        }
+        try:
+            with override_settings(CACHES=caches):
+                rapport = self._executer(options)
+        finally:
+            connection.creation.destroy_test_db(nom_base, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(dossier_cache, ignore_errors=True)
+
+        texte = json.dumps(rapport, indent=2, ensure_ascii=False)
+        if options["sortie"] == "-":
+            self.stdout.write(texte)
+        else:
+            with open(options["sortie"], "w", encoding="utf-8") as fichier:
+                fichier.write(texte + "\n")
+            self.stderr.write(f"Rapport écrit dans {options['sortie']}.")
+
+        if reference is not None:
+            regressions = _regressions(rapport["resultats"], reference, options["seuil"])
+            if regressions:
+                raise CommandError(
+                    f"Régression(s) au-delà de {options['seuil']} % :\n" + "\n".join(regressions)
+                )
+            self.stderr.write(self.style.SUCCESS("✅ Aucune régression par rapport à la référence."))
+
+    def _executer(self, options):
+        debut = time.monotonic()
+        self.stderr.write(f"🏗️  Création de {options['sites']} sites (graine {options['graine']})...")
+        generer_jeu_essai(
+            options["sites"],
+            graine=options["graine"],
+            progression=lambda n: self.stderr.write(f"    {n} sites créés..."),
+        )
+        self.stderr.write(f"    Jeu de données prêt en {time.monotonic() - debut:.1f} s.")
+
+        scenarios = _scenarios()
+        resultats = {}
+        for nom in options["scenario"] or SCENARIOS:
+            self.stderr.write(f"⏱️  {nom}...")
+            resultats[nom] = _mesurer(scenarios[nom], max(options["iterations"], 1))
+            self.stderr.write(
+                f"    p50 {resultats[nom]['p50_ms']} ms, p95 {resultats[nom]['p95_ms']} ms, "
+                f"{resultats[nom]['requetes_sql']} requête(s) SQL, "
+                f"métriques {resultats[nom]['surcout_metriques_pct']} %"
+            )
+        return {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "base": connection.vendor,
+            "sites": options["sites"],
+            "graine": options["graine"],
+            "iterations": max(options["iterations"], 1),
+            "resultats": resultats,
+        }
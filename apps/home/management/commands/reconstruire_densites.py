@@ -0,0 +1,18 @@
+# apps/home/management/commands/reconstruire_densites.py
+from django.core.management.base import BaseCommand
+
+from apps.home.cache import invalider_sites
+from apps.home.densite import reconstruire_densites
+
+
+class Command(BaseCommand):
+    help = "Recalcule entièrement la grille de densité des sites (carte de chaleur)"
+
+    def handle(self, *args, **options):
+        nombre_lignes = reconstruire_densites()
+        invalider_sites()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Grille de densité reconstruite ({nombre_lignes} lignes)."
+            )
+        )
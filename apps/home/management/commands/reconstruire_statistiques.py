@@ -0,0 +1,18 @@
+# apps/home/management/commands/reconstruire_statistiques.py
+from django.core.management.base import BaseCommand
+
+from apps.home.cache import invalider_sites
+from apps.home.statistiques import reconstruire_statistiques
+
+
+class Command(BaseCommand):
+    help = "Recalcule entièrement la table d'agrégats des statistiques des sites"
+
+    def handle(self, *args, **options):
+        nombre_lignes = reconstruire_statistiques()
+        invalider_sites()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Table des statistiques reconstruite ({nombre_lignes} lignes)."
+            )
+        )
@@ -0,0 +1,71 @@
+# apps/home/management/commands/traiter_imports.py
+import multiprocessing
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.home.taches import boucle_worker, relancer_interrompus
+
+
+class Command(BaseCommand):
+    help = "Exécute les importations de fichiers en attente avec un pool de workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Nombre de processus workers (défaut : 1)"
+        )
+        parser.add_argument(
+            "--intervalle",
+            type=float,
+            default=2.0,
+            help="Secondes entre deux recherches de jobs en attente (défaut : 2)",
+        )
+        parser.add_argument(
+            "--une-fois",
+            action="store_true",
+            help="S'arrêter quand il n'y a plus de job en attente",
+        )
+        parser.add_argument(
+            "--relancer-interrompus",
+            action="store_true",
+            help="Remettre en attente les jobs restés en cours dont le worker est arrêté",
+        )
+        parser.add_argument(
+            "--delai-inactivite",
+            type=int,
+            default=30,
+            help=(
+                "Minutes sans activité après lesquelles un job en cours d'une autre "
+                "machine est considéré interrompu (défaut : 30)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["relancer_interrompus"]:
+            nombre = relancer_interrompus(timedelta(minutes=options["delai_inactivite"]))
+            self.stdout.write(f"{nombre} job(s) interrompu(s) remis en attente.")
+
+        workers = max(options["workers"], 1)
+        arguments = (options["intervalle"], options["une_fois"])
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Démarrage de {workers} worker(s) d'importation.")
+        )
+        if workers == 1:
+            boucle_worker(*arguments)
+            return
+
+        # Chaque processus ouvre ses propres connexions à la base
+        connections.close_all()
+        processus = [
+            multiprocessing.Process(target=boucle_worker, args=arguments, daemon=True)
+            for _ in range(workers)
+        ]
+        for p in processus:
+            p.start()
+        try:
+            for p in processus:
+                p.join()
+        except KeyboardInterrupt:
+            for p in processus:
+                p.terminate()
@@ -0,0 +1,373 @@
+# -*- encoding: utf-8 -*-
+"""
+Métriques des vues au format texte de Prometheus.
+
+Le middleware MetriquesMiddleware (voir middleware.py) enregistre, pour
+chaque requête HTTP et par nom de vue résolu (``home:site_list``…), la
+latence, le nombre et la durée des requêtes SQL, et les requêtes SQL
+répétées (symptôme des N+1 : la même requête exécutée pour chaque ligne
+d'une liste).
+
+Les métriques sont tenues en mémoire dans chaque processus, sans accès au
+cache ni à la base pendant la requête. Chaque processus en publie un
+instantané dans le cache Django au plus toutes les INTERVALLE_PUBLICATION
+secondes ; la vue ``/metrics`` fusionne les instantanés de tous les
+workers gunicorn, pour que Prometheus voie les mêmes totaux quel que soit le
+worker interrogé.
+
+Chaque processus publie sous sa propre clé, un emplacement numéroté qu'il
+réserve par ``cache.add``. Le nombre d'emplacements n'est changé que par
+``cache.incr`` : aucune liste partagée n'est réécrite, et un worker qui
+démarre ne peut pas en faire disparaître un autre de ``/metrics``.
+"""
+import hmac
+import ipaddress
+import logging
+import os
+import statistics
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+INTERVALLE_PUBLICATION = 15  # secondes
+# Un instantané non republié (worker arrêté) disparaît après ce délai
+DUREE_INSTANTANE = 300
+CLE_PROCESSUS = "home:metriques:processus"
+# Nombre d'emplacements numérotés 0, 1... réservés jusqu'ici
+CLE_EMPLACEMENTS = "home:metriques:emplacements"
+
+# Nom de vue des requêtes qui ne correspondent à aucune URL (404)
+VUE_NON_RESOLUE = "<non-resolue>"
+
+BORNES_LATENCE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BORNES_NOMBRE_SQL = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Nom -> (type, aide, bornes des histogrammes)
+DEFINITIONS = {
+    "http_requests_total": ("counter", "Nombre de requêtes HTTP par vue, méthode et statut", None),
+    "http_request_duration_seconds": ("histogram", "Latence des requêtes HTTP par vue", BORNES_LATENCE),
+    "db_queries_per_request": ("histogram", "Nombre de requêtes SQL par requête HTTP", BORNES_NOMBRE_SQL),
+    "db_queries_total": ("counter", "Nombre de requêtes SQL par vue", None),
+    "db_query_duration_seconds_total": ("counter", "Durée cumulée des requêtes SQL par vue", None),
+    "db_repeated_queries_total": (
+        "counter",
+        "Exécutions répétées d'une même requête SQL dans une requête HTTP (N+1), par vue",
+        None,
+    ),
+    "db_n_plus_one_requests_total": (
+        "counter",
+        "Requêtes HTTP ayant répété une même requête SQL au-delà du seuil, par vue",
+        None,
+    ),
+}
+
+class MesureSQL:
+    """
+    Enveloppe d'exécution SQL (``connection.execute_wrapper``) comptant les
+    requêtes d'une requête HTTP.
+
+    Seul le nécessaire est fait à chaque requête SQL : deux lectures
+    d'horloge et un compteur par texte SQL.
+    """
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+        self.textes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree += time.perf_counter() - debut
+            self.nombre += 1
+            self.textes[sql] += 1
+
+    def repetitions(self, seuil):
+        """
+        Retourne les requêtes SQL exécutées au moins ``seuil`` fois.
+
+        Les paramètres étant séparés du texte SQL, les exécutions d'une même
+        requête pour des lignes différentes ont le même texte.
+
+        Returns:
+            dict: Pour chaque texte SQL répété, son nombre d'exécutions.
+        """
+        if self.nombre < seuil:
+            return {}
+        return {sql: nombre for sql, nombre in self.textes.items() if nombre >= seuil}
+
+
+class Registre:
+    """Compteurs et histogrammes d'un processus."""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.compteurs = {}
+        self.histogrammes = {}
+        self.publie = 0.0
+        # (pid, numéro) de l'emplacement réservé par ce processus
+        self.emplacement = None
+        # Requêtes répétées déjà signalées dans le journal : (vue, texte SQL)
+        self.signalees = set()
+
+    def incrementer(self, nom, labels, valeur=1):
+        cle = (nom, labels)
+        self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def observer(self, nom, labels, valeur):
+        cle = (nom, labels)
+        histogramme = self.histogrammes.get(cle)
+        if histogramme is None:
+            histogramme = self.histogrammes[cle] = [[0] * (len(DEFINITIONS[nom][2]) + 1), 0.0]
+        # Compte non cumulé du premier intervalle contenant la valeur (le)
+        histogramme[0][bisect_left(DEFINITIONS[nom][2], valeur)] += 1
+        histogramme[1] += valeur
+
+    def enregistrer(self, vue, methode, statut, duree, mesure, seuil):
+        """
+        Enregistre une requête HTTP.
+
+        Args:
+            vue (str): Le nom de la vue résolue.
+            methode (str): La méthode HTTP.
+            statut (int): Le code de statut de la réponse.
+            duree (float): La latence en secondes.
+            mesure (MesureSQL): Les requêtes SQL de la requête.
+            seuil (int): Le nombre d'exécutions d'une même requête SQL à
+                partir duquel elle est comptée comme répétée.
+        """
+        repetitions = mesure.repetitions(seuil)
+        labels = (("view", vue),)
+        with self.verrou:
+            self.incrementer(
+                "http_requests_total", (("view", vue), ("method", methode), ("status", str(statut)))
+            )
+            self.observer("http_request_duration_seconds", labels, duree)
+            self.observer("db_queries_per_request", labels, mesure.nombre)
+            self.incrementer("db_queries_total", labels, mesure.nombre)
+            self.incrementer("db_query_duration_seconds_total", labels, mesure.duree)
+            if repetitions:
+                self.incrementer(
+                    "db_repeated_queries_total", labels, sum(n - 1 for n in repetitions.values())
+                )
+                self.incrementer("db_n_plus_one_requests_total", labels)
+            nouvelles = {sql for sql in repetitions if (vue, sql) not in self.signalees}
+            self.signalees.update((vue, sql) for sql in nouvelles)
+            a_publier = time.monotonic() - self.publie >= INTERVALLE_PUBLICATION
+            if a_publier:
+                self.publie = time.monotonic()
+
+        for sql in nouvelles:
+            logger.warning(
+                "Requête SQL répétée %s fois dans la vue %s (N+1 ?) : %s",
+                repetitions[sql],
+                vue,
+                sql,
+            )
+        if a_publier:
+            self.publier()
+
+    def instantane(self):
+        """Copie des compteurs et histogrammes."""
+        with self.verrou:
+            return {
+                "compteurs": dict(self.compteurs),
+                "histogrammes": {
+                    cle: (list(comptes), somme) for cle, (comptes, somme) in self.histogrammes.items()
+                },
+            }
+
+    def publier(self):
+        """
+        Publie l'instantané du processus dans le cache partagé, sous
+        l'emplacement réservé par le processus.
+
+        Un emplacement expiré (processus resté inactif plus de
+        DUREE_INSTANTANE secondes) a pu être repris par un autre processus :
+        un nouvel emplacement est alors réservé.
+        """
+        pid = os.getpid()
+        instantane = {**self.instantane(), "pid": pid}
+        # L'emplacement hérité d'un processus parent (fork) n'est pas le nôtre
+        if self.emplacement and self.emplacement[0] == pid:
+            cle = cle_emplacement(self.emplacement[1])
+            actuel = cache.get(cle)
+            if actuel is not None and actuel.get("pid") == pid:
+                cache.set(cle, instantane, DUREE_INSTANTANE)
+                # Compteur évincé du cache : ramené au-delà de l'emplacement
+                while nombre_emplacements() <= self.emplacement[1]:
+                    cache.add(CLE_EMPLACEMENTS, 0, None)
+                    cache.incr(CLE_EMPLACEMENTS)
+                return
+        self.emplacement = (pid, reserver_emplacement(instantane))
+
+
+def cle_emplacement(numero):
+    return f"{CLE_PROCESSUS}:{numero}"
+
+
+def nombre_emplacements():
+    return cache.get(CLE_EMPLACEMENTS) or 0
+
+
+def reserver_emplacement(instantane):
+    """
+    Réserve un emplacement libre en y publiant ``instantane``.
+
+    Les emplacements existants dont l'instantané a expiré sont réutilisés ;
+    à défaut, un nouvel emplacement est créé par ``cache.incr``. Chaque
+    réservation passe par ``cache.add`` : deux processus ne peuvent pas
+    obtenir le même emplacement.
+
+    Returns:
+        int: Le numéro de l'emplacement réservé.
+    """
+    nombre = nombre_emplacements()
+    occupes = cache.get_many([cle_emplacement(numero) for numero in range(nombre)])
+    for numero in range(nombre):
+        cle = cle_emplacement(numero)
+        if cle not in occupes and cache.add(cle, instantane, DUREE_INSTANTANE):
+            return numero
+    while True:
+        cache.add(CLE_EMPLACEMENTS, 0, None)
+        numero = cache.incr(CLE_EMPLACEMENTS) - 1
+        if cache.add(cle_emplacement(numero), instantane, DUREE_INSTANTANE):
+            return numero
+
+
+registre = Registre()
+
+
+def cout_instrumentation(nombre_sql, repetitions=200):
+    """
+    Mesure le travail ajouté par les métriques à une requête HTTP de
+    ``nombre_sql`` requêtes SQL : l'enveloppe d'exécution de chaque requête
+    SQL puis l'enregistrement de la requête HTTP, hors publication.
+
+    Les requêtes SQL ne sont pas exécutées : seul le surcoût est mesuré.
+
+    Returns:
+        float: La durée médiane en secondes.
+    """
+    local = Registre()
+    # Publication hors mesure : au plus une fois par INTERVALLE_PUBLICATION
+    local.publie = float("inf")
+    textes = [f"SELECT * FROM t{numero} WHERE id = %s" for numero in range(nombre_sql)]
+    executer = lambda sql, params, many, context: None
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        mesure = MesureSQL()
+        for sql in textes:
+            mesure(executer, sql, (1,), False, None)
+        local.enregistrer("mesure", "GET", 200, 0.01, mesure, 10)
+        durees.append(time.perf_counter() - debut)
+    return statistics.median(durees)
+
+
+def fusionner(instantanes):
+    """Additionne les instantanés de plusieurs processus."""
+    resultat = {"compteurs": {}, "histogrammes": {}}
+    for instantane in instantanes:
+        for cle, valeur in instantane["compteurs"].items():
+            resultat["compteurs"][cle] = resultat["compteurs"].get(cle, 0) + valeur
+        for cle, (comptes, somme) in instantane["histogrammes"].items():
+            cumul = resultat["histogrammes"].get(cle)
+            if cumul is None:
+                resultat["histogrammes"][cle] = (list(comptes), somme)
+            else:
+                resultat["histogrammes"][cle] = (
+                    [a + b for a, b in zip(cumul[0], comptes)],
+                    cumul[1] + somme,
+                )
+    return resultat
+
+
+def instantane_global():
+    """
+    Fusionne les instantanés de tous les processus (celui-ci compris, à jour).
+
+    Returns:
+        tuple: L'instantané fusionné et le nombre de processus.
+    """
+    registre.publier()
+    # Les emplacements expirés (workers arrêtés) sont absents du résultat
+    instantanes = cache.get_many([cle_emplacement(numero) for numero in range(nombre_emplacements())])
+    return fusionner(instantanes.values()), len(instantanes)
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in labels) + "}"
+
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def exposer(instantane, nombre_processus=1):
+    """
+    Encode un instantané au format texte de Prometheus (version 0.0.4).
+
+    Returns:
+        str: Le document, une métrique par bloc HELP/TYPE.
+    """
+    lignes = [
+        "# HELP metrics_processes Nombre de processus dont les métriques sont agrégées",
+        "# TYPE metrics_processes gauge",
+        f"metrics_processes {nombre_processus}",
+    ]
+    for nom, (type_metrique, aide, bornes) in DEFINITIONS.items():
+        lignes.append(f"# HELP {nom} {aide}")
+        lignes.append(f"# TYPE {nom} {type_metrique}")
+        if bornes is None:
+            for (cle_nom, labels), valeur in sorted(instantane["compteurs"].items()):
+                if cle_nom == nom:
+                    lignes.append(f"{nom}{_labels(labels)} {_nombre(valeur)}")
+            continue
+        for (cle_nom, labels), (comptes, somme) in sorted(instantane["histogrammes"].items()):
+            if cle_nom != nom:
+                continue
+            cumul = 0
+            for borne, compte in zip((*bornes, "+Inf"), comptes):
+                cumul += compte
+                le = borne if borne == "+Inf" else _nombre(float(borne))
+                lignes.append(f"{nom}_bucket{_labels((*labels, ('le', le)))} {cumul}")
+            lignes.append(f"{nom}_sum{_labels(labels)} {_nombre(float(somme))}")
+            lignes.append(f"{nom}_count{_labels(labels)} {cumul}")
+    return "\n".join(lignes) + "\n"
+
+
+def acces_autorise(request):
+    """
+    Indique si une requête peut lire les métriques : elle porte le jeton
+    METRICS_TOKEN, ou vient d'un réseau de METRICS_ALLOWED_NETWORKS.
+    """
+    jeton = settings.METRICS_TOKEN
+    autorisation = request.headers.get("Authorization", "")
+    if jeton and autorisation.startswith("Bearer "):
+        fourni = autorisation.removeprefix("Bearer ").strip()
+        if hmac.compare_digest(fourni.encode("utf-8"), jeton.encode("utf-8")):
+            return True
+    try:
+        adresse = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        adresse in ipaddress.ip_network(reseau.strip(), strict=False)
+        for reseau in settings.METRICS_ALLOWED_NETWORKS
+        if reseau.strip()
+    )
@@ -0,0 +1,40 @@
+# -*- encoding: utf-8 -*-
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metriques import VUE_NON_RESOLUE, MesureSQL, registre
+
+
+class MetriquesMiddleware:
+    """
+    Mesure la latence et les requêtes SQL de chaque requête HTTP, par vue
+    (voir metriques.py).
+
+    Les requêtes SQL exécutées pendant l'envoi d'une réponse en flux
+    (StreamingHttpResponse) ont lieu après le retour de la vue et ne sont
+    pas comptées.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.seuil = settings.METRICS_REPEATED_QUERY_THRESHOLD
+
+    def __call__(self, request):
+        mesure = MesureSQL()
+        debut = time.perf_counter()
+        with ExitStack() as pile:
+            for connexion in connections.all():
+                pile.enter_context(connexion.execute_wrapper(mesure))
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        resolution = getattr(request, "resolver_match", None)
+        vue = resolution.view_name if resolution else VUE_NON_RESOLUE
+        registre.enregistrer(vue, request.method, response.status_code, duree, mesure, self.seuil)
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:19
+
+import math
+
+from django.db import migrations, models
+
+# Grille de spatial.py à la création de la migration, recopiée ici : une
+# migration ne doit pas dépendre du code de l'application, qui peut changer
+TAILLE_CELLULE = 0.05
+NB_LIGNES = int(round(180 / TAILLE_CELLULE))
+NB_COLONNES = int(round(360 / TAILLE_CELLULE))
+
+
+def cellule_grille(lat, lon):
+    ligne = int(math.floor((float(lat) + 90) / TAILLE_CELLULE))
+    colonne = int(math.floor((float(lon) + 180) / TAILLE_CELLULE))
+    # Les bords +90 / +180 appartiennent à la dernière cellule
+    ligne = min(max(ligne, 0), NB_LIGNES - 1)
+    colonne = min(max(colonne, 0), NB_COLONNES - 1)
+    return ligne * NB_COLONNES + colonne
+
+
+def remplir_cellules(apps, schema_editor):
+    Site = apps.get_model("home", "Site")
+    sites = Site.objects.exclude(latitude=None).exclude(longitude=None)
+    a_jour = []
+    for site in sites.only("id", "latitude", "longitude").iterator(chunk_size=2000):
+        site.cellule_grille = cellule_grille(site.latitude, site.longitude)
+        a_jour.append(site)
+        if len(a_jour) >= 2000:
+            Site.objects.bulk_update(a_jour, ["cellule_grille"])
+            a_jour = []
+    if a_jour:
+        Site.objects.bulk_update(a_jour, ["cellule_grille"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0002_alter_commune_nom'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='cellule_grille',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Cellule de grille'),
+        ),
+        migrations.RunPython(remplir_cellules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import TruncMonth
+
+
+def remplir_statistiques(apps, schema_editor):
+    # Agrégation de statistiques.py à la création de la migration
+    Site = apps.get_model("home", "Site")
+    StatistiqueSite = apps.get_model("home", "StatistiqueSite")
+    lignes = (
+        Site.objects.annotate(
+            etat=Case(
+                When(conformite__isnull=True, then=Value("sans-rapport")),
+                When(conformite__statut=True, then=Value("conforme")),
+                default=Value("non-conforme"),
+            )
+        )
+        .values(
+            "etat",
+            "operateur_id",
+            departement_id=F("localite__commune__departement"),
+            commune_id=F("localite__commune"),
+            mois=TruncMonth("date_autorisation"),
+        )
+        .annotate(nombre=Count("id"))
+        .order_by()
+    )
+    StatistiqueSite.objects.bulk_create(
+        [StatistiqueSite(**ligne) for ligne in lignes], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_site_cellule_grille'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueSite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField(blank=True, null=True, verbose_name="Mois d'autorisation")),
+                ('etat', models.CharField(choices=[('conforme', 'Conforme'), ('non-conforme', 'Non conforme'), ('sans-rapport', 'Sans rapport')], max_length=20, verbose_name='État de conformité')),
+                ('nombre', models.IntegerField(default=0, verbose_name='Nombre de sites')),
+                ('commune', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='home.commune', verbose_name='Commune')),
+                ('departement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='home.departement', verbose_name='Département')),
+                ('operateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='home.operateur', verbose_name='Opérateur')),
+            ],
+            options={
+                'verbose_name': 'Statistique des sites',
+                'verbose_name_plural': 'Statistiques des sites',
+                'indexes': [models.Index(fields=['mois', 'operateur'], name='statistique_mois_operateur')],
+            },
+        ),
+        migrations.RunPython(remplir_statistiques, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:31
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+# Index plein texte de recherche.py à la création de la migration, recopié
+# ici : une migration ne doit pas dépendre du code de l'application
+TAILLE_LOT = 2000
+TSVECTOR = (
+    "setweight(to_tsvector('simple', texte_nom), 'A') || "
+    "setweight(to_tsvector('simple', texte_lieu), 'B') || "
+    "setweight(to_tsvector('simple', texte_autres), 'C')"
+)
+
+
+def normaliser_texte(texte):
+    if not texte:
+        return ""
+    texte = "".join(
+        c for c in unicodedata.normalize("NFD", str(texte).lower()) if unicodedata.category(c) != "Mn"
+    )
+    return " ".join(re.findall(r"[a-z0-9]+", texte))
+
+
+def sql_creation_index(vendor, table):
+    fts = f"{table}_fts"
+    if vendor == "sqlite":
+        colonnes = "texte_nom, texte_lieu, texte_autres"
+        anciennes = "old.texte_nom, old.texte_lieu, old.texte_autres"
+        nouvelles = "new.texte_nom, new.texte_lieu, new.texte_autres"
+        supprimer = (
+            f"INSERT INTO {fts}({fts}, rowid, {colonnes}) "
+            f"VALUES ('delete', old.site_id, {anciennes});"
+        )
+        inserer = f"INSERT INTO {fts}(rowid, {colonnes}) VALUES (new.site_id, {nouvelles});"
+        return [
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({colonnes}, "
+            f"content='{table}', content_rowid='site_id', prefix='2 3')",
+            f"CREATE TRIGGER {table}_ai AFTER INSERT ON {table} BEGIN {inserer} END",
+            f"CREATE TRIGGER {table}_ad AFTER DELETE ON {table} BEGIN {supprimer} END",
+            f"CREATE TRIGGER {table}_au AFTER UPDATE ON {table} BEGIN {supprimer} {inserer} END",
+        ]
+    if vendor == "postgresql":
+        return [f"CREATE INDEX {fts} ON {table} USING GIN (({TSVECTOR}))"]
+    return []
+
+
+def sql_suppression_index(vendor, table):
+    fts = f"{table}_fts"
+    if vendor == "sqlite":
+        return [
+            f"DROP TRIGGER IF EXISTS {table}_{suffixe}" for suffixe in ("ai", "ad", "au")
+        ] + [f"DROP TABLE IF EXISTS {fts}"]
+    if vendor == "postgresql":
+        return [f"DROP INDEX IF EXISTS {fts}"]
+    return []
+
+
+def creer_index_plein_texte(apps, schema_editor):
+    Site = apps.get_model("home", "Site")
+    IndexRechercheSite = apps.get_model("home", "IndexRechercheSite")
+    for requete in sql_creation_index(
+        schema_editor.connection.vendor, IndexRechercheSite._meta.db_table
+    ):
+        schema_editor.execute(requete)
+
+    lignes = Site.objects.values(
+        "id",
+        "nom",
+        "description",
+        "proprietaire",
+        operateur_nom=F("operateur__nom"),
+        localite_nom=F("localite__localite"),
+        commune_nom=F("localite__commune__nom"),
+        departement_nom=F("localite__commune__departement__nom"),
+    )
+    lot = []
+    for ligne in lignes.iterator(chunk_size=TAILLE_LOT):
+        lieu = [ligne["localite_nom"], ligne["commune_nom"], ligne["departement_nom"]]
+        autres = [ligne["operateur_nom"], ligne["proprietaire"], ligne["description"]]
+        lot.append(
+            IndexRechercheSite(
+                site_id=ligne["id"],
+                nom=ligne["nom"],
+                description=ligne["description"],
+                localite=", ".join(lieu) if ligne["localite_nom"] else "",
+                operateur=ligne["operateur_nom"],
+                texte_nom=normaliser_texte(ligne["nom"]),
+                texte_lieu=" ".join(normaliser_texte(t) for t in lieu if t),
+                texte_autres=" ".join(normaliser_texte(t) for t in autres if t),
+            )
+        )
+        if len(lot) >= TAILLE_LOT:
+            IndexRechercheSite.objects.bulk_create(lot)
+            lot = []
+    IndexRechercheSite.objects.bulk_create(lot)
+
+
+def supprimer_index_plein_texte(apps, schema_editor):
+    IndexRechercheSite = apps.get_model("home", "IndexRechercheSite")
+    for requete in sql_suppression_index(
+        schema_editor.connection.vendor, IndexRechercheSite._meta.db_table
+    ):
+        schema_editor.execute(requete)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_statistiquesite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexRechercheSite',
+            fields=[
+                ('site', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='index_recherche', serialize=False, to='home.site', verbose_name='Site')),
+                ('nom', models.CharField(max_length=255, verbose_name='Nom du site')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Description')),
+                ('localite', models.CharField(blank=True, max_length=800, verbose_name='Localité')),
+                ('operateur', models.CharField(max_length=255, verbose_name='Opérateur')),
+                ('texte_nom', models.TextField(verbose_name='Texte du nom')),
+                ('texte_lieu', models.TextField(verbose_name='Texte du lieu')),
+                ('texte_autres', models.TextField(verbose_name='Autres textes')),
+            ],
+            options={
+                'verbose_name': 'Index de recherche des sites',
+                'verbose_name_plural': 'Index de recherche des sites',
+            },
+        ),
+        migrations.RunPython(creer_index_plein_texte, supprimer_index_plein_texte),
+    ]
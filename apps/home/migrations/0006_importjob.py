@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0005_indexrecherchesite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statut', models.CharField(choices=[('en-attente', 'En attente'), ('en-cours', 'En cours'), ('termine', 'Terminé'), ('echec', 'Échec')], db_index=True, default='en-attente', max_length=20, verbose_name='Statut')),
+                ('lignes_traitees', models.IntegerField(default=0, verbose_name='Lignes traitées')),
+                ('lignes_en_erreur', models.IntegerField(default=0, verbose_name='Lignes en erreur')),
+                ('erreurs', models.JSONField(blank=True, default=list, verbose_name='Erreurs')),
+                ('message', models.TextField(blank=True, default='', verbose_name='Message')),
+                ('worker', models.CharField(blank=True, default='', max_length=255, verbose_name='Worker')),
+                ('cree_le', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('debut', models.DateTimeField(blank=True, null=True, verbose_name='Début')),
+                ('fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('fichier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imports', to='home.uploadedfile', verbose_name='Fichier')),
+            ],
+            options={
+                'verbose_name': 'Importation',
+                'verbose_name_plural': 'Importations',
+                'ordering': ['cree_le'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='rapport',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Rapport'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='simulation',
+            field=models.BooleanField(default=False, verbose_name='Simulation'),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='empreinte_import',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name="Empreinte d'importation"),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:19
+
+import math
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Grille de densité de densite.py à la création de la migration, recopiée
+# ici : une migration ne doit pas dépendre du code de l'application
+SUD, OUEST, NORD, EST = 6.0, 0.6, 12.5, 4.0
+PAS_DENSITE = 0.02
+NB_LIGNES_DENSITE = int(round((NORD - SUD) / PAS_DENSITE))
+NB_COLONNES_DENSITE = int(round((EST - OUEST) / PAS_DENSITE))
+
+
+def cellule_densite(lat, lon):
+    """La cellule de densité d'un point, ou None hors de la grille."""
+    ligne = math.floor((float(lat) - SUD) / PAS_DENSITE)
+    colonne = math.floor((float(lon) - OUEST) / PAS_DENSITE)
+    if 0 <= ligne < NB_LIGNES_DENSITE and 0 <= colonne < NB_COLONNES_DENSITE:
+        return ligne * NB_COLONNES_DENSITE + colonne
+    return None
+
+
+def remplir_densites(apps, schema_editor):
+    Site = apps.get_model("home", "Site")
+    SiteTechnologie = apps.get_model("home", "SiteTechnologie")
+    DensiteSite = apps.get_model("home", "DensiteSite")
+
+    cellules = {}
+    operateurs = Counter()
+    sites = Site.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+        "id", "operateur_id", "latitude", "longitude"
+    )
+    for site_id, operateur_id, latitude, longitude in sites.iterator(chunk_size=10000):
+        cellule = cellule_densite(latitude, longitude)
+        if cellule is not None:
+            cellules[site_id] = cellule
+            operateurs[operateur_id, cellule] += 1
+
+    technologies = Counter()
+    liens = SiteTechnologie.objects.values_list("site_id", "technologie_id")
+    for site_id, technologie_id in liens.iterator(chunk_size=10000):
+        if site_id in cellules:
+            technologies[technologie_id, cellules[site_id]] += 1
+
+    DensiteSite.objects.bulk_create(
+        [
+            DensiteSite(operateur_id=operateur_id, cellule=cellule, nombre=nombre)
+            for (operateur_id, cellule), nombre in operateurs.items()
+        ]
+        + [
+            DensiteSite(technologie_id=technologie_id, cellule=cellule, nombre=nombre)
+            for (technologie_id, cellule), nombre in technologies.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_site_empreinte_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DensiteSite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cellule', models.IntegerField(verbose_name='Cellule de la grille de densité')),
+                ('nombre', models.IntegerField(default=0, verbose_name='Nombre de sites')),
+                ('operateur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='home.operateur', verbose_name='Opérateur')),
+                ('technologie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='home.technologie', verbose_name='Technologie')),
+            ],
+            options={
+                'verbose_name': 'Densité des sites',
+                'verbose_name_plural': 'Densités des sites',
+                'indexes': [models.Index(fields=['operateur', 'cellule'], name='densite_operateur_cellule'), models.Index(fields=['technologie', 'cellule'], name='densite_technologie_cellule')],
+            },
+        ),
+        migrations.RunPython(remplir_densites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_densitesite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operateur',
+            name='logo_derives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Dérivés du logo'),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='photo_derives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Dérivés de la photo'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_derives_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='actif_le',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Dernière activité'),
+        ),
+    ]
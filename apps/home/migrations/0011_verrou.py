@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_importjob_actif_le'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Verrou',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100, unique=True, verbose_name='Nom')),
+                ('pris_le', models.DateTimeField(blank=True, null=True, verbose_name='Pris le')),
+            ],
+            options={
+                'verbose_name': 'Verrou',
+                'verbose_name_plural': 'Verrous',
+            },
+        ),
+    ]
@@ -1,17 +1,32 @@
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 import PyPDF2
 
+from .images import urls_derive
+from .spatial import cellule_grille
+
 # Models pour les opérateurs
 class Operateur(models.Model):
     """Modèle représentant un opérateur de télécommunication."""
     nom = models.CharField(max_length=255, unique=True, verbose_name="Nom de l'opérateur")
     logo = models.ImageField(upload_to='Operateurs/', blank=True, null=True, verbose_name="Logo de l'opérateur")
     couleur = models.CharField(max_length=50, blank=True, null=True, verbose_name="Couleur de l'opérateur")
+    # Versions redimensionnées du logo (voir images.py)
+    logo_derives = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Dérivés du logo")
 
     def __str__(self):
         return self.nom
 
+    @property
+    def logo_marqueur(self):
+        """URL du logo à la taille des marqueurs de la carte (``webp``, ``jpeg``)."""
+        return urls_derive(self.logo, self.logo_derives, "marqueur")
+
+    @property
+    def logo_vignette(self):
+        return urls_derive(self.logo, self.logo_derives, "vignette")
+
     class Meta:
         ordering = ['nom']
         verbose_name = "Opérateur"
@@ -105,10 +120,38 @@ class Site(models.Model):
     observation = models.TextField(blank=True, null=True, verbose_name="Observation")
     avis_arcep = models.TextField(blank=True, null=True, verbose_name="Avis ARCEP")
     date_autorisation = models.DateField(blank=True, null=True, verbose_name="Date d'autorisation")
+    cellule_grille = models.IntegerField(blank=True, null=True, db_index=True, editable=False, verbose_name="Cellule de grille")
+    # Empreinte de la dernière ligne importée (voir importation.py)
+    empreinte_import = models.CharField(max_length=32, blank=True, default="", editable=False, verbose_name="Empreinte d'importation")
+    # Versions redimensionnées de la photo (voir images.py)
+    photo_derives = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Dérivés de la photo")
+
+    def save(self, *args, **kwargs):
+        # Maintient l'index spatial en grille à jour avec les coordonnées
+        self.cellule_grille = cellule_grille(self.latitude, self.longitude)
+        # Une modification hors importation rend le site différent de la
+        # dernière ligne importée : la prochaine importation le réécrira
+        self.empreinte_import = ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields) | {"empreinte_import"}
+            if {"latitude", "longitude"} & update_fields:
+                update_fields.add("cellule_grille")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.nom
 
+    @property
+    def photo_vignette(self):
+        """URL de la photo en vignette (``webp``, ``jpeg``)."""
+        return urls_derive(self.photo, self.photo_derives, "vignette")
+
+    @property
+    def photo_detail(self):
+        return urls_derive(self.photo, self.photo_derives, "detail")
+
     class Meta:
         verbose_name = "Site"
         verbose_name_plural = "Sites"
@@ -156,4 +199,120 @@ class SiteTechnologie(models.Model):
 class UploadedFile(models.Model):
     file = models.FileField(upload_to='Uploads/excel/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    
\ No newline at end of file
+
+# Importation d'un fichier téléversé, exécutée par la commande traiter_imports
+class ImportJob(models.Model):
+    EN_ATTENTE = 'en-attente'
+    EN_COURS = 'en-cours'
+    TERMINE = 'termine'
+    ECHEC = 'echec'
+    STATUT_CHOICES = [
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (TERMINE, 'Terminé'),
+        (ECHEC, 'Échec'),
+    ]
+
+    fichier = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name="imports", verbose_name="Fichier")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default=EN_ATTENTE, db_index=True, verbose_name="Statut")
+    lignes_traitees = models.IntegerField(default=0, verbose_name="Lignes traitées")
+    lignes_en_erreur = models.IntegerField(default=0, verbose_name="Lignes en erreur")
+    erreurs = models.JSONField(default=list, blank=True, verbose_name="Erreurs")
+    message = models.TextField(blank=True, default="", verbose_name="Message")
+    worker = models.CharField(max_length=255, blank=True, default="", verbose_name="Worker")
+    cree_le = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
+    debut = models.DateTimeField(blank=True, null=True, verbose_name="Début")
+    # Mis à jour par le worker à chaque lot : un job en cours sans activité
+    # récente a été interrompu
+    actif_le = models.DateTimeField(blank=True, null=True, verbose_name="Dernière activité")
+    fin = models.DateTimeField(blank=True, null=True, verbose_name="Fin")
+    # Simulation : le fichier est comparé aux sites existants sans rien écrire
+    simulation = models.BooleanField(default=False, verbose_name="Simulation")
+    rapport = models.JSONField(default=dict, blank=True, verbose_name="Rapport")
+
+    @property
+    def debit(self):
+        """Nombre de lignes traitées par seconde."""
+        if not self.debut:
+            return 0
+        duree = ((self.fin or timezone.now()) - self.debut).total_seconds()
+        return self.lignes_traitees / duree if duree > 0 else 0
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.get_statut_display()})"
+
+    class Meta:
+        ordering = ['cree_le']
+        verbose_name = "Importation"
+        verbose_name_plural = "Importations"
+    
+# Table d'agrégats des sites pour les statistiques, tenue à jour par signaux
+class StatistiqueSite(models.Model):
+    ETAT_CHOICES = [
+        ('conforme', 'Conforme'),
+        ('non-conforme', 'Non conforme'),
+        ('sans-rapport', 'Sans rapport'),
+    ]
+
+    operateur = models.ForeignKey(Operateur, on_delete=models.CASCADE, verbose_name="Opérateur")
+    departement = models.ForeignKey(Departement, blank=True, null=True, on_delete=models.CASCADE, verbose_name="Département")
+    commune = models.ForeignKey(Commune, blank=True, null=True, on_delete=models.CASCADE, verbose_name="Commune")
+    mois = models.DateField(blank=True, null=True, verbose_name="Mois d'autorisation")
+    etat = models.CharField(max_length=20, choices=ETAT_CHOICES, verbose_name="État de conformité")
+    nombre = models.IntegerField(default=0, verbose_name="Nombre de sites")
+
+    class Meta:
+        # Pas de contrainte d'unicité : les lignes sont toujours sommées, un
+        # doublon créé par deux écritures concurrentes reste donc sans effet.
+        indexes = [
+            models.Index(fields=['mois', 'operateur'], name='statistique_mois_operateur'),
+        ]
+        verbose_name = "Statistique des sites"
+        verbose_name_plural = "Statistiques des sites"
+
+# Grille de densité des sites (carte de chaleur, voir densite.py), tenue à jour par signaux
+class DensiteSite(models.Model):
+    # Une ligne compte les sites d'une cellule pour un opérateur, ou pour une
+    # technologie : exactement l'un des deux est renseigné.
+    operateur = models.ForeignKey(Operateur, blank=True, null=True, on_delete=models.CASCADE, verbose_name="Opérateur")
+    technologie = models.ForeignKey(Technologie, blank=True, null=True, on_delete=models.CASCADE, verbose_name="Technologie")
+    cellule = models.IntegerField(verbose_name="Cellule de la grille de densité")
+    nombre = models.IntegerField(default=0, verbose_name="Nombre de sites")
+
+    class Meta:
+        # Comme pour StatistiqueSite, les lignes sont sommées par cellule
+        indexes = [
+            models.Index(fields=['operateur', 'cellule'], name='densite_operateur_cellule'),
+            models.Index(fields=['technologie', 'cellule'], name='densite_technologie_cellule'),
+        ]
+        verbose_name = "Densité des sites"
+        verbose_name_plural = "Densités des sites"
+
+# Index de recherche dénormalisé des sites (voir recherche.py)
+class IndexRechercheSite(models.Model):
+    site = models.OneToOneField(Site, primary_key=True, on_delete=models.CASCADE, related_name="index_recherche", verbose_name="Site")
+    # Champs affichés dans les résultats, sans jointure
+    nom = models.CharField(max_length=255, verbose_name="Nom du site")
+    description = models.TextField(blank=True, null=True, verbose_name="Description")
+    localite = models.CharField(max_length=800, blank=True, verbose_name="Localité")
+    operateur = models.CharField(max_length=255, verbose_name="Opérateur")
+    # Textes normalisés (minuscules, sans accents) indexés en plein texte
+    texte_nom = models.TextField(verbose_name="Texte du nom")
+    texte_lieu = models.TextField(verbose_name="Texte du lieu")
+    texte_autres = models.TextField(verbose_name="Autres textes")
+
+    class Meta:
+        verbose_name = "Index de recherche des sites"
+        verbose_name_plural = "Index de recherche des sites"
+
+# Verrou applicatif : une ligne par traitement à ne pas exécuter deux fois en même temps
+class Verrou(models.Model):
+    nom = models.CharField(max_length=100, unique=True, verbose_name="Nom")
+    pris_le = models.DateTimeField(blank=True, null=True, verbose_name="Pris le")
+
+    def __str__(self):
+        return self.nom
+
+    class Meta:
+        verbose_name = "Verrou"
+        verbose_name_plural = "Verrous"
@@ -0,0 +1,96 @@
+# -*- encoding: utf-8 -*-
+"""
+Pagination par clé (keyset) pour les tableaux servis en JSON.
+
+Au lieu d'un OFFSET, dont le coût croît avec le numéro de page, chaque page
+est lue à partir de la dernière ligne de la page précédente : le curseur
+contient la valeur de la colonne de tri et l'identifiant de cette ligne.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+TAILLE_PAGE_DEFAUT = 20
+TAILLE_PAGE_MAX = 100
+
+
+def encoder_curseur(valeur, identifiant):
+    """Encode (valeur de tri, id) en un curseur opaque pour l'URL."""
+    brut = json.dumps([valeur, identifiant], default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(brut.encode("utf-8")).decode("ascii")
+
+
+def decoder_curseur(curseur):
+    """
+    Décode un curseur produit par encoder_curseur.
+
+    Raises:
+        ValueError: Si le curseur est invalide, y compris s'il a été modifié
+            pour ne plus contenir une valeur de tri simple et un id entier.
+    """
+    try:
+        valeur, identifiant = json.loads(base64.urlsafe_b64decode(curseur.encode("ascii")))
+        if not isinstance(valeur, (str, int, float)) or isinstance(identifiant, bool):
+            raise TypeError
+        return valeur, int(identifiant)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Curseur de pagination invalide.")
+
+
+def parse_taille_page(valeur):
+    """Analyse la taille de page demandée, bornée à TAILLE_PAGE_MAX."""
+    if not valeur:
+        return TAILLE_PAGE_DEFAUT
+    if not str(valeur).isdigit():
+        raise ValueError(f"Taille de page invalide : {valeur}")
+    return min(max(int(valeur), 1), TAILLE_PAGE_MAX)
+
+
+def page_keyset(lignes, cle, descendant=False, apres=None, avant=None, taille=TAILLE_PAGE_DEFAUT):
+    """
+    Lit une page d'un QuerySet de dictionnaires trié sur (cle, id).
+
+    Args:
+        lignes (QuerySet): Un QuerySet ``values()`` contenant ``cle`` et ``id``.
+            La colonne ``cle`` ne doit pas contenir de NULL.
+        cle (str): Le nom de la colonne de tri.
+        descendant (bool): Tri décroissant.
+        apres (str | None): Curseur de la dernière ligne de la page précédente.
+        avant (str | None): Curseur de la première ligne de la page suivante.
+        taille (int): Nombre de lignes par page.
+
+    Returns:
+        dict: ``lignes`` de la page, curseurs ``suivant`` / ``precedent``
+        (None en bout de tableau).
+    """
+    # Lire « avant » un curseur revient à parcourir le tri dans l'autre sens
+    en_arriere = avant is not None
+    curseur = avant if en_arriere else apres
+    sens_inverse = descendant != en_arriere
+
+    if curseur:
+        valeur, identifiant = decoder_curseur(curseur)
+        suivant = "lt" if sens_inverse else "gt"
+        lignes = lignes.filter(
+            Q(**{f"{cle}__{suivant}": valeur})
+            | Q(**{cle: valeur, f"id__{suivant}": identifiant})
+        )
+
+    prefixe = "-" if sens_inverse else ""
+    page = list(lignes.order_by(f"{prefixe}{cle}", f"{prefixe}id")[: taille + 1])
+    encore = len(page) > taille
+    page = page[:taille]
+    if en_arriere:
+        page.reverse()
+
+    def curseur_de(ligne):
+        return encoder_curseur(ligne[cle], ligne["id"])
+
+    a_suivant = encore if not en_arriere else True
+    a_precedent = encore if en_arriere else bool(curseur)
+    return {
+        "lignes": page,
+        "suivant": curseur_de(page[-1]) if page and a_suivant else None,
+        "precedent": curseur_de(page[0]) if page and a_precedent else None,
+    }
@@ -0,0 +1,263 @@
+# -*- encoding: utf-8 -*-
+"""
+Recherche de proximité des sites : dans un rayon, ou les k plus proches.
+
+Les coordonnées de tous les sites sont gardées en mémoire, dans des
+tableaux NumPy triés par cellule de la grille de spatial.py (la même que
+``Site.cellule_grille``) : les sites d'une ligne de la grille sont
+contigus, et une emprise se traduit par une tranche par ligne, trouvée par
+recherche dichotomique. Seuls les sites de ces tranches sont filtrés
+(opérateur, technologie) puis mesurés (distance de haversine).
+
+L'index est construit une fois par processus, à la première recherche.
+Quand la version des positions change (voir cache.version_positions),
+c'est-à-dire après une écriture de coordonnées, d'opérateur ou de
+technologies dans n'importe quel processus, il est reconstruit dans un
+thread en arrière-plan : les requêtes continuent d'utiliser l'index
+précédent jusqu'à ce que le nouveau le remplace.
+"""
+import logging
+import math
+import threading
+
+import numpy as np
+from django.db import connections
+
+from .cache import version_positions
+from .models import Site, SiteTechnologie
+from .spatial import NB_COLONNES, TAILLE_CELLULE, ligne_colonne
+
+RAYON_TERRE = 6_371_008.8  # mètres (rayon moyen)
+RAYON_MAX = 100_000  # mètres
+K_MAX = 100
+LIMITE_DEFAUT = 100
+LIMITE_MAX = 1000
+NB_LIGNES = int(round(180 / TAILLE_CELLULE))
+
+logger = logging.getLogger(__name__)
+
+_verrou = threading.Lock()
+_index = None
+_version = None
+# Thread de reconstruction en cours, s'il y en a un
+_reconstruction = None
+
+
+def haversine(lat, lon, latitudes, longitudes):
+    """
+    Distances en mètres entre un point et des points, en degrés.
+
+    Args:
+        lat, lon (float): Le point de départ.
+        latitudes, longitudes (array): Les points d'arrivée.
+    """
+    phi1 = math.radians(lat)
+    phi2 = np.radians(latitudes)
+    dphi = phi2 - phi1
+    dlambda = np.radians(longitudes - lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * RAYON_TERRE * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class IndexProximite:
+    """Coordonnées des sites, triées par cellule de grille."""
+
+    def __init__(self, ids, latitudes, longitudes, operateurs, technologies=None):
+        """
+        Args:
+            ids, latitudes, longitudes, operateurs (array): Un élément par site.
+            technologies (dict): Pour chaque id de technologie, les ids des
+                sites qui la proposent.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        lignes = np.clip(np.floor((latitudes + 90) / TAILLE_CELLULE), 0, NB_LIGNES - 1)
+        colonnes = np.clip(np.floor((longitudes + 180) / TAILLE_CELLULE), 0, NB_COLONNES - 1)
+        cellules = (lignes * NB_COLONNES + colonnes).astype(np.int64)
+
+        ordre = np.argsort(cellules, kind="stable")
+        self.cellules = cellules[ordre]
+        self.ids = np.asarray(ids, dtype=np.int64)[ordre]
+        self.latitudes = latitudes[ordre]
+        self.longitudes = longitudes[ordre]
+        self.operateurs = np.asarray(operateurs, dtype=np.int64)[ordre]
+        # Par technologie, le masque des sites (dans l'ordre de l'index)
+        self.technologies = {
+            technologie: np.isin(self.ids, list(site_ids))
+            for technologie, site_ids in (technologies or {}).items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def depuis_base(cls):
+        """Construit l'index à partir des sites ayant des coordonnées."""
+        lignes = (
+            Site.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            .order_by()
+            .values_list("id", "latitude", "longitude", "operateur_id")
+        )
+        colonnes = list(zip(*lignes.iterator(chunk_size=10000))) or [(), (), (), ()]
+        ids, latitudes, longitudes, operateurs = colonnes
+        technologies = {}
+        for site_id, technologie_id in SiteTechnologie.objects.values_list(
+            "site_id", "technologie_id"
+        ).iterator(chunk_size=10000):
+            technologies.setdefault(technologie_id, []).append(site_id)
+        return cls(
+            ids,
+            np.array(latitudes, dtype=float),
+            np.array(longitudes, dtype=float),
+            operateurs,
+            technologies,
+        )
+
+    def _positions_emprise(self, sud, ouest, nord, est):
+        """Positions des sites des cellules couvrant l'emprise."""
+        ligne_min, colonne_min = ligne_colonne(sud, ouest)
+        ligne_max, colonne_max = ligne_colonne(nord, est)
+        debuts_lignes = np.arange(ligne_min, ligne_max + 1, dtype=np.int64) * NB_COLONNES
+        debuts = np.searchsorted(self.cellules, debuts_lignes + colonne_min, side="left")
+        fins = np.searchsorted(self.cellules, debuts_lignes + colonne_max, side="right")
+        longueurs = fins - debuts
+        total = int(longueurs.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        # Concaténation des intervalles [debut, fin) sans boucle Python
+        decalages = np.repeat(debuts - np.cumsum(longueurs) + longueurs, longueurs)
+        return decalages + np.arange(total)
+
+    def _filtrer(self, positions, operateurs=None, exclure_operateurs=None, technologies=None):
+        if operateurs:
+            positions = positions[np.isin(self.operateurs[positions], operateurs)]
+        if exclure_operateurs:
+            positions = positions[~np.isin(self.operateurs[positions], exclure_operateurs)]
+        for technologie in technologies or ():
+            masque = self.technologies.get(technologie)
+            if masque is None:
+                return positions[:0]
+            positions = positions[masque[positions]]
+        return positions
+
+    def dans_rayon(self, lat, lon, rayon, **filtres):
+        """
+        Sites à moins de ``rayon`` mètres d'un point, du plus proche au plus
+        éloigné.
+
+        Args:
+            lat, lon (float): Le point, en degrés.
+            rayon (float): Le rayon en mètres.
+            **filtres: ``operateurs``, ``exclure_operateurs`` (ids
+                d'opérateurs) et ``technologies`` (ids de technologies,
+                toutes requises).
+
+        Returns:
+            tuple: Les ids des sites et leurs distances en mètres.
+        """
+        dlat = math.degrees(rayon / RAYON_TERRE)
+        sud, nord = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        cos_max = math.cos(math.radians(max(abs(sud), abs(nord))))
+        if cos_max < 1e-9 or rayon / (RAYON_TERRE * cos_max) >= math.pi:
+            ouest, est = -180.0, 180.0
+        else:
+            dlon = math.degrees(rayon / (RAYON_TERRE * cos_max))
+            # Pas de recherche de part et d'autre de l'antiméridien
+            ouest, est = max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+        positions = self._filtrer(self._positions_emprise(sud, ouest, nord, est), **filtres)
+        distances = haversine(lat, lon, self.latitudes[positions], self.longitudes[positions])
+        proches = distances <= rayon
+        positions, distances = positions[proches], distances[proches]
+        ordre = np.argsort(distances, kind="stable")
+        return self.ids[positions[ordre]], distances[ordre]
+
+    def plus_proches(self, lat, lon, k, **filtres):
+        """
+        Les ``k`` sites les plus proches d'un point.
+
+        Le rayon de recherche part d'une cellule de grille et est multiplié
+        par 4 jusqu'à contenir ``k`` sites : tous les sites du rayon étant
+        mesurés, les ``k`` plus proches en font alors partie.
+
+        Returns:
+            tuple: Les ids des sites et leurs distances en mètres.
+        """
+        rayon = math.radians(TAILLE_CELLULE) * RAYON_TERRE
+        while True:
+            ids, distances = self.dans_rayon(lat, lon, rayon, **filtres)
+            if len(ids) >= k or rayon >= math.pi * RAYON_TERRE:
+                return ids[:k], distances[:k]
+            rayon *= 4
+
+
+def _reconstruire(version):
+    """Construit l'index de la version ``version`` puis remplace l'index courant."""
+    global _index, _version, _reconstruction
+    try:
+        index = IndexProximite.depuis_base()
+        with _verrou:
+            _index, _version = index, version
+        logger.info(f"Index de proximité reconstruit : {len(index)} site(s).")
+    except Exception:
+        logger.exception("Échec de la reconstruction de l'index de proximité.")
+    finally:
+        with _verrou:
+            _reconstruction = None
+        # Connexion ouverte par ce thread, que Django ne fermera pas
+        connections.close_all()
+
+
+def index_proximite(attendre=False):
+    """
+    Retourne l'index du processus.
+
+    Seule la première construction a lieu pendant la requête. Un index
+    obsolète est retourné tel quel, après avoir lancé sa reconstruction en
+    arrière-plan (une seule à la fois).
+
+    Args:
+        attendre (bool): Reconstruire un index obsolète avant de le retourner.
+    """
+    global _index, _version, _reconstruction
+    # Version lue avant les sites : une écriture pendant la construction
+    # laisse l'index obsolète, et il sera reconstruit à la requête suivante
+    version = version_positions()
+    if _index is not None and _version == version:
+        return _index
+    with _verrou:
+        if _index is None or attendre:
+            if _index is None or _version != version:
+                _index = IndexProximite.depuis_base()
+                _version = version
+        elif _version != version and _reconstruction is None:
+            _reconstruction = threading.Thread(
+                target=_reconstruire, args=(version,), name="index-proximite", daemon=True
+            )
+            _reconstruction.start()
+        return _index
+
+
+def parse_coordonnees(lat, lon):
+    """
+    Analyse la latitude et la longitude d'un point.
+
+    Raises:
+        ValueError: Si une coordonnée manque ou est hors limites.
+    """
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("Paramètres lat et lon requis (degrés décimaux).")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Coordonnées invalides : {lat}, {lon}")
+    return lat, lon
+
+
+def parse_entier(valeur, nom, maximum, defaut=None):
+    """Analyse un entier positif, borné à ``maximum``."""
+    if valeur in (None, ""):
+        return defaut
+    if not str(valeur).isdigit() or int(valeur) < 1:
+        raise ValueError(f"{nom} invalide : {valeur}")
+    return min(int(valeur), maximum)
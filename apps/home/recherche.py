@@ -0,0 +1,216 @@
+# -*- encoding: utf-8 -*-
+"""
+Recherche plein texte des sites.
+
+Chaque site a une ligne dans IndexRechercheSite : les textes de son nom, de
+son lieu (localité, commune, département) et de ses autres champs
+(opérateur, propriétaire, description), en minuscules et sans accents, ainsi
+que les champs affichés dans les résultats. Cette table est indexée par :
+
+- SQLite : une table virtuelle FTS5 à contenu externe, synchronisée par
+  déclencheurs, classée par bm25 ;
+- PostgreSQL : un index GIN sur un tsvector pondéré, classé par ts_rank.
+
+Les autres moteurs se rabattent sur des ``contains`` sur les textes
+normalisés. La table est tenue à jour par les signaux (voir signals.py) ;
+les écritures en masse doivent appeler indexer_sites() ou la commande
+``indexer_recherche``.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .models import IndexRechercheSite, Site
+
+LIMITE_DEFAUT = 20
+LIMITE_MAX = 100
+TAILLE_LOT = 2000
+
+CHAMPS_RESULTAT = ("id", "nom", "description", "localite", "operateur")
+
+# Poids des colonnes dans le classement : nom, lieu, autres
+POIDS_COLONNES = (10.0, 4.0, 1.0)
+
+CHAMPS_SITE = {
+    "operateur_nom": F("operateur__nom"),
+    "localite_nom": F("localite__localite"),
+    "commune_nom": F("localite__commune__nom"),
+    "departement_nom": F("localite__commune__departement__nom"),
+}
+
+
+@lru_cache(maxsize=65536)
+def normaliser_texte(texte):
+    """
+    Normalise un texte pour l'index : minuscules, accents retirés et tout
+    caractère autre qu'une lettre ou un chiffre remplacé par une espace.
+
+    Les résultats sont mis en cache : les lieux, opérateurs et propriétaires
+    reviennent d'un site à l'autre.
+    """
+    if not texte:
+        return ""
+    texte = str(texte).lower()
+    # Un texte ASCII n'a pas d'accent à retirer
+    if not texte.isascii():
+        texte = "".join(
+            c for c in unicodedata.normalize("NFD", texte) if unicodedata.category(c) != "Mn"
+        )
+    return " ".join(re.findall(r"[a-z0-9]+", texte))
+
+
+def ligne_index(ligne, modele_index=IndexRechercheSite):
+    """Construit la ligne d'index d'un site projeté avec CHAMPS_SITE."""
+    lieu = [ligne["localite_nom"], ligne["commune_nom"], ligne["departement_nom"]]
+    autres = [ligne["operateur_nom"], ligne["proprietaire"], ligne["description"]]
+    return modele_index(
+        site_id=ligne["id"],
+        nom=ligne["nom"],
+        description=ligne["description"],
+        localite=", ".join(lieu) if ligne["localite_nom"] else "",
+        operateur=ligne["operateur_nom"],
+        texte_nom=normaliser_texte(ligne["nom"]),
+        texte_lieu=" ".join(normaliser_texte(t) for t in lieu if t),
+        texte_autres=" ".join(normaliser_texte(t) for t in autres if t),
+    )
+
+
+def indexer_sites(site_ids=None, modele_site=Site, modele_index=IndexRechercheSite):
+    """
+    (Ré)indexe des sites.
+
+    Args:
+        site_ids: Identifiants des sites (liste ou QuerySet ``values("id")``),
+            ou None pour reconstruire tout l'index.
+        modele_site, modele_index: Les modèles à utiliser (les modèles
+            historiques dans une migration).
+    """
+    sites = modele_site.objects.all()
+    anciennes = modele_index.objects.all()
+    if site_ids is not None:
+        sites = sites.filter(id__in=site_ids)
+        anciennes = anciennes.filter(site_id__in=site_ids)
+
+    lignes = sites.values("id", "nom", "description", "proprietaire", **CHAMPS_SITE)
+    with transaction.atomic():
+        anciennes.delete()
+        lot = []
+        for ligne in lignes.iterator(chunk_size=TAILLE_LOT):
+            lot.append(ligne_index(ligne, modele_index))
+            if len(lot) >= TAILLE_LOT:
+                modele_index.objects.bulk_create(lot)
+                lot = []
+        modele_index.objects.bulk_create(lot)
+
+
+# Index plein texte propre à chaque moteur, créé par la migration 0005
+def _expression_tsvector():
+    return (
+        "setweight(to_tsvector('simple', texte_nom), 'A') || "
+        "setweight(to_tsvector('simple', texte_lieu), 'B') || "
+        "setweight(to_tsvector('simple', texte_autres), 'C')"
+    )
+
+
+def sql_creation_index(vendor, table):
+    """Retourne les requêtes créant l'index plein texte de ``table``."""
+    fts = f"{table}_fts"
+    if vendor == "sqlite":
+        colonnes = "texte_nom, texte_lieu, texte_autres"
+        anciennes = "old.texte_nom, old.texte_lieu, old.texte_autres"
+        nouvelles = "new.texte_nom, new.texte_lieu, new.texte_autres"
+        supprimer = (
+            f"INSERT INTO {fts}({fts}, rowid, {colonnes}) "
+            f"VALUES ('delete', old.site_id, {anciennes});"
+        )
+        inserer = f"INSERT INTO {fts}(rowid, {colonnes}) VALUES (new.site_id, {nouvelles});"
+        return [
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({colonnes}, "
+            f"content='{table}', content_rowid='site_id', prefix='2 3')",
+            f"CREATE TRIGGER {table}_ai AFTER INSERT ON {table} BEGIN {inserer} END",
+            f"CREATE TRIGGER {table}_ad AFTER DELETE ON {table} BEGIN {supprimer} END",
+            f"CREATE TRIGGER {table}_au AFTER UPDATE ON {table} BEGIN {supprimer} {inserer} END",
+        ]
+    if vendor == "postgresql":
+        return [f"CREATE INDEX {fts} ON {table} USING GIN (({_expression_tsvector()}))"]
+    return []
+
+
+def sql_suppression_index(vendor, table):
+    """Retourne les requêtes supprimant l'index plein texte de ``table``."""
+    fts = f"{table}_fts"
+    if vendor == "sqlite":
+        return [
+            f"DROP TRIGGER IF EXISTS {table}_{suffixe}" for suffixe in ("ai", "ad", "au")
+        ] + [f"DROP TABLE IF EXISTS {fts}"]
+    if vendor == "postgresql":
+        return [f"DROP INDEX IF EXISTS {fts}"]
+    return []
+
+
+def parse_limite(valeur):
+    """Analyse le nombre de résultats demandé, borné à LIMITE_MAX."""
+    if not valeur:
+        return LIMITE_DEFAUT
+    if not str(valeur).isdigit():
+        raise ValueError(f"Limite invalide : {valeur}")
+    return min(max(int(valeur), 1), LIMITE_MAX)
+
+
+def rechercher(texte, limite=LIMITE_DEFAUT):
+    """
+    Recherche des sites, sans tenir compte des accents ni de la casse.
+
+    Chaque mot de la recherche doit apparaître, éventuellement comme début
+    d'un mot indexé (recherche à la frappe).
+
+    Args:
+        texte (str): Le texte recherché.
+        limite (int): Le nombre maximal de résultats.
+
+    Returns:
+        list[dict]: Les sites trouvés (id, nom, description, localite,
+        operateur), les plus pertinents d'abord.
+    """
+    mots = normaliser_texte(texte).split()
+    if not mots:
+        return []
+
+    table = IndexRechercheSite._meta.db_table
+    colonnes = "i.site_id, i.nom, i.description, i.localite, i.operateur"
+    if connection.vendor == "sqlite":
+        fts = f"{table}_fts"
+        poids = ", ".join(str(p) for p in POIDS_COLONNES)
+        requete = (
+            f"SELECT {colonnes} FROM {fts} JOIN {table} i ON i.site_id = {fts}.rowid "
+            f"WHERE {fts} MATCH %s ORDER BY bm25({fts}, {poids}) LIMIT %s"
+        )
+        parametres = [" ".join(f'"{mot}"*' for mot in mots), limite]
+    elif connection.vendor == "postgresql":
+        vecteur = _expression_tsvector()
+        requete = (
+            f"SELECT {colonnes} FROM {table} i, to_tsquery('simple', %s) q "
+            f"WHERE ({vecteur}) @@ q ORDER BY ts_rank({vecteur}, q) DESC LIMIT %s"
+        )
+        parametres = [" & ".join(f"{mot}:*" for mot in mots), limite]
+    else:
+        filtre = Q()
+        for mot in mots:
+            filtre &= (
+                Q(texte_nom__contains=mot)
+                | Q(texte_lieu__contains=mot)
+                | Q(texte_autres__contains=mot)
+            )
+        lignes = (
+            IndexRechercheSite.objects.filter(filtre)
+            .order_by("nom")
+            .values_list("site_id", "nom", "description", "localite", "operateur")
+        )
+        return [dict(zip(CHAMPS_RESULTAT, ligne)) for ligne in lignes[:limite]]
+
+    with connection.cursor() as curseur:
+        curseur.execute(requete, parametres)
+        return [dict(zip(CHAMPS_RESULTAT, ligne)) for ligne in curseur.fetchall()]
@@ -0,0 +1,307 @@
+# -*- encoding: utf-8 -*-
+import threading
+
+from django.db import connection, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+
+from .cache import invalider_positions, invalider_sites
+from .densite import cles_site as cles_densite_site
+from .densite import cles_technologies, deplacer_cles
+from .images import actualiser_derives, derives_a_jour
+from .models import (
+    Commune,
+    Conformite,
+    Departement,
+    Localite,
+    Operateur,
+    Site,
+    SiteTechnologie,
+)
+from .recherche import indexer_sites
+from .statistiques import appliquer_delta, cle_site, deplacer_site
+
+# Modèles dont une écriture change les données servies à partir des sites
+MODELES_SITES = (
+    Site,
+    Conformite,
+    SiteTechnologie,
+    Operateur,
+    Localite,
+    Commune,
+    Departement,
+)
+
+# Sites en cours de suppression (par thread) : leur conformité est supprimée
+# en cascade juste avant eux et ne doit pas être comptée séparément.
+_suppressions = threading.local()
+
+
+def _sites_supprimes():
+    if not hasattr(_suppressions, "sites"):
+        _suppressions.sites = {}
+    return _suppressions.sites
+
+
+def invalider_cache_sites(sender, **kwargs):
+    invalider_sites()
+
+
+for modele in MODELES_SITES:
+    post_save.connect(invalider_cache_sites, sender=modele)
+    post_delete.connect(invalider_cache_sites, sender=modele)
+# Site.technologies.add()/set() écrivent les liens sans post_save
+m2m_changed.connect(invalider_cache_sites, sender=Site.technologies.through)
+
+
+# Version des positions (index de proximité) : changée seulement par les
+# écritures de coordonnées, d'opérateur ou de technologies, une fois validées
+CHAMPS_POSITION = ("latitude", "longitude", "operateur_id")
+
+
+def position_site(instance):
+    return tuple(
+        Site._meta.get_field(champ).to_python(getattr(instance, champ))
+        for champ in CHAMPS_POSITION
+    )
+
+
+def memoriser_position_site(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._position = None
+    if instance.pk:
+        instance._position = (
+            Site.objects.filter(pk=instance.pk).values_list(*CHAMPS_POSITION).first()
+        )
+
+
+def comparer_position_site(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if getattr(instance, "_position", None) != position_site(instance):
+        transaction.on_commit(invalider_positions)
+
+
+def invalider_positions_apres_validation(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(invalider_positions)
+
+
+def invalider_positions_liens(sender, action, **kwargs):
+    if action == "post_add":
+        transaction.on_commit(invalider_positions)
+
+
+pre_save.connect(memoriser_position_site, sender=Site)
+post_save.connect(comparer_position_site, sender=Site)
+post_delete.connect(invalider_positions_apres_validation, sender=Site)
+post_save.connect(invalider_positions_apres_validation, sender=SiteTechnologie)
+post_delete.connect(invalider_positions_apres_validation, sender=SiteTechnologie)
+# Site.technologies.add() : retraits et suppressions passent par delete()
+m2m_changed.connect(invalider_positions_liens, sender=Site.technologies.through)
+
+
+# Table de statistiques : chaque écriture déplace le site d'une ligne à l'autre
+def memoriser_cle_site(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._cle_statistique = cle_site(instance.pk) if instance.pk else None
+
+
+def mettre_a_jour_statistiques_site(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deplacer_site(getattr(instance, "_cle_statistique", None), cle_site(instance.pk))
+
+
+def memoriser_suppression_site(sender, instance, **kwargs):
+    _sites_supprimes()[instance.pk] = cle_site(instance.pk)
+
+
+def retirer_site_statistiques(sender, instance, **kwargs):
+    appliquer_delta(_sites_supprimes().pop(instance.pk, None), -1)
+
+
+def memoriser_cle_conformite(sender, instance, raw=False, **kwargs):
+    if raw or instance.site_id in _sites_supprimes():
+        return
+    instance._cle_statistique = cle_site(instance.site_id)
+
+
+def mettre_a_jour_statistiques_conformite(sender, instance, raw=False, **kwargs):
+    if raw or instance.site_id in _sites_supprimes():
+        return
+    deplacer_site(
+        getattr(instance, "_cle_statistique", None), cle_site(instance.site_id)
+    )
+
+
+pre_save.connect(memoriser_cle_site, sender=Site)
+post_save.connect(mettre_a_jour_statistiques_site, sender=Site)
+pre_delete.connect(memoriser_suppression_site, sender=Site)
+post_delete.connect(retirer_site_statistiques, sender=Site)
+pre_save.connect(memoriser_cle_conformite, sender=Conformite)
+post_save.connect(mettre_a_jour_statistiques_conformite, sender=Conformite)
+pre_delete.connect(memoriser_cle_conformite, sender=Conformite)
+post_delete.connect(mettre_a_jour_statistiques_conformite, sender=Conformite)
+
+
+# Grille de densité : chaque écriture déplace le site d'une cellule à l'autre,
+# dans la couche de son opérateur et dans celles de ses technologies
+def memoriser_cles_densite(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._cles_densite = cles_densite_site(instance.pk) if instance.pk else []
+
+
+def mettre_a_jour_densite_site(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deplacer_cles(getattr(instance, "_cles_densite", []), cles_densite_site(instance.pk))
+
+
+def retirer_site_densite(sender, instance, **kwargs):
+    deplacer_cles(getattr(instance, "_cles_densite", []), [])
+
+
+def memoriser_cle_densite_technologie(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._cles_densite = []
+    if instance.pk:
+        ancien = SiteTechnologie.objects.filter(pk=instance.pk).values_list("site_id", "technologie_id")
+        instance._cles_densite = cles_technologies(ancien)
+
+
+def mettre_a_jour_densite_technologie(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deplacer_cles(
+        getattr(instance, "_cles_densite", []),
+        cles_technologies([(instance.site_id, instance.technologie_id)]),
+    )
+
+
+def retirer_technologie_densite(sender, instance, **kwargs):
+    # Les liens d'un site supprimé sont retirés avec lui
+    if instance.site_id in _sites_supprimes():
+        return
+    deplacer_cles(getattr(instance, "_cles_densite", []), [])
+
+
+def ajouter_liens_densite(sender, instance, action, reverse, pk_set, **kwargs):
+    # Site.technologies.add()/set() créent les liens par bulk_create, sans
+    # post_save ; leur retrait passe par delete() et ses signaux.
+    if action != "post_add":
+        return
+    if reverse:
+        liens = [(site_id, instance.pk) for site_id in pk_set]
+    else:
+        liens = [(instance.pk, technologie_id) for technologie_id in pk_set]
+    deplacer_cles([], cles_technologies(liens))
+
+
+pre_save.connect(memoriser_cles_densite, sender=Site)
+post_save.connect(mettre_a_jour_densite_site, sender=Site)
+pre_delete.connect(memoriser_cles_densite, sender=Site)
+post_delete.connect(retirer_site_densite, sender=Site)
+pre_save.connect(memoriser_cle_densite_technologie, sender=SiteTechnologie)
+post_save.connect(mettre_a_jour_densite_technologie, sender=SiteTechnologie)
+pre_delete.connect(memoriser_cle_densite_technologie, sender=SiteTechnologie)
+post_delete.connect(retirer_technologie_densite, sender=SiteTechnologie)
+m2m_changed.connect(ajouter_liens_densite, sender=Site.technologies.through)
+
+
+# Index de recherche : un site est réindexé à chaque écriture, et tous les
+# sites d'un opérateur ou d'un lieu renommé (ou rattaché ailleurs) le sont
+# avec lui, une fois l'écriture validée.
+def indexer_site(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    indexer_sites([instance.pk])
+
+
+# Modèle lié -> (chemin depuis Site, champs repris dans l'index des sites)
+SITES_LIES = {
+    Operateur: ("operateur", ("nom",)),
+    Localite: ("localite", ("localite", "commune_id")),
+    Commune: ("localite__commune", ("nom", "departement_id")),
+    Departement: ("localite__commune__departement", ("nom",)),
+}
+
+
+def memoriser_champs_indexes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _, champs = SITES_LIES[sender]
+    instance._champs_indexes = None
+    if instance.pk:
+        instance._champs_indexes = (
+            sender.objects.filter(pk=instance.pk).values_list(*champs).first()
+        )
+
+
+def indexer_sites_lies(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    chemin, champs = SITES_LIES[sender]
+    if getattr(instance, "_champs_indexes", None) == tuple(getattr(instance, c) for c in champs):
+        return
+    # Après validation : une écriture annulée ne réindexe rien, et la
+    # réindexation des sites liés ne prolonge pas sa transaction
+    site_ids = Site.objects.filter(**{chemin: instance.pk}).values("id")
+    transaction.on_commit(lambda: indexer_sites(site_ids), robust=True)
+
+
+post_save.connect(indexer_site, sender=Site)
+for modele in SITES_LIES:
+    pre_save.connect(memoriser_champs_indexes, sender=modele)
+    post_save.connect(indexer_sites_lies, sender=modele)
+
+
+# Dérivés des images : calculés quand la photo ou le logo change
+IMAGES = {Site: "photo", Operateur: "logo"}
+
+
+def calculer_derives_enregistres(modele, pk):
+    """Calcule et enregistre les dérivés de l'image d'une instance enregistrée."""
+    champ = IMAGES[modele]
+    attribut = f"{champ}_derives"
+    instance = modele.objects.filter(pk=pk).only("id", champ, attribut).first()
+    if instance is not None and actualiser_derives(instance, champ):
+        modele.objects.filter(pk=pk).update(**{attribut: getattr(instance, attribut)})
+        # Écrits après l'invalidation de post_save : les réponses mises en
+        # cache entre-temps citent encore l'image originale
+        invalider_sites()
+
+
+def lancer_derives(modele, pk):
+    def calculer():
+        try:
+            calculer_derives_enregistres(modele, pk)
+        finally:
+            # Connexion propre au thread, jamais réutilisée
+            connection.close()
+
+    # Thread non démon : une commande (peuplate_db) attend sa fin pour quitter
+    threading.Thread(target=calculer, name=f"derives-{modele.__name__}-{pk}").start()
+
+
+def generer_derives(sender, instance, raw=False, **kwargs):
+    if raw or derives_a_jour(instance, IMAGES[sender]):
+        return
+    # Après validation : une écriture annulée ne laisse pas de dérivés
+    # orphelins ; les encodages, dans un thread, ne retardent pas la réponse
+    pk = instance.pk
+    transaction.on_commit(lambda: lancer_derives(sender, pk), robust=True)
+
+
+for modele in IMAGES:
+    post_save.connect(generer_derives, sender=modele)
@@ -0,0 +1,233 @@
+# -*- encoding: utf-8 -*-
+"""
+Index spatial en grille pour les coordonnées des sites.
+
+Chaque site reçoit le numéro de la cellule de grille (pas fixe en degrés) qui
+contient ses coordonnées. Les cellules d'une même ligne de la grille sont
+numérotées de façon contiguë, ce qui permet de traduire une emprise
+(bounding box) en quelques intervalles d'entiers, résolus par l'index B-tree
+de la colonne ``Site.cellule_grille``.
+"""
+import math
+
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Floor
+
+# Pas de la grille en degrés (~5,5 km à l'équateur)
+TAILLE_CELLULE = 0.05
+NB_COLONNES = int(round(360 / TAILLE_CELLULE))
+
+# Au-delà de ce nombre de lignes de grille, on se contente du filtre sur les
+# coordonnées : la requête OR sur les intervalles deviendrait trop longue.
+MAX_LIGNES_EMPRISE = 256
+
+ZOOM_MIN = 0
+ZOOM_MAX = 22
+
+# Taille d'un cluster à l'écran, en pixels (tuiles Leaflet de 256 px)
+TAILLE_CLUSTER_PIXELS = 64
+
+# États de conformité, tels que compris par get_filtered_sites
+CONFORME = "conforme"
+NON_CONFORME = "non-conforme"
+SANS_RAPPORT = "sans-rapport"
+
+
+def ligne_colonne(lat, lon):
+    """Retourne la ligne et la colonne de grille contenant le point (lat, lon)."""
+    ligne = int(math.floor((float(lat) + 90) / TAILLE_CELLULE))
+    colonne = int(math.floor((float(lon) + 180) / TAILLE_CELLULE))
+    # Les bords +90 / +180 appartiennent à la dernière cellule
+    ligne = min(max(ligne, 0), int(round(180 / TAILLE_CELLULE)) - 1)
+    colonne = min(max(colonne, 0), NB_COLONNES - 1)
+    return ligne, colonne
+
+
+def cellule_grille(lat, lon):
+    """
+    Calcule le numéro de cellule de grille d'un point.
+
+    Args:
+        lat (float | Decimal | None): Latitude en degrés.
+        lon (float | Decimal | None): Longitude en degrés.
+
+    Returns:
+        int or None: Le numéro de cellule, ou None si une coordonnée manque.
+    """
+    if lat is None or lon is None:
+        return None
+    ligne, colonne = ligne_colonne(lat, lon)
+    return ligne * NB_COLONNES + colonne
+
+
+def parse_emprise(valeur):
+    """
+    Analyse une emprise au format Leaflet ``toBBoxString()`` : "ouest,sud,est,nord".
+
+    Args:
+        valeur (str): La chaîne reçue dans la requête.
+
+    Returns:
+        tuple or None: (ouest, sud, est, nord) en float, ou None si absente.
+
+    Raises:
+        ValueError: Si l'emprise est mal formée.
+    """
+    if not valeur:
+        return None
+    try:
+        ouest, sud, est, nord = (float(v) for v in valeur.split(","))
+    except ValueError:
+        raise ValueError(f"Emprise invalide : {valeur}")
+
+    if not all(math.isfinite(v) for v in (ouest, sud, est, nord)):
+        raise ValueError(f"Emprise invalide : {valeur}")
+    if sud > nord or ouest > est:
+        raise ValueError(f"Emprise invalide : {valeur}")
+
+    # Leaflet peut renvoyer des longitudes hors [-180, 180] aux faibles zooms
+    return (
+        max(ouest, -180.0),
+        max(sud, -90.0),
+        min(est, 180.0),
+        min(nord, 90.0),
+    )
+
+
+def parse_zoom(valeur):
+    """Analyse le niveau de zoom Leaflet ; retourne None s'il est absent."""
+    if valeur in (None, ""):
+        return None
+    try:
+        zoom = int(float(valeur))
+    except ValueError:
+        raise ValueError(f"Niveau de zoom invalide : {valeur}")
+    return min(max(zoom, ZOOM_MIN), ZOOM_MAX)
+
+
+def filtrer_par_emprise(sites, emprise):
+    """
+    Restreint un QuerySet de sites à ceux situés dans l'emprise donnée.
+
+    Args:
+        sites (QuerySet): Les sites à filtrer.
+        emprise (tuple): (ouest, sud, est, nord).
+
+    Returns:
+        QuerySet: Les sites dans l'emprise.
+    """
+    ouest, sud, est, nord = emprise
+    sites = sites.filter(
+        latitude__gte=sud,
+        latitude__lte=nord,
+        longitude__gte=ouest,
+        longitude__lte=est,
+    )
+
+    ligne_min, colonne_min = ligne_colonne(sud, ouest)
+    ligne_max, colonne_max = ligne_colonne(nord, est)
+    if ligne_max - ligne_min + 1 > MAX_LIGNES_EMPRISE:
+        return sites
+
+    # Une ligne de grille = un intervalle contigu de numéros de cellules
+    intervalles = Q()
+    for ligne in range(ligne_min, ligne_max + 1):
+        debut = ligne * NB_COLONNES
+        intervalles |= Q(
+            cellule_grille__range=(debut + colonne_min, debut + colonne_max)
+        )
+    return sites.filter(intervalles)
+
+
+def taille_cluster(zoom):
+    """Taille en degrés d'une cellule de cluster au niveau de zoom donné."""
+    return TAILLE_CLUSTER_PIXELS * 360 / (256 * 2**zoom)
+
+
+def calculer_clusters(sites, zoom):
+    """
+    Regroupe des sites en clusters sur une grille adaptée au niveau de zoom.
+
+    L'agrégation est faite en une seule requête GROUP BY : chaque ligne
+    correspond à une cellule, un opérateur et un état de conformité.
+
+    Args:
+        sites (QuerySet): Les sites (déjà filtrés) à regrouper.
+        zoom (int): Le niveau de zoom de la carte.
+
+    Returns:
+        list: Les clusters, avec centroïde, emprise de la cellule, nombre de
+        sites par opérateur et par état de conformité.
+    """
+    taille = taille_cluster(zoom)
+    lignes = (
+        sites.exclude(latitude=None)
+        .exclude(longitude=None)
+        .annotate(
+            cy=Floor(Cast(F("latitude"), FloatField()) / taille),
+            cx=Floor(Cast(F("longitude"), FloatField()) / taille),
+            etat=Case(
+                When(conformite__isnull=True, then=Value(SANS_RAPPORT)),
+                When(conformite__statut=True, then=Value(CONFORME)),
+                default=Value(NON_CONFORME),
+            ),
+        )
+        .values("cy", "cx", "operateur__nom", "etat")
+        .annotate(
+            nombre=Count("id"),
+            somme_lat=Sum(Cast(F("latitude"), FloatField())),
+            somme_lon=Sum(Cast(F("longitude"), FloatField())),
+        )
+        .order_by()
+    )
+
+    cellules = {}
+    for ligne in lignes:
+        cle = (int(ligne["cy"]), int(ligne["cx"]))
+        cluster = cellules.get(cle)
+        if cluster is None:
+            cluster = cellules[cle] = {
+                "count": 0,
+                "somme_lat": 0.0,
+                "somme_lon": 0.0,
+                "operateurs": {},
+                "conformite": {CONFORME: 0, NON_CONFORME: 0, SANS_RAPPORT: 0},
+            }
+        cluster["count"] += ligne["nombre"]
+        cluster["somme_lat"] += ligne["somme_lat"]
+        cluster["somme_lon"] += ligne["somme_lon"]
+        operateur = ligne["operateur__nom"]
+        cluster["operateurs"][operateur] = (
+            cluster["operateurs"].get(operateur, 0) + ligne["nombre"]
+        )
+        cluster["conformite"][ligne["etat"]] += ligne["nombre"]
+
+    clusters = []
+    for (cy, cx), cluster in cellules.items():
+        clusters.append(
+            {
+                "latitude": round(cluster["somme_lat"] / cluster["count"], 6),
+                "longitude": round(cluster["somme_lon"] / cluster["count"], 6),
+                "count": cluster["count"],
+                "operateurs": cluster["operateurs"],
+                "conformite": cluster["conformite"],
+                # Emprise de la cellule : ouest, sud, est, nord
+                "bbox": [cx * taille, cy * taille, (cx + 1) * taille, (cy + 1) * taille],
+            }
+        )
+    return clusters
+
+
+def clusters_dans_emprise(clusters, emprise):
+    """Ne garde que les clusters dont la cellule intersecte l'emprise."""
+    if not emprise:
+        return clusters
+    ouest, sud, est, nord = emprise
+    return [
+        cluster
+        for cluster in clusters
+        if cluster["bbox"][0] <= est
+        and cluster["bbox"][2] >= ouest
+        and cluster["bbox"][1] <= nord
+        and cluster["bbox"][3] >= sud
+    ]
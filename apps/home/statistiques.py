@@ -0,0 +1,368 @@
+# -*- encoding: utf-8 -*-
+"""
+Table d'agrégats des statistiques (StatistiqueSite).
+
+Chaque ligne compte les sites d'un opérateur, d'une commune, d'un mois
+d'autorisation et d'un état de conformité. La table est tenue à jour de
+façon incrémentale par les signaux de Site et Conformite (voir signals.py) :
+chaque écriture retire le site de son ancienne ligne et l'ajoute à la
+nouvelle. Les écritures en masse (bulk_create, update) contournent les
+signaux ; elles doivent être suivies de reconstruire_statistiques(), aussi
+disponible via la commande ``reconstruire_statistiques``.
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from .models import Commune, Departement, Operateur, Site, StatistiqueSite
+from .spatial import CONFORME, NON_CONFORME, SANS_RAPPORT
+
+CHAMPS_CLE = ("operateur_id", "departement_id", "commune_id", "mois", "etat")
+
+
+def annoter_etat(sites):
+    """Annote un QuerySet de sites avec son état de conformité (champ ``etat``)."""
+    return sites.annotate(
+        etat=Case(
+            When(conformite__isnull=True, then=Value(SANS_RAPPORT)),
+            When(conformite__statut=True, then=Value(CONFORME)),
+            default=Value(NON_CONFORME),
+        )
+    )
+
+
+def valeurs_cle(sites):
+    """Projette des sites sur les champs de la clé de statistique (CHAMPS_CLE)."""
+    return annoter_etat(sites).values(
+        "etat",
+        "operateur_id",
+        departement_id=F("localite__commune__departement"),
+        commune_id=F("localite__commune"),
+        mois=TruncMonth("date_autorisation"),
+    )
+
+
+def lignes_agregees(sites):
+    """
+    Agrège des sites selon la clé de la table de statistiques.
+
+    Returns:
+        QuerySet: Des dictionnaires avec les champs de CHAMPS_CLE et ``nombre``.
+    """
+    return valeurs_cle(sites).annotate(nombre=Count("id")).order_by()
+
+
+def cle_site(site_id):
+    """
+    Retourne la clé de statistique d'un site, lue en base.
+
+    Returns:
+        tuple or None: La clé (voir CHAMPS_CLE), ou None si le site n'existe pas.
+    """
+    ligne = valeurs_cle(Site.objects.filter(pk=site_id)).first()
+    if ligne is None:
+        return None
+    return tuple(ligne[champ] for champ in CHAMPS_CLE)
+
+
+def appliquer_delta(cle, delta):
+    """
+    Ajoute ``delta`` au compteur de la ligne correspondant à ``cle``.
+
+    Une ligne ramenée à zéro est supprimée : la table ne garde que des
+    combinaisons ayant des sites, comme après reconstruire_statistiques().
+    """
+    if cle is None or delta == 0:
+        return
+    filtres = dict(zip(CHAMPS_CLE, cle))
+    with transaction.atomic():
+        ligne = StatistiqueSite.objects.filter(**filtres).values_list("pk", flat=True).first()
+        if ligne is not None:
+            StatistiqueSite.objects.filter(pk=ligne).update(nombre=F("nombre") + delta)
+            StatistiqueSite.objects.filter(pk=ligne, nombre=0).delete()
+        # Une ligne absente à décrémenter a été supprimée en cascade avec son
+        # opérateur ou son lieu : il n'y a rien à retirer.
+        elif delta > 0:
+            StatistiqueSite.objects.create(nombre=delta, **filtres)
+
+
+def deplacer_site(ancienne_cle, nouvelle_cle):
+    """Déplace un site d'une ligne de statistiques à une autre."""
+    if ancienne_cle == nouvelle_cle:
+        return
+    with transaction.atomic():
+        appliquer_delta(ancienne_cle, -1)
+        appliquer_delta(nouvelle_cle, 1)
+
+
+def reconstruire_statistiques(modele_site=Site, modele_statistique=StatistiqueSite):
+    """
+    Recalcule entièrement la table de statistiques à partir des sites.
+
+    Args:
+        modele_site: Le modèle Site (modèle historique dans une migration).
+        modele_statistique: Le modèle StatistiqueSite.
+
+    Returns:
+        int: Le nombre de lignes créées.
+    """
+    with transaction.atomic():
+        modele_statistique.objects.all().delete()
+        lignes = [
+            modele_statistique(**ligne)
+            for ligne in lignes_agregees(modele_site.objects.all())
+        ]
+        modele_statistique.objects.bulk_create(lignes, batch_size=1000)
+    return len(lignes)
+
+
+def fin_de_mois(jour):
+    return jour.replace(day=calendar.monthrange(jour.year, jour.month)[1])
+
+
+def decouper_periode(date_debut, date_fin):
+    """
+    Découpe une période en mois complets et en morceaux de mois partiels.
+
+    Les mois complets se lisent dans la table de statistiques ; les morceaux
+    partiels (au plus deux) sont comptés directement sur les sites.
+
+    Args:
+        date_debut (date | None): Début de période inclus.
+        date_fin (date | None): Fin de période incluse.
+
+    Returns:
+        tuple: (premier mois complet, dernier mois complet, intervalles
+        partiels). Un mois à None signifie que la période n'est pas bornée
+        de ce côté ; si le premier mois dépasse le dernier, aucun mois
+        complet n'est inclus.
+    """
+    mois_debut = mois_fin = None
+    partiels = []
+
+    if date_debut:
+        mois_debut = date_debut
+        if date_debut.day != 1:
+            mois_debut = fin_de_mois(date_debut) + timedelta(days=1)
+            fin = fin_de_mois(date_debut)
+            partiels.append((date_debut, min(fin, date_fin) if date_fin else fin))
+
+    if date_fin:
+        mois_fin = date_fin.replace(day=1)
+        if date_fin != fin_de_mois(date_fin):
+            mois_fin = (mois_fin - timedelta(days=1)).replace(day=1)
+            debut = max(date_fin.replace(day=1), date_debut) if date_debut else date_fin.replace(day=1)
+            if (debut, date_fin) not in partiels:
+                partiels.append((debut, date_fin))
+
+    partiels = [(debut, fin) for debut, fin in partiels if debut <= fin]
+    return mois_debut, mois_fin, partiels
+
+
+# Dimensions de ventilation : champ dans la table d'agrégats, expression sur Site
+DIMENSIONS = {
+    "operateur": ("operateur_id", F("operateur")),
+    "departement": ("departement_id", F("localite__commune__departement")),
+    "commune": ("commune_id", F("localite__commune")),
+    "mois": ("mois", TruncMonth("date_autorisation")),
+    "technologie": (None, F("technologies__nom")),
+}
+
+
+def lignes_statistiques(dimensions, date_debut=None, date_fin=None, operateur_id=None):
+    """
+    Retourne les nombres de sites par dimension et par état de conformité.
+
+    Les mois complets sont lus dans la table d'agrégats et les mois partiels
+    comptés sur les sites. La technologie n'est pas dans la table d'agrégats :
+    si elle est demandée, tout est compté sur les sites.
+
+    Args:
+        dimensions (list): Noms de dimensions (clés de DIMENSIONS).
+        date_debut (date | None): Date d'autorisation minimale.
+        date_fin (date | None): Date d'autorisation maximale.
+        operateur_id (int | None): Filtre sur l'opérateur.
+
+    Yields:
+        dict: Une clé par dimension, plus ``etat`` et ``nombre``.
+    """
+    expressions = {f"_{dim}": DIMENSIONS[dim][1] for dim in dimensions}
+
+    def compter_sites(sites):
+        if operateur_id:
+            sites = sites.filter(operateur_id=operateur_id)
+        lignes = (
+            annoter_etat(sites)
+            .values("etat", **expressions)
+            .annotate(nombre=Count("id", distinct=True))
+            .order_by()
+        )
+        for ligne in lignes:
+            yield {dim: ligne[f"_{dim}"] for dim in dimensions} | {
+                "etat": ligne["etat"],
+                "nombre": ligne["nombre"],
+            }
+
+    if "technologie" in dimensions:
+        sites = Site.objects.all()
+        if date_debut:
+            sites = sites.filter(date_autorisation__gte=date_debut)
+        if date_fin:
+            sites = sites.filter(date_autorisation__lte=date_fin)
+        yield from compter_sites(sites)
+        return
+
+    mois_debut, mois_fin, partiels = decouper_periode(date_debut, date_fin)
+
+    # Mois complets : lignes de la table d'agrégats
+    if not (mois_debut and mois_fin and mois_debut > mois_fin):
+        statistiques = StatistiqueSite.objects.all()
+        if mois_debut:
+            statistiques = statistiques.filter(mois__gte=mois_debut)
+        if mois_fin:
+            statistiques = statistiques.filter(mois__lte=mois_fin)
+        if operateur_id:
+            statistiques = statistiques.filter(operateur_id=operateur_id)
+        champs = [DIMENSIONS[dim][0] for dim in dimensions]
+        lignes = (
+            statistiques.values("etat", *champs)
+            .annotate(nombre=Sum("nombre"))
+            .order_by()
+        )
+        for ligne in lignes:
+            yield {dim: ligne[champ] for dim, champ in zip(dimensions, champs)} | {
+                "etat": ligne["etat"],
+                "nombre": ligne["nombre"],
+            }
+
+    # Mois partiels : comptage direct sur les sites de ces quelques jours
+    for debut, fin in partiels:
+        yield from compter_sites(
+            Site.objects.filter(date_autorisation__gte=debut, date_autorisation__lte=fin)
+        )
+
+
+def etats_retenus(conformite):
+    """États de conformité comptés comme rapports selon le filtre de conformité."""
+    if conformite:
+        return {CONFORME} if conformite == "conforme" else {NON_CONFORME}
+    return {CONFORME, NON_CONFORME}
+
+
+def ajouter_ligne(compteurs, ligne, etats):
+    """Ajoute une ligne de lignes_statistiques() à des compteurs de sites."""
+    nombre = ligne["nombre"] or 0
+    if nombre <= 0:
+        return False
+    compteurs["sites_count"] += nombre
+    if ligne["etat"] in etats:
+        compteurs["conformite_count"] += nombre
+        if ligne["etat"] == CONFORME:
+            compteurs["conformes_count"] += nombre
+        else:
+            compteurs["non_conformes_count"] += nombre
+    return True
+
+
+def compter_statistiques(date_debut=None, date_fin=None, operateur_id=None, conformite=None):
+    """
+    Calcule les totaux de la page statistiques à partir de la table d'agrégats.
+
+    Args:
+        date_debut (date | None): Date d'autorisation minimale.
+        date_fin (date | None): Date d'autorisation maximale.
+        operateur_id (int | None): Filtre sur l'opérateur.
+        conformite (str | None): "conforme" ou un autre statut (non conforme).
+
+    Returns:
+        dict: Les compteurs attendus par statistics.html.
+    """
+    etats = etats_retenus(conformite)
+    resultat = {
+        "sites_count": 0,
+        "conformite_count": 0,
+        "operateurs_count": 0,
+        "conformes_count": 0,
+        "non_conformes_count": 0,
+    }
+    operateurs = set()
+    for ligne in lignes_statistiques(["operateur"], date_debut, date_fin, operateur_id):
+        if ajouter_ligne(resultat, ligne, etats):
+            operateurs.add(ligne["operateur"])
+    resultat["operateurs_count"] = len(operateurs)
+    return resultat
+
+
+def ventiler_statistiques(dimensions, date_debut=None, date_fin=None, operateur_id=None, conformite=None):
+    """
+    Ventile les compteurs de la page statistiques selon une ou plusieurs dimensions.
+
+    Un site ayant plusieurs technologies est compté dans chacune d'elles.
+
+    Args:
+        dimensions (list): Noms de dimensions, dans l'ordre de regroupement.
+        date_debut, date_fin, operateur_id, conformite: Voir compter_statistiques.
+
+    Returns:
+        list: Une entrée par combinaison de valeurs des dimensions, avec
+        le libellé (et l'identifiant) de chaque dimension et les compteurs.
+    """
+    etats = etats_retenus(conformite)
+    groupes = {}
+    for ligne in lignes_statistiques(dimensions, date_debut, date_fin, operateur_id):
+        cle = tuple(ligne[dim] for dim in dimensions)
+        compteurs = groupes.setdefault(
+            cle,
+            {
+                "sites_count": 0,
+                "conformite_count": 0,
+                "conformes_count": 0,
+                "non_conformes_count": 0,
+            },
+        )
+        ajouter_ligne(compteurs, ligne, etats)
+
+    # Libellés des dimensions : une requête par dimension à clé étrangère
+    libelles = {}
+    for dim, modele, champ in (
+        ("operateur", Operateur, "nom"),
+        ("departement", Departement, "nom"),
+        ("commune", Commune, "nom"),
+    ):
+        if dim in dimensions:
+            ids = {cle[dimensions.index(dim)] for cle in groupes} - {None}
+            libelles[dim] = dict(
+                modele.objects.filter(pk__in=ids).values_list("pk", champ)
+            )
+
+    resultats = []
+    for cle, compteurs in groupes.items():
+        if compteurs["sites_count"] <= 0:
+            continue
+        entree = {}
+        for dim, valeur in zip(dimensions, cle):
+            if dim in libelles:
+                entree[f"{dim}_id"] = valeur
+                entree[dim] = libelles[dim].get(valeur)
+            elif dim == "mois":
+                entree[dim] = valeur.strftime("%Y-%m") if valeur else None
+            else:
+                entree[dim] = valeur
+        entree.update(compteurs)
+        resultats.append(entree)
+
+    resultats.sort(key=lambda e: tuple("" if e[d] is None else str(e[d]) for d in dimensions))
+    return resultats
+
+
+def parse_date(valeur):
+    """Analyse une date AAAA-MM-JJ reçue en paramètre ; None si absente."""
+    if not valeur:
+        return None
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise ValueError(f"Format de date incorrect: {valeur}")
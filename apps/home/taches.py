@@ -0,0 +1,194 @@
+# -*- encoding: utf-8 -*-
+"""
+Exécution des importations en arrière-plan (ImportJob).
+
+La vue de téléversement crée un ImportJob en attente et répond tout de
+suite ; la commande ``traiter_imports`` lance un ou plusieurs workers qui
+réservent les jobs en attente et les exécutent. Sans worker à côté du site
+(réglage IMPORT_WORKER_EXTERNE), le job est exécuté dans un thread du
+processus web. La réservation est une mise à jour conditionnelle du statut :
+deux workers ne peuvent pas prendre le même job, quelle que soit la base.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import ImportJob
+from .utils import process_import_file
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de messages d'erreur conservés par job
+ERREURS_MAX = 1000
+
+
+def identifiant_worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def reserver_job(job_id=None):
+    """
+    Réserve le plus ancien job en attente.
+
+    Args:
+        job_id (int): Ne réserver que ce job.
+
+    Returns:
+        ImportJob | None: Le job réservé, passé en cours, ou None.
+    """
+    en_attente = ImportJob.objects.filter(statut=ImportJob.EN_ATTENTE)
+    if job_id is not None:
+        en_attente = en_attente.filter(id=job_id)
+    for job_id in en_attente.values_list("id", flat=True)[:10]:
+        reserve = ImportJob.objects.filter(
+            id=job_id, statut=ImportJob.EN_ATTENTE
+        ).update(
+            statut=ImportJob.EN_COURS,
+            debut=timezone.now(),
+            actif_le=timezone.now(),
+            worker=identifiant_worker(),
+        )
+        if reserve:
+            return ImportJob.objects.select_related("fichier").get(id=job_id)
+    return None
+
+
+def processus_actif(pid):
+    """Indique si un processus de cette machine existe encore."""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Processus d'un autre utilisateur
+        return True
+    return True
+
+
+def relancer_interrompus(delai):
+    """
+    Remet en attente les jobs en cours dont le worker s'est arrêté.
+
+    Le worker d'un job est arrêté si son processus n'existe plus sur cette
+    machine ; le processus d'une autre machine ne peut pas être vérifié, le
+    job y est interrompu s'il n'a montré aucune activité depuis ``delai``.
+
+    Args:
+        delai (timedelta): Durée sans activité d'un job d'une autre machine.
+
+    Returns:
+        int: Le nombre de jobs remis en attente.
+    """
+    hote = socket.gethostname()
+    limite = timezone.now() - delai
+    nombre = 0
+    for job in ImportJob.objects.filter(statut=ImportJob.EN_COURS).only("id", "worker", "actif_le"):
+        machine, _, pid = job.worker.rpartition(":")
+        if machine == hote and pid.isdigit():
+            interrompu = not processus_actif(int(pid))
+        else:
+            interrompu = job.actif_le is None or job.actif_le < limite
+        if interrompu:
+            # Sauf si le job a changé de main entre-temps
+            nombre += ImportJob.objects.filter(
+                id=job.id, statut=ImportJob.EN_COURS, worker=job.worker
+            ).update(statut=ImportJob.EN_ATTENTE, debut=None, actif_le=None, worker="")
+    return nombre
+
+
+def executer_job(job):
+    """Exécute un job réservé et enregistre sa progression et son résultat."""
+
+    def progression(lignes_traitees, lignes_en_erreur):
+        ImportJob.objects.filter(id=job.id).update(
+            lignes_traitees=lignes_traitees,
+            lignes_en_erreur=lignes_en_erreur,
+            actif_le=timezone.now(),
+        )
+
+    logger.info(f"Import {job.id} : traitement de {job.fichier.file.name}")
+    try:
+        with job.fichier.file.open("rb") as fichier:
+            erreurs, rapport = process_import_file(
+                fichier, progress=progression, simulation=job.simulation
+            )
+    except ValidationError as ve:
+        job.statut = ImportJob.ECHEC
+        job.message = "; ".join(ve.messages)
+        logger.error(f"Import {job.id} en échec : {job.message}")
+    except Exception as e:
+        job.statut = ImportJob.ECHEC
+        job.message = str(e)
+        logger.exception(f"Erreur imprévue pendant l'import {job.id}: {e}")
+    else:
+        job.statut = ImportJob.TERMINE
+        job.erreurs = erreurs[:ERREURS_MAX]
+        job.rapport = rapport
+        job.message = (
+            "Certaines lignes n'ont pas pu être importées."
+            if erreurs
+            else "Fichier traité avec succès."
+        )
+        if job.simulation:
+            job.message = f"Simulation, aucune donnée écrite. {job.message}"
+
+    # La progression a été écrite directement en base pendant l'exécution
+    job.refresh_from_db(fields=["lignes_traitees", "lignes_en_erreur"])
+    job.fin = timezone.now()
+    job.save(update_fields=["statut", "erreurs", "rapport", "message", "fin"])
+    logger.info(
+        f"Import {job.id} {job.get_statut_display().lower()} : "
+        f"{job.lignes_traitees} lignes, {job.lignes_en_erreur} en erreur, "
+        f"{job.debit:.0f} lignes/s"
+    )
+    return job
+
+
+def lancer_dans_le_processus(job):
+    """
+    Exécute un job dans un thread du processus web, une fois validée la
+    transaction qui l'a créé.
+
+    Le job est réservé comme par un worker : si traiter_imports l'a pris
+    entre-temps, le thread s'arrête sans rien faire.
+    """
+
+    def executer():
+        try:
+            reserve = reserver_job(job.id)
+            if reserve:
+                executer_job(reserve)
+        finally:
+            # Connexion propre au thread, jamais réutilisée
+            connection.close()
+
+    transaction.on_commit(
+        lambda: threading.Thread(target=executer, name=f"import-{job.id}", daemon=True).start()
+    )
+
+
+def boucle_worker(intervalle=2.0, une_fois=False):
+    """
+    Boucle d'un worker : réserve et exécute les jobs en attente.
+
+    Args:
+        intervalle (float): Secondes d'attente quand aucun job n'est en attente.
+        une_fois (bool): S'arrêter dès qu'il n'y a plus de job en attente.
+    """
+    while True:
+        close_old_connections()
+        job = reserver_job()
+        if job:
+            executer_job(job)
+            continue
+        if une_fois:
+            return
+        time.sleep(intervalle)
@@ -0,0 +1,2214 @@
+# -*- encoding: utf-8 -*-
+import base64
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import brotli
+import numpy as np
+import openpyxl
+import pandas as pd
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import proximite
+from .audit import (
+    COMMUNE_DIFFERENTE,
+    DEPARTEMENT_DIFFERENT,
+    HORS_BENIN,
+    HORS_COMMUNE,
+    ArbreR,
+    _anneaux,
+    auditer_sites,
+    points_dans_polygone,
+)
+from .cache import version_positions
+from .carte import CODES_CONFORMITE, COLONNES_BINAIRES, ECHELLE_COORDONNEES
+from .densite import cellule_densite, reconstruire_densites
+from .export import ENTETES, PROPRIETES_DEFAUT, flux_geojson, flux_ndjson, parse_proprietes
+from .geojson import NIVEAUX_SIMPLIFICATION, anneaux_collection, chemin_couche, simplifier_collection
+from .images import DERIVES, calculer_derives, enregistrer_derives, urls_derive
+from .metriques import (
+    CLE_EMPLACEMENTS,
+    MesureSQL,
+    Registre,
+    cle_emplacement,
+    cout_instrumentation,
+    instantane_global,
+)
+from .models import (
+    Commune,
+    Conformite,
+    Departement,
+    DensiteSite,
+    ImportJob,
+    IndexRechercheSite,
+    Localite,
+    Operateur,
+    Site,
+    SiteTechnologie,
+    StatistiqueSite,
+    Technologie,
+    UploadedFile,
+)
+from .pagination import encoder_curseur
+from .spatial import CONFORME, NON_CONFORME, SANS_RAPPORT, cellule_grille, filtrer_par_emprise
+from .statistiques import (
+    annoter_etat,
+    compter_statistiques,
+    decouper_periode,
+    reconstruire_statistiques,
+    ventiler_statistiques,
+)
+from .taches import executer_job, relancer_interrompus, reserver_job
+from .utils import (
+    get_filtered_sites,
+    parse_date_column,
+    parse_numeric_column,
+    prepare_rows,
+    process_import_file,
+    read_csv_chunks,
+    read_excel_chunks,
+)
+
+ENTETE = [
+    "ID du site",
+    "Département",
+    "Communes",
+    "Localité",
+    "Opérateur",
+    "Latitude du candidat",
+    "Longitude du candidat",
+    "Hauteur antenne",
+    "Description",
+]
+
+
+def fichier_excel(lignes, entete=ENTETE):
+    """Fichier Excel téléversé contenant ``lignes`` (None : ligne vide)."""
+    classeur = openpyxl.Workbook()
+    feuille = classeur.active
+    feuille.append(entete)
+    for ligne in lignes:
+        feuille.append(ligne or [])
+    fichier = io.BytesIO()
+    classeur.save(fichier)
+    fichier.seek(0)
+    fichier.name = "sites.xlsx"
+    return fichier
+
+
+def fichier_csv(lignes, entete=ENTETE, separateur=","):
+    """Fichier CSV téléversé (objet fichier nommé) contenant ``lignes``."""
+    texte = io.StringIO()
+    ecrivain = csv.writer(texte, delimiter=separateur)
+    ecrivain.writerow(entete)
+    ecrivain.writerows(lignes)
+    fichier = io.BytesIO(texte.getvalue().encode("utf-8"))
+    fichier.name = "sites.csv"
+    return fichier
+
+
+LIGNES = [
+    ["S-001", "Littoral", "Cotonou", "Akpakpa", "mtn", "6.37", "2.45", "30", "Toit"],
+    ["S-002", "Littoral", "Cotonou", "Akpakpa", "mtn", "6.38", "2.46", "40", ""],
+]
+
+
+class ImportationTests(TestCase):
+    def importer(self, lignes, simulation=False):
+        return process_import_file(fichier_csv(lignes), simulation=simulation)
+
+    def test_creation(self):
+        erreurs, rapport = self.importer(LIGNES)
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport, {"crees": 2, "mis_a_jour": 0, "inchanges": 0, "disparus": 0})
+        site = Site.objects.select_related("operateur", "localite__commune__departement").get(nom="S-001")
+        self.assertEqual(site.operateur.nom, "MTN")
+        self.assertEqual(site.localite.localite, "akpakpa")
+        self.assertEqual(site.localite.commune.nom, "cotonou")
+        self.assertEqual(site.localite.commune.departement.nom, "littoral")
+        self.assertEqual(site.latitude, Decimal("6.37"))
+        self.assertEqual(site.hauteur_antenne, Decimal("30"))
+        self.assertIsNotNone(site.cellule_grille)
+        self.assertNotEqual(site.empreinte_import, "")
+        self.assertEqual(IndexRechercheSite.objects.count(), 2)
+
+    def test_mise_a_jour(self):
+        self.importer(LIGNES)
+        modifiees = [LIGNES[0][:7] + ["35", ""], LIGNES[1]]
+
+        erreurs, rapport = self.importer(modifiees)
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport, {"crees": 0, "mis_a_jour": 1, "inchanges": 1, "disparus": 0})
+        site = Site.objects.get(nom="S-001")
+        self.assertEqual(site.hauteur_antenne, Decimal("35"))
+        # Une cellule vide n'efface pas la valeur existante
+        self.assertEqual(site.description, "Toit")
+        self.assertEqual(Site.objects.count(), 2)
+
+    def test_reimportation_inchangee(self):
+        self.importer(LIGNES)
+        # Modification qui ne passe pas par save() : l'empreinte reste celle
+        # de l'importation, et un site réécrit perdrait cette valeur
+        Site.objects.filter(nom="S-001").update(observation="hors importation")
+
+        erreurs, rapport = self.importer(LIGNES)
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport, {"crees": 0, "mis_a_jour": 0, "inchanges": 2, "disparus": 0})
+        self.assertEqual(Site.objects.get(nom="S-001").observation, "hors importation")
+
+    def test_sites_disparus(self):
+        self.importer(LIGNES)
+
+        _, rapport = self.importer(LIGNES[:1])
+
+        self.assertEqual(rapport["disparus"], 1)
+        self.assertTrue(Site.objects.filter(nom="S-002").exists())
+
+    def test_operateur_et_localite_inconnus_crees(self):
+        lignes = [["S-010", "Borgou", "Parakou", "Zongo", "Celtiis", "9.3", "2.6", "", ""]]
+
+        erreurs, rapport = self.importer(lignes)
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport["crees"], 1)
+        self.assertTrue(Operateur.objects.filter(nom="CELTIIS").exists())
+        localite = Localite.objects.get(localite="zongo")
+        self.assertEqual(localite.commune.nom, "parakou")
+
+    def test_localite_d_une_autre_commune(self):
+        departement = Departement.objects.create(nom="littoral")
+        commune = Commune.objects.create(nom="cotonou", departement=departement)
+        Localite.objects.create(localite="akpakpa", commune=commune)
+        lignes = [["S-020", "Ouémé", "Porto-Novo", "Akpakpa", "MOOV", "6.5", "2.6", "", ""]]
+
+        erreurs, rapport = self.importer(lignes)
+
+        self.assertEqual(
+            erreurs,
+            [
+                "Ligne 1: Erreur d'intégrité: la localité akpakpa appartient "
+                "à une autre commune que porto-novo"
+            ],
+        )
+        self.assertEqual(rapport["crees"], 0)
+        self.assertFalse(Site.objects.filter(nom="S-020").exists())
+
+    def test_fichier_parquet(self):
+        # Les colonnes Parquet gardent leur type : nombres et dates
+        fichier = io.BytesIO()
+        pd.DataFrame(
+            {
+                "ID du site": ["S-030", "S-031"],
+                "Département": ["Littoral", "Littoral"],
+                "Communes": ["Cotonou", "Cotonou"],
+                "Localité": ["Akpakpa", "Fidjrossè"],
+                "Opérateur": ["MTN", "MOOV"],
+                "Latitude du candidat": [6.37, 6.35],
+                "Longitude du candidat": [2.45, 2.36],
+                "Date autorisation": pd.to_datetime(["2023-01-15", None]),
+            }
+        ).to_parquet(fichier, index=False)
+        fichier.name = "sites.parquet"
+
+        erreurs, rapport = process_import_file(fichier)
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport["crees"], 2)
+        site = Site.objects.get(nom="S-030")
+        self.assertEqual(site.latitude, Decimal("6.37"))
+        self.assertEqual(site.date_autorisation, date(2023, 1, 15))
+        self.assertIsNone(Site.objects.get(nom="S-031").date_autorisation)
+
+    def test_fichier_excel_par_lots(self):
+        entete = ENTETE[:7] + ["Date autorisation"]
+        lignes = [
+            ["S-040", "Littoral", "Cotonou", "Akpakpa", "MTN", 6.37, 2.45, datetime(2023, 1, 15)],
+            None,
+            ["S-041", "Littoral", "Cotonou", "Akpakpa", "MTN", 6.38, 2.46, datetime(2023, 2, 1, 10, 30)],
+            ["S-042", "Littoral", "Cotonou", "Akpakpa", "MOOV", "6.39", "2.47", "2023-03-01"],
+            None,
+            None,
+            ["S-043", "Littoral", "Cotonou", "Akpakpa", "MOOV", 6.4, 2.48, None],
+            # Cellules vides en fin de feuille
+            ["", "", "", "", "", None, None, None],
+        ]
+
+        lots = list(read_excel_chunks(fichier_excel(lignes, entete), chunk_size=2))
+
+        # Lots de deux lignes non vides, numérotées comme dans la feuille
+        self.assertEqual([list(lot.index) for lot in lots], [[1, 3], [4, 7]])
+        self.assertEqual(
+            list(lots[0].columns),
+            [
+                "id_du_site",
+                "departement",
+                "communes",
+                "localite",
+                "operateur",
+                "latitude_du_candidat",
+                "longitude_du_candidat",
+                "date_autorisation",
+            ],
+        )
+        preparees = [ligne for lot in lots for ligne in prepare_rows(lot)[0]]
+        self.assertEqual(
+            [ligne.site["date_autorisation"] for ligne in preparees],
+            [date(2023, 1, 15), date(2023, 2, 1), date(2023, 3, 1), None],
+        )
+        self.assertEqual(preparees[2].site["latitude"], 6.39)
+
+        erreurs, rapport = process_import_file(fichier_excel(lignes, entete))
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport["crees"], 4)
+        self.assertEqual(Site.objects.get(nom="S-041").date_autorisation, date(2023, 2, 1))
+
+    def test_simulation_n_ecrit_rien(self):
+        self.importer(LIGNES[:1])
+        Site.objects.filter(nom="S-001").update(observation="hors importation")
+        modifiees = [LIGNES[0][:7] + ["50", "Toit"], LIGNES[1]]
+        lignes = modifiees + [["S-003", "Borgou", "Parakou", "Zongo", "MOOV", "9.3", "2.6", "", ""]]
+
+        erreurs, rapport = self.importer(lignes, simulation=True)
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(rapport, {"crees": 2, "mis_a_jour": 1, "inchanges": 0, "disparus": 0})
+        self.assertEqual(list(Site.objects.values_list("nom", flat=True)), ["S-001"])
+        site = Site.objects.get(nom="S-001")
+        self.assertEqual(site.hauteur_antenne, Decimal("30"))
+        self.assertEqual(site.observation, "hors importation")
+        self.assertFalse(Operateur.objects.filter(nom="MOOV").exists())
+        self.assertFalse(Departement.objects.filter(nom="borgou").exists())
+
+
+class ImportJobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media, ignore_errors=True)
+
+    def creer_job(self, lignes=LIGNES, nom="sites.csv", **champs):
+        fichier = UploadedFile.objects.create(file=ContentFile(fichier_csv(lignes).getvalue(), name=nom))
+        return ImportJob.objects.create(fichier=fichier, **champs)
+
+    def progression(self, job):
+        return self.client.get(reverse("home:import_progress", args=[job.pk])).json()
+
+    def test_job_reserve_une_seule_fois(self):
+        premier = self.creer_job()
+        second = self.creer_job()
+
+        self.assertEqual(reserver_job().pk, premier.pk)
+        self.assertIsNone(reserver_job(premier.pk))
+        job = reserver_job()
+        self.assertEqual(job.pk, second.pk)
+        self.assertEqual(job.statut, ImportJob.EN_COURS)
+        self.assertEqual(job.worker.rpartition(":")[2], str(os.getpid()))
+        self.assertIsNone(reserver_job())
+
+    def test_execution(self):
+        job = executer_job(reserver_job(self.creer_job().pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.statut, ImportJob.TERMINE)
+        self.assertEqual(job.lignes_traitees, 2)
+        self.assertEqual(job.rapport, {"crees": 2, "mis_a_jour": 0, "inchanges": 0, "disparus": 0})
+        self.assertEqual(job.message, "Fichier traité avec succès.")
+        self.assertIsNotNone(job.fin)
+        self.assertEqual(Site.objects.count(), 2)
+
+    def test_echecs(self):
+        cas = [
+            ("format", {"nom": "sites.txt"}, contextlib.nullcontext(), "Format de fichier non pris en charge : .txt"),
+            (
+                "imprévue",
+                {},
+                mock.patch("apps.home.taches.process_import_file", side_effect=RuntimeError("disque plein")),
+                "disque plein",
+            ),
+        ]
+        for nom, champs, contexte, message in cas:
+            with self.subTest(nom):
+                job = reserver_job(self.creer_job(**champs).pk)
+                with contexte:
+                    executer_job(job)
+
+                job.refresh_from_db()
+                self.assertEqual(job.statut, ImportJob.ECHEC)
+                self.assertTrue(job.message.startswith(message), job.message)
+                self.assertIsNotNone(job.fin)
+                self.assertEqual(Site.objects.count(), 0)
+
+    def test_progression(self):
+        job = self.creer_job(LIGNES + [["S-003", "Littoral", "Cotonou", "Akpakpa", "mtn", "100", "2.45", "", ""]])
+        attendu = {"id": job.pk, "statut": ImportJob.EN_ATTENTE, "termine": False, "lignes_traitees": 0, "erreurs": []}
+        self.assertEqual({cle: self.progression(job)[cle] for cle in attendu}, attendu)
+
+        executer_job(reserver_job(job.pk))
+
+        donnees = self.progression(job)
+        self.assertEqual(donnees["statut"], ImportJob.TERMINE)
+        self.assertEqual(donnees["statut_libelle"], "Terminé")
+        self.assertTrue(donnees["termine"])
+        self.assertEqual(donnees["lignes_traitees"], 3)
+        self.assertEqual(donnees["lignes_en_erreur"], 1)
+        self.assertEqual(donnees["rapport"]["crees"], 2)
+        self.assertEqual(len(donnees["erreurs"]), 1)
+        self.assertIn("Latitude invalide", donnees["erreurs"][0])
+        self.assertEqual(self.client.get(reverse("home:import_progress", args=[0])).status_code, 404)
+
+    def televerser(self):
+        fichier = fichier_csv(LIGNES)
+        return self.client.post(reverse("home:file_upload"), {"file": fichier})
+
+    @override_settings(IMPORT_WORKER_EXTERNE=True)
+    def test_televersement_repond_sans_importer(self):
+        with self.captureOnCommitCallbacks(execute=True) as rappels:
+            reponse = self.televerser()
+
+        job = ImportJob.objects.get()
+        self.assertRedirects(reponse, f"{reverse('home:file_upload')}?job={job.pk}", fetch_redirect_response=False)
+        self.assertEqual(rappels, [])
+        self.assertEqual(job.statut, ImportJob.EN_ATTENTE)
+        self.assertFalse(Site.objects.exists())
+
+    @override_settings(IMPORT_WORKER_EXTERNE=False)
+    def test_televersement_importe_dans_le_processus(self):
+        with mock.patch("apps.home.taches.threading.Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.televerser()
+                # Le thread ne démarre qu'après la validation
+                thread.assert_not_called()
+
+        job = ImportJob.objects.get()
+        self.assertEqual(thread.call_args.kwargs["name"], f"import-{job.pk}")
+        self.assertFalse(Site.objects.exists())
+        # Exécution du thread, sans fermer la connexion du test
+        with mock.patch("apps.home.taches.connection"):
+            thread.call_args.kwargs["target"]()
+        job.refresh_from_db()
+        self.assertEqual(job.statut, ImportJob.TERMINE)
+        self.assertEqual(Site.objects.count(), 2)
+
+    def test_relancer_interrompus(self):
+        hote = socket.gethostname()
+        maintenant = timezone.now()
+        # Processus inexistant : au-delà du maximum des pid Linux
+        cas = [
+            (f"{hote}:{os.getpid()}", maintenant - timedelta(hours=2), ImportJob.EN_COURS),
+            (f"{hote}:99999999", maintenant, ImportJob.EN_ATTENTE),
+            ("autre-machine:12", maintenant - timedelta(minutes=5), ImportJob.EN_COURS),
+            ("autre-machine:13", maintenant - timedelta(hours=1), ImportJob.EN_ATTENTE),
+        ]
+        jobs = [
+            self.creer_job(statut=ImportJob.EN_COURS, worker=worker, debut=actif_le, actif_le=actif_le)
+            for worker, actif_le, _ in cas
+        ]
+
+        self.assertEqual(relancer_interrompus(timedelta(minutes=30)), 2)
+
+        for job, (worker, _, statut) in zip(jobs, cas):
+            with self.subTest(worker=worker):
+                job.refresh_from_db()
+                self.assertEqual(job.statut, statut)
+
+
+# Ligne valide d'un lot, aux noms de colonnes normalisés
+LIGNE_VALIDE = {
+    "id_du_site": "S-100",
+    "departement": "Littoral",
+    "communes": "Cotonou",
+    "localite": "Akpakpa",
+    "operateur": "mtn",
+    "latitude_du_candidat": "6.37",
+    "longitude_du_candidat": "2.45",
+    "date_autorisation": "2023-01-15",
+}
+
+
+def lot(*lignes):
+    """Lot de read_file_chunks : une ligne valide modifiée par chaque dictionnaire."""
+    return pd.DataFrame(
+        [{**LIGNE_VALIDE, **ligne} for ligne in lignes],
+        index=pd.RangeIndex(1, len(lignes) + 1),
+    )
+
+
+class ColonnesTests(SimpleTestCase):
+    def test_parse_numeric_column(self):
+        cas = [
+            ("6.37", 6.37),
+            ("-2", -2.0),
+            (" 1e2 ", 100.0),
+            (12, 12.0),
+            ("6,37", None),
+            ("nord", None),
+            (None, None),
+        ]
+        with self.assertLogs("apps.home.utils", "WARNING") as journal:
+            nombres = parse_numeric_column(pd.Series([valeur for valeur, _ in cas], dtype=object))
+        for (valeur, attendu), nombre in zip(cas, nombres):
+            with self.subTest(valeur=valeur):
+                if attendu is None:
+                    self.assertTrue(np.isnan(nombre))
+                else:
+                    self.assertEqual(nombre, attendu)
+        self.assertEqual(
+            journal.output,
+            [
+                "WARNING:apps.home.utils:Valeur numérique invalide : 6,37",
+                "WARNING:apps.home.utils:Valeur numérique invalide : nord",
+            ],
+        )
+
+    def test_parse_date_column(self):
+        cas = [
+            ("2023-01-15", date(2023, 1, 15), False),
+            ("15/01/2023", date(2023, 1, 15), False),
+            # Jour supérieur à 12 : seul le format mois/jour convient
+            ("01/15/2023", date(2023, 1, 15), False),
+            # Ambiguë : le format jour/mois l'emporte
+            ("02/03/2023", date(2023, 3, 2), False),
+            (pd.Timestamp("2023-05-04 10:30"), date(2023, 5, 4), False),
+            (date(2022, 12, 31), date(2022, 12, 31), False),
+            ("31/02/2023", None, True),
+            ("2023-13-01", None, True),
+            ("15.01.2023", None, True),
+            ("hier", None, True),
+            (None, None, False),
+        ]
+        dates, invalides = parse_date_column(pd.Series([valeur for valeur, *_ in cas], dtype=object))
+        for (valeur, attendu, invalide), resultat, masque in zip(cas, dates, invalides):
+            with self.subTest(valeur=valeur):
+                self.assertEqual(resultat, attendu)
+                self.assertEqual(masque, invalide)
+
+
+class PrepareRowsTests(SimpleTestCase):
+    def assertRejetee(self, ligne, message):
+        lignes, erreurs = prepare_rows(lot(LIGNE_VALIDE, ligne))
+        self.assertEqual(erreurs, [f"Ligne 2: {message}"])
+        self.assertEqual([l.numero for l in lignes], [1])
+
+    def test_ligne_valide(self):
+        lignes, erreurs = prepare_rows(lot({"camouflage": "Oui", "hauteur_antenne": 30}))
+
+        self.assertEqual(erreurs, [])
+        (ligne,) = lignes
+        self.assertEqual(
+            (ligne.numero, ligne.departement, ligne.commune, ligne.localite, ligne.operateur),
+            (1, "littoral", "cotonou", "akpakpa", "MTN"),
+        )
+        self.assertEqual(ligne.site["nom"], "S-100")
+        self.assertEqual(ligne.site["latitude"], 6.37)
+        self.assertEqual(ligne.site["date_autorisation"], date(2023, 1, 15))
+        self.assertIsNone(ligne.site["date_mise_en_service"])
+        self.assertTrue(ligne.site["camouflage"])
+        self.assertEqual(ligne.site["hauteur_antenne"], 30)
+
+    def test_dates_invalides(self):
+        cas = [
+            ({"date_autorisation": "31/02/2023"}, "Format de date incorrect: 31/02/2023"),
+            ({"date_autorisation": "2023-13-01"}, "Format de date incorrect: 2023-13-01"),
+            ({"date_mise_en_service": "15.01.2023"}, "Format de date incorrect: 15.01.2023"),
+            ({"date_mise_en_service": " bientôt "}, "Format de date incorrect: bientôt"),
+        ]
+        for ligne, message in cas:
+            with self.subTest(ligne=ligne):
+                self.assertRejetee(ligne, f"['{message}']")
+
+    def test_coordonnees_hors_limites(self):
+        cas = [
+            ({"latitude_du_candidat": "91"}, "Latitude invalide: 91.0"),
+            ({"latitude_du_candidat": "-90.5"}, "Latitude invalide: -90.5"),
+            ({"longitude_du_candidat": "180.01"}, "Longitude invalide: 180.01"),
+            ({"longitude_du_candidat": "-181"}, "Longitude invalide: -181.0"),
+            # Seul le premier contrôle en échec est signalé
+            (
+                {"latitude_du_candidat": "100", "date_autorisation": "hier"},
+                "Latitude invalide: 100.0",
+            ),
+        ]
+        for ligne, message in cas:
+            with self.subTest(ligne=ligne):
+                self.assertRejetee(ligne, f"['{message}']")
+
+    def test_limites_acceptees(self):
+        lignes, erreurs = prepare_rows(
+            lot({"latitude_du_candidat": "-90", "longitude_du_candidat": "180"})
+        )
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual((lignes[0].site["latitude"], lignes[0].site["longitude"]), (-90.0, 180.0))
+
+    def test_decimales_a_virgule(self):
+        # Une virgule décimale n'est pas un nombre : la coordonnée est
+        # ignorée (signalée dans le journal), la ligne reste importée
+        with self.assertLogs("apps.home.utils", "WARNING") as journal:
+            lignes, erreurs = prepare_rows(
+                lot({"latitude_du_candidat": "6,37", "longitude_du_candidat": "2,45"})
+            )
+
+        self.assertEqual(erreurs, [])
+        self.assertIsNone(lignes[0].site["latitude"])
+        self.assertIsNone(lignes[0].site["longitude"])
+        self.assertIn("WARNING:apps.home.utils:Valeur numérique invalide : 6,37", journal.output)
+
+    def test_valeurs_requises(self):
+        cas = [
+            (
+                {"localite": "  "},
+                "Département, commune et localité requis "
+                "(Département: littoral, Commune: cotonou, Localité: )",
+            ),
+            (
+                {"departement": None, "communes": None},
+                "Département, commune et localité requis "
+                "(Département: , Commune: , Localité: akpakpa)",
+            ),
+            ({"operateur": ""}, "Opérateur requis"),
+            # Lieu contrôlé avant l'opérateur
+            (
+                {"communes": "", "operateur": ""},
+                "Département, commune et localité requis "
+                "(Département: littoral, Commune: , Localité: akpakpa)",
+            ),
+        ]
+        for ligne, message in cas:
+            with self.subTest(ligne=ligne):
+                self.assertRejetee(ligne, f"['{message}']")
+
+    def test_colonnes_requises_absentes(self):
+        cas = [
+            (
+                "localite",
+                "Département, commune et localité requis "
+                "(Département: littoral, Commune: cotonou, Localité: )",
+            ),
+            ("operateur", "Opérateur requis"),
+        ]
+        for colonne, message in cas:
+            with self.subTest(colonne=colonne):
+                lignes, erreurs = prepare_rows(lot({}, {}).drop(columns=colonne))
+                self.assertEqual(lignes, [])
+                self.assertEqual(erreurs, [f"Ligne 1: ['{message}']", f"Ligne 2: ['{message}']"])
+
+    def test_colonnes_facultatives_absentes(self):
+        lignes, erreurs = prepare_rows(
+            lot({}).drop(columns=["id_du_site", "latitude_du_candidat", "date_autorisation"])
+        )
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(lignes[0].site["nom"], "Site_1")
+        self.assertIsNone(lignes[0].site["latitude"])
+        self.assertIsNone(lignes[0].site["date_autorisation"])
+
+    def test_entetes_accentues_et_renommes(self):
+        entete = [
+            "ID du Site",
+            "DÉPARTEMENT",
+            "Communes",
+            "Localité",
+            "Opérateur",
+            "Latitude du candidat",
+            "Longitude du candidat",
+            "Date Autorisation",
+            "Avis de l'ARCEP Bénin",
+            "N° dossier",
+            "Propriétaire site",
+            "Colonne inconnue",
+        ]
+        ligne = [
+            "S-200", "Ouémé", "Porto-Novo", "Djègan", "moov", "6.5", "2.6",
+            "15/01/2023", "Favorable", "D-12", "Commune", "ignorée",
+        ]
+        fichier = fichier_csv([ligne], entete=entete, separateur=";")
+
+        (chunk,) = read_csv_chunks(fichier)
+        lignes, erreurs = prepare_rows(chunk)
+
+        self.assertEqual(erreurs, [])
+        (ligne,) = lignes
+        self.assertEqual(
+            (ligne.departement, ligne.commune, ligne.localite, ligne.operateur),
+            ("ouémé", "porto-novo", "djègan", "MOOV"),
+        )
+        self.assertEqual(ligne.site["nom"], "S-200")
+        self.assertEqual(ligne.site["date_autorisation"], date(2023, 1, 15))
+        self.assertEqual(ligne.site["avis_arcep"], "Favorable")
+        self.assertEqual(ligne.site["num_dossier"], "D-12")
+        self.assertEqual(ligne.site["proprietaire"], "Commune")
+
+
+class DecouperPeriodeTests(SimpleTestCase):
+    def test_decoupage(self):
+        d = date
+        cas = [
+            ((None, None), (None, None, [])),
+            ((d(2023, 1, 1), d(2023, 3, 31)), (d(2023, 1, 1), d(2023, 3, 1), [])),
+            ((None, d(2023, 2, 28)), (None, d(2023, 2, 1), [])),
+            ((d(2023, 1, 1), None), (d(2023, 1, 1), None, [])),
+            (
+                (d(2023, 1, 15), d(2023, 3, 31)),
+                (d(2023, 2, 1), d(2023, 3, 1), [(d(2023, 1, 15), d(2023, 1, 31))]),
+            ),
+            (
+                (d(2023, 1, 1), d(2023, 3, 10)),
+                (d(2023, 1, 1), d(2023, 2, 1), [(d(2023, 3, 1), d(2023, 3, 10))]),
+            ),
+            (
+                (d(2023, 1, 15), d(2023, 3, 10)),
+                (
+                    d(2023, 2, 1),
+                    d(2023, 2, 1),
+                    [(d(2023, 1, 15), d(2023, 1, 31)), (d(2023, 3, 1), d(2023, 3, 10))],
+                ),
+            ),
+            # Mois voisins : deux morceaux, aucun mois complet
+            (
+                (d(2023, 1, 20), d(2023, 2, 10)),
+                (
+                    d(2023, 2, 1),
+                    d(2023, 1, 1),
+                    [(d(2023, 1, 20), d(2023, 1, 31)), (d(2023, 2, 1), d(2023, 2, 10))],
+                ),
+            ),
+            # Période dans un seul mois : un seul morceau
+            (
+                (d(2023, 1, 10), d(2023, 1, 20)),
+                (d(2023, 2, 1), d(2022, 12, 1), [(d(2023, 1, 10), d(2023, 1, 20))]),
+            ),
+            (
+                (d(2023, 3, 1), d(2023, 3, 1)),
+                (d(2023, 3, 1), d(2023, 2, 1), [(d(2023, 3, 1), d(2023, 3, 1))]),
+            ),
+            # Fin de février d'une année bissextile
+            (
+                (d(2024, 2, 15), None),
+                (d(2024, 3, 1), None, [(d(2024, 2, 15), d(2024, 2, 29))]),
+            ),
+            ((None, d(2024, 2, 29)), (None, d(2024, 2, 1), [])),
+        ]
+        for periode, attendu in cas:
+            with self.subTest(periode=periode):
+                self.assertEqual(decouper_periode(*periode), attendu)
+
+
+def contenu_agregats():
+    """Lignes des tables de statistiques et de densité, dans un ordre stable."""
+    return (
+        sorted(
+            StatistiqueSite.objects.values_list(
+                "operateur_id", "departement_id", "commune_id", "mois", "etat", "nombre"
+            ),
+            key=repr,
+        ),
+        sorted(
+            DensiteSite.objects.values_list("operateur_id", "technologie_id", "cellule", "nombre"),
+            key=repr,
+        ),
+    )
+
+
+class StatistiquesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mtn = Operateur.objects.create(nom="MTN")
+        cls.moov = Operateur.objects.create(nom="MOOV")
+        departement = Departement.objects.create(nom="littoral")
+        commune = Commune.objects.create(nom="cotonou", departement=departement)
+        cls.akpakpa = Localite.objects.create(localite="akpakpa", commune=commune)
+        autre = Commune.objects.create(nom="parakou", departement=Departement.objects.create(nom="borgou"))
+        cls.zongo = Localite.objects.create(localite="zongo", commune=autre)
+        cls.t4g = Technologie.objects.create(nom="4G")
+        cls.t3g = Technologie.objects.create(nom="3G")
+
+        dates = [
+            date(2023, 1, 5), date(2023, 1, 20), date(2023, 1, 31), date(2023, 2, 1),
+            date(2023, 2, 14), date(2023, 3, 1), date(2023, 3, 31), None,
+        ]
+        for numero, date_autorisation in enumerate(dates):
+            site = Site.objects.create(
+                nom=f"S-{numero}",
+                operateur=cls.mtn if numero % 2 else cls.moov,
+                localite=cls.akpakpa if numero % 3 else cls.zongo,
+                date_autorisation=date_autorisation,
+                latitude=Decimal("6.3") + numero,
+                longitude=Decimal("2.4"),
+            )
+            site.technologies.add(cls.t4g)
+            if numero % 4 == 0:
+                site.technologies.add(cls.t3g)
+            if numero % 3 != 2:
+                Conformite.objects.create(
+                    site=site, rapport="Uploads/pdf/r.pdf",
+                    date_inspection=date(2023, 6, 1), statut=numero % 3 == 0,
+                )
+
+    def assertAgregatsAJour(self):
+        incrementaux = contenu_agregats()
+        reconstruire_statistiques()
+        reconstruire_densites()
+        self.assertEqual(incrementaux, contenu_agregats())
+        self.assertFalse(StatistiqueSite.objects.filter(nombre__lte=0).exists())
+        self.assertFalse(DensiteSite.objects.filter(nombre__lte=0).exists())
+
+    def attendu(self, date_debut=None, date_fin=None, operateur_id=None, conformite=None):
+        """Les compteurs de compter_statistiques(), calculés directement sur les sites."""
+        sites = Site.objects.all()
+        if date_debut:
+            sites = sites.filter(date_autorisation__gte=date_debut)
+        if date_fin:
+            sites = sites.filter(date_autorisation__lte=date_fin)
+        if operateur_id:
+            sites = sites.filter(operateur_id=operateur_id)
+        rapports = sites.filter(conformite__isnull=False)
+        if conformite:
+            rapports = rapports.filter(conformite__statut=conformite == "conforme")
+        return {
+            "sites_count": sites.count(),
+            "conformite_count": rapports.count(),
+            "operateurs_count": sites.values("operateur").distinct().count(),
+            "conformes_count": rapports.filter(conformite__statut=True).count(),
+            "non_conformes_count": rapports.filter(conformite__statut=False).count(),
+        }
+
+    def test_compter_statistiques(self):
+        d = date
+        cas = [
+            {},
+            {"date_debut": d(2023, 1, 1), "date_fin": d(2023, 3, 31)},
+            {"date_debut": d(2023, 1, 15), "date_fin": d(2023, 2, 10)},
+            {"date_debut": d(2023, 1, 10), "date_fin": d(2023, 1, 25)},
+            {"date_debut": d(2023, 2, 1)},
+            {"date_fin": d(2023, 1, 31)},
+            {"operateur_id": self.mtn.pk},
+            {"conformite": "conforme"},
+            {"conformite": "non-conforme", "date_debut": d(2023, 1, 6)},
+            {"date_debut": d(2024, 1, 1)},
+        ]
+        for filtres in cas:
+            with self.subTest(**filtres):
+                self.assertEqual(compter_statistiques(**filtres), self.attendu(**filtres))
+
+    def ventilation(self, **parametres):
+        self.client.force_login(User.objects.get_or_create(username="analyste")[0])
+        return self.client.get(reverse("home:get_statistics_breakdown"), parametres)
+
+    def ventilation_attendue(self, dimensions, date_debut=None, date_fin=None):
+        """Les groupes de ventiler_statistiques(), comptés directement sur les sites."""
+        sites = Site.objects.select_related("localite__commune", "conformite")
+        if date_debut:
+            sites = sites.filter(date_autorisation__gte=date_debut)
+        if date_fin:
+            sites = sites.filter(date_autorisation__lte=date_fin)
+        groupes = {}
+        for site in sites:
+            valeurs = {
+                "operateur": site.operateur_id,
+                "commune": site.localite.commune_id,
+                "mois": site.date_autorisation and site.date_autorisation.strftime("%Y-%m"),
+            }
+            statut = getattr(getattr(site, "conformite", None), "statut", None)
+            compteurs = groupes.setdefault(tuple(valeurs[dim] for dim in dimensions), [0, 0, 0])
+            compteurs[0] += 1
+            if statut is not None:
+                compteurs[1 if statut else 2] += 1
+        return sorted(((cle, tuple(compteurs)) for cle, compteurs in groupes.items()), key=repr)
+
+    def groupes(self, resultats, dimensions):
+        groupes = [
+            (
+                tuple(entree.get(f"{dim}_id", entree[dim]) for dim in dimensions),
+                (entree["sites_count"], entree["conformes_count"], entree["non_conformes_count"]),
+            )
+            for entree in resultats
+        ]
+        return sorted(groupes, key=repr)
+
+    def test_ventilation_parametres_invalides(self):
+        cas = [
+            {},
+            {"group_by": ""},
+            {"group_by": "inconnue"},
+            {"group_by": "operateur,inconnue"},
+            {"group_by": "operateur", "operateur": "mtn"},
+            {"group_by": "operateur", "date_from": "01/01/2023"},
+        ]
+        for parametres in cas:
+            with self.subTest(**parametres):
+                reponse = self.ventilation(**parametres)
+                self.assertEqual(reponse.status_code, 400)
+                self.assertIn("error", reponse.json())
+
+        reponse = self.ventilation(group_by=["operateur, mois", "mois"])
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()["dimensions"], ["operateur", "mois"])
+
+    def test_ventilation_mois_partiels(self):
+        d = date
+        # Les mois partiels sont comptés sur les sites, les mois complets
+        # dans la table d'agrégats
+        cas = [
+            (["mois"], {}),
+            (["operateur", "mois"], {"date_debut": d(2023, 1, 15), "date_fin": d(2023, 2, 10)}),
+            (["mois", "commune"], {"date_debut": d(2023, 1, 20), "date_fin": d(2023, 3, 31)}),
+            (["mois"], {"date_debut": d(2023, 1, 10), "date_fin": d(2023, 1, 25)}),
+            (["operateur"], {"date_debut": d(2023, 2, 2)}),
+            (["commune"], {"date_fin": d(2023, 3, 30)}),
+        ]
+        for dimensions, filtres in cas:
+            with self.subTest(dimensions=dimensions, **filtres):
+                self.assertEqual(
+                    self.groupes(ventiler_statistiques(dimensions, **filtres), dimensions),
+                    self.ventilation_attendue(dimensions, **filtres),
+                )
+
+        reponse = self.ventilation(group_by="mois", date_from="2023-01-15", date_to="2023-02-10")
+        self.assertEqual(
+            [(entree["mois"], entree["sites_count"]) for entree in reponse.json()["resultats"]],
+            [("2023-01", 2), ("2023-02", 1)],
+        )
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_ventilation_cache_invalidee(self):
+        with mock.patch("apps.home.utils.ventiler_statistiques", wraps=ventiler_statistiques) as calcul:
+            premiere = self.ventilation(group_by="operateur").json()
+            self.assertEqual(self.ventilation(group_by="operateur").json(), premiere)
+            self.assertEqual(calcul.call_count, 1)
+
+            site = Site.objects.get(nom="S-1")
+            site.operateur = self.moov
+            site.save()
+            apres = self.ventilation(group_by="operateur").json()
+
+        self.assertEqual(calcul.call_count, 2)
+        self.assertNotEqual(apres, premiere)
+        self.assertEqual(
+            self.groupes(apres["resultats"], ["operateur"]), self.ventilation_attendue(["operateur"])
+        )
+
+    def test_donnees_parametres_invalides(self):
+        self.client.force_login(User.objects.create(username="analyste"))
+        url = reverse("home:get_statistics_data")
+        for parametres in ({"operateur": "mtn"}, {"operateur": "-1"}, {"date_to": "2023-13-01"}):
+            with self.subTest(**parametres):
+                reponse = self.client.get(url, parametres)
+                self.assertEqual(reponse.status_code, 400)
+                self.assertIn("error", reponse.json())
+
+        reponse = self.client.get(url, {"operateur": self.mtn.pk})
+        self.assertEqual(reponse.json(), self.attendu(operateur_id=self.mtn.pk))
+
+    def test_table_reconstruite_identique(self):
+        self.assertAgregatsAJour()
+
+    def test_suppression_site(self):
+        Site.objects.get(nom="S-0").delete()
+        Site.objects.get(nom="S-7").delete()
+
+        self.assertAgregatsAJour()
+
+    def test_changement_operateur(self):
+        site = Site.objects.get(nom="S-1")
+        site.operateur = self.moov
+        site.save()
+
+        self.assertAgregatsAJour()
+
+    def test_changement_lieu_et_date(self):
+        site = Site.objects.get(nom="S-4")
+        site.localite = self.zongo
+        site.date_autorisation = date(2022, 12, 31)
+        site.latitude = Decimal("9.3")
+        site.save()
+
+        self.assertAgregatsAJour()
+
+    def test_creation_et_suppression_conformite(self):
+        Conformite.objects.create(
+            site=Site.objects.get(nom="S-2"), rapport="Uploads/pdf/r.pdf",
+            date_inspection=date(2023, 6, 1), statut=True,
+        )
+        self.assertAgregatsAJour()
+
+        Conformite.objects.get(site__nom="S-3").delete()
+        self.assertAgregatsAJour()
+
+    def test_suppression_lien_technologie(self):
+        SiteTechnologie.objects.get(site__nom="S-0", technologie=self.t3g).delete()
+        Site.objects.get(nom="S-1").technologies.remove(self.t4g)
+
+        self.assertAgregatsAJour()
+
+    def test_ligne_videe_supprimee(self):
+        # S-7 est le seul site sans date d'autorisation
+        site = Site.objects.get(nom="S-7")
+        cle = {"operateur": site.operateur, "mois": None}
+        self.assertEqual(StatistiqueSite.objects.filter(**cle).count(), 1)
+
+        site.delete()
+
+        self.assertFalse(StatistiqueSite.objects.filter(**cle).exists())
+
+
+class DensiteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mtn = Operateur.objects.create(nom="MTN")
+        cls.moov = Operateur.objects.create(nom="MOOV")
+        cls.t4g = Technologie.objects.create(nom="4G")
+        cls.t3g = Technologie.objects.create(nom="3G")
+
+    def densites(self):
+        return sorted(DensiteSite.objects.values_list("operateur_id", "technologie_id", "cellule", "nombre"), key=repr)
+
+    def assertDensitesAJour(self):
+        incrementales = self.densites()
+        reconstruire_densites()
+        self.assertEqual(incrementales, self.densites())
+        self.assertFalse(DensiteSite.objects.filter(nombre__lte=0).exists())
+
+    def creer(self, nom, latitude, longitude, operateur=None, technologies=()):
+        site = Site.objects.create(
+            nom=nom,
+            operateur=operateur or self.mtn,
+            latitude=latitude and Decimal(latitude),
+            longitude=longitude and Decimal(longitude),
+        )
+        site.technologies.add(*technologies)
+        return site
+
+    def test_creation(self):
+        self.creer("S-1", "6.37", "2.45", technologies=[self.t4g, self.t3g])
+        self.creer("S-2", "6.371", "2.451", technologies=[self.t4g])
+        self.creer("S-3", "9.3", "2.6", operateur=self.moov)
+        # Sans coordonnées, ou hors de la grille du Bénin
+        self.creer("S-4", None, None, technologies=[self.t4g])
+        self.creer("S-5", "48.85", "2.35", technologies=[self.t4g])
+        SiteTechnologie.objects.create(site=Site.objects.get(nom="S-3"), technologie=self.t3g)
+
+        cotonou = cellule_densite(6.37, 2.45)
+        self.assertEqual(
+            set(DensiteSite.objects.filter(cellule=cotonou).values_list("operateur_id", "technologie_id", "nombre")),
+            {(self.mtn.pk, None, 2), (None, self.t4g.pk, 2), (None, self.t3g.pk, 1)},
+        )
+        self.assertDensitesAJour()
+
+    def test_deplacements(self):
+        site = self.creer("S-1", "6.37", "2.45", technologies=[self.t4g, self.t3g])
+        self.creer("S-2", "6.37", "2.45", technologies=[self.t4g])
+        cas = [
+            ("autre cellule", {"latitude": Decimal("7.2"), "longitude": Decimal("2.1")}),
+            ("autre opérateur", {"operateur": self.moov}),
+            ("hors de la grille", {"latitude": Decimal("48.85")}),
+            ("sans coordonnées", {"latitude": None, "longitude": None}),
+            ("retour dans la grille", {"latitude": Decimal("6.37"), "longitude": Decimal("2.45")}),
+        ]
+        for nom, champs in cas:
+            with self.subTest(nom):
+                for champ, valeur in champs.items():
+                    setattr(site, champ, valeur)
+                site.save()
+                self.assertDensitesAJour()
+
+    def test_suppressions(self):
+        site = self.creer("S-1", "6.37", "2.45", technologies=[self.t4g, self.t3g])
+        autre = self.creer("S-2", "6.37", "2.45", technologies=[self.t4g, self.t3g])
+
+        SiteTechnologie.objects.get(site=autre, technologie=self.t3g).delete()
+        self.assertDensitesAJour()
+        autre.technologies.remove(self.t4g)
+        self.assertDensitesAJour()
+        site.delete()
+        self.assertDensitesAJour()
+        autre.delete()
+        self.assertEqual(self.densites(), [])
+        self.assertDensitesAJour()
+
+
+class SiteTableTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operateurs = [Operateur.objects.create(nom=nom) for nom in ("MOOV", "MTN", "CELTIIS")]
+        for numero in range(25):
+            site = Site.objects.create(nom=f"S-{numero:02d}", operateur=operateurs[numero % 3])
+            if numero % 4 == 0:
+                Conformite.objects.create(
+                    site=site, rapport="Uploads/pdf/r.pdf",
+                    date_inspection=date(2023, 6, 1), statut=numero % 8 == 0,
+                )
+
+    def page(self, **parametres):
+        reponse = self.client.get(reverse("home:site_table"), parametres)
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def parcourir(self, tri, taille):
+        """Parcourt le tableau en avant puis en arrière ; retourne les deux suites d'ids."""
+        pages = [self.page(tri=tri, taille=taille)]
+        while pages[-1]["suivant"]:
+            pages.append(self.page(tri=tri, taille=taille, apres=pages[-1]["suivant"]))
+        en_avant = [[site["id"] for site in page["sites"]] for page in pages]
+
+        en_arriere = [en_avant[-1]]
+        precedent = pages[-1]["precedent"]
+        while precedent:
+            page = self.page(tri=tri, taille=taille, avant=precedent)
+            en_arriere.insert(0, [site["id"] for site in page["sites"]])
+            precedent = page["precedent"]
+        return en_avant, en_arriere
+
+    def test_parcours_complet(self):
+        cas = [
+            ("nom", lambda s: (s.nom, s.pk)),
+            ("-nom", lambda s: (s.nom, s.pk)),
+            # Clés non uniques : les égalités sont départagées par l'id
+            ("operateur", lambda s: (s.operateur.nom, s.pk)),
+            ("-operateur", lambda s: (s.operateur.nom, s.pk)),
+            ("conformite", lambda s: (s.etat, s.pk)),
+            ("-conformite", lambda s: (s.etat, s.pk)),
+        ]
+        sites = list(annoter_etat(Site.objects.select_related("operateur")))
+        for tri, cle in cas:
+            for taille in (1, 7, 25, 100):
+                with self.subTest(tri=tri, taille=taille):
+                    en_avant, en_arriere = self.parcourir(tri, taille)
+                    attendu = [s.pk for s in sorted(sites, key=cle, reverse=tri.startswith("-"))]
+                    self.assertEqual(sum(en_avant, []), attendu)
+                    self.assertEqual(en_arriere, en_avant)
+                    self.assertTrue(all(len(ids) == taille for ids in en_avant[:-1]))
+
+    def test_premiere_et_derniere_page(self):
+        premiere = self.page(taille=10)
+        self.assertIsNone(premiere["precedent"])
+        self.assertEqual([s["nom"] for s in premiere["sites"]][:2], ["S-00", "S-01"])
+
+        derniere = self.page(taille=10, apres=encoder_curseur("S-19", Site.objects.get(nom="S-19").pk))
+        self.assertEqual([s["nom"] for s in derniere["sites"]], [f"S-{n}" for n in range(20, 25)])
+        self.assertIsNone(derniere["suivant"])
+        self.assertIsNotNone(derniere["precedent"])
+
+        # Page pleine en bout de tableau : pas de page suivante vide
+        pleine = self.page(taille=5, apres=encoder_curseur("S-19", Site.objects.get(nom="S-19").pk))
+        self.assertEqual(len(pleine["sites"]), 5)
+        self.assertIsNone(pleine["suivant"])
+
+    def test_page_vide_apres_la_fin(self):
+        fin = self.page(apres=encoder_curseur("S-24", Site.objects.get(nom="S-24").pk))
+
+        self.assertEqual(fin, {"sites": [], "suivant": None, "precedent": None})
+
+    def test_curseur_invalide(self):
+        def brut(texte):
+            return base64.urlsafe_b64encode(texte.encode("utf-8")).decode("ascii")
+
+        curseurs = [
+            "pas un curseur",
+            "é",
+            brut("pas du json"),
+            brut("[1]"),
+            brut('["S-01", 2, 3]'),
+            brut('["S-01", "deux"]'),
+            brut('["S-01", null]'),
+            brut('["S-01", true]'),
+            brut('[null, 2]'),
+            brut('[{"nom": "S-01"}, 2]'),
+            brut('[["S-01"], 2]'),
+            brut('"S-01"'),
+        ]
+        for curseur in curseurs:
+            for sens in ("apres", "avant"):
+                with self.subTest(curseur=curseur, sens=sens):
+                    reponse = self.client.get(reverse("home:site_table"), {sens: curseur})
+                    self.assertEqual(reponse.status_code, 400)
+                    self.assertEqual(reponse.json(), {"error": "Curseur de pagination invalide."})
+
+    def test_parametres_invalides(self):
+        for parametres in ({"tri": "latitude"}, {"taille": "dix"}, {"conformite": "peut-etre"}):
+            with self.subTest(**parametres):
+                reponse = self.client.get(reverse("home:site_table"), parametres)
+                self.assertEqual(reponse.status_code, 400)
+
+
+def decoder_binaire(tampon):
+    """Décode une réponse ``format=binaire`` comme le client de la carte."""
+    (longueur,) = struct.unpack_from("<I", tampon)
+    entete = json.loads(tampon[4 : 4 + longueur])
+    decalage = 4 + longueur
+    colonnes = {}
+    for nom, type_ in COLONNES_BINAIRES:
+        colonne = np.frombuffer(tampon, dtype=type_, count=entete["nombre"], offset=decalage)
+        # Un tableau typé JavaScript exige un décalage multiple de sa taille
+        assert decalage % colonne.itemsize == 0, nom
+        colonnes[nom] = colonne
+        decalage += colonne.nbytes
+    assert decalage == len(tampon)
+    return entete, colonnes
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mtn = Operateur.objects.create(nom="MTN")
+        moov = Operateur.objects.create(nom="MOOV")
+        commune = Commune.objects.create(nom="cotonou", departement=Departement.objects.create(nom="littoral"))
+        localite = Localite.objects.create(localite="akpakpa", commune=commune)
+        sites = [
+            ("S-1", cls.mtn, "6.37", "2.45", True),
+            ("S-2", moov, "6.38", "2.46", False),
+            ("S-3", cls.mtn, None, None, None),
+        ]
+        for nom, operateur, latitude, longitude, statut in sites:
+            site = Site.objects.create(
+                nom=nom,
+                operateur=operateur,
+                localite=localite,
+                latitude=latitude and Decimal(latitude),
+                longitude=longitude and Decimal(longitude),
+                hauteur_antenne=Decimal("30"),
+                description="Toit ; terrasse",
+            )
+            if statut is not None:
+                Conformite.objects.create(
+                    site=site, rapport="Uploads/pdf/r.pdf", date_inspection=date(2023, 6, 1), statut=statut
+                )
+
+    def get(self, nom, **parametres):
+        return self.client.get(reverse(nom), parametres)
+
+    def contenu(self, reponse):
+        self.assertEqual(reponse.status_code, 200)
+        return b"".join(reponse.streaming_content).decode("utf-8")
+
+    def test_csv_filtre(self):
+        texte = self.contenu(self.get("home:site_export", operateur=self.mtn.pk))
+
+        self.assertTrue(texte.startswith("\ufeff"))
+        lignes = list(csv.reader(io.StringIO(texte[1:]), delimiter=";"))
+        self.assertEqual(lignes[0], ENTETES)
+        sites = [dict(zip(ENTETES, ligne)) for ligne in lignes[1:]]
+        self.assertEqual([site["ID du site"] for site in sites], ["S-1", "S-3"])
+        self.assertEqual(sites[0]["Opérateur"], "MTN")
+        self.assertEqual(sites[0]["Communes"], "cotonou")
+        self.assertEqual(sites[0]["Camouflage"], "Non")
+        self.assertEqual(sites[0]["Conformité"], "Conforme")
+        self.assertEqual(sites[0]["Description"], "Toit ; terrasse")
+        self.assertEqual(sites[1]["Conformité"], "Sans rapport")
+        self.assertEqual(sites[1]["Latitude du candidat"], "")
+
+    def test_xlsx_filtre(self):
+        reponse = self.get("home:site_export", format="xlsx", conformite="non-conforme")
+        self.assertEqual(reponse.status_code, 200)
+
+        classeur = openpyxl.load_workbook(io.BytesIO(b"".join(reponse.streaming_content)), read_only=True)
+        lignes = list(classeur.active.iter_rows(values_only=True))
+        self.assertEqual(list(lignes[0]), ENTETES)
+        self.assertEqual(len(lignes), 2)
+        site = dict(zip(ENTETES, lignes[1]))
+        self.assertEqual(site["ID du site"], "S-2")
+        self.assertEqual(site["Conformité"], "Non conforme")
+        self.assertEqual(site["Hauteur antenne"], 30)
+
+    def test_format_export_invalide(self):
+        self.assertEqual(self.get("home:site_export", format="pdf").status_code, 400)
+
+    def test_flux_geojson(self):
+        donnees = json.loads(
+            self.contenu(self.get("home:site_feed", operateur=self.mtn.pk, proprietes="nom, hauteur_antenne"))
+        )
+
+        self.assertEqual(donnees["type"], "FeatureCollection")
+        entites = {entite["properties"]["nom"]: entite for entite in donnees["features"]}
+        self.assertEqual(set(entites), {"S-1", "S-3"})
+        self.assertEqual(entites["S-1"]["geometry"], {"type": "Point", "coordinates": [2.45, 6.37]})
+        self.assertEqual(entites["S-1"]["properties"], {"nom": "S-1", "hauteur_antenne": "30.00"})
+        self.assertIsNone(entites["S-3"]["geometry"])
+
+    def test_flux_ndjson(self):
+        texte = self.contenu(self.get("home:site_feed", format="ndjson", conformite="conforme"))
+
+        entites = [json.loads(ligne) for ligne in texte.splitlines()]
+        self.assertEqual(len(entites), 1)
+        self.assertEqual(list(entites[0]["properties"]), PROPRIETES_DEFAUT)
+        self.assertEqual(entites[0]["properties"]["conformite"], "Conforme")
+
+    def test_flux_par_blocs(self):
+        with mock.patch("apps.home.export.TAILLE_LOT", 2):
+            donnees = json.loads("".join(flux_geojson(Site.objects.all())))
+            lignes = "".join(flux_ndjson(Site.objects.all())).splitlines()
+        self.assertEqual([entite["properties"]["nom"] for entite in donnees["features"]], ["S-1", "S-2", "S-3"])
+        self.assertEqual(len(lignes), 3)
+
+    def test_flux_vide(self):
+        self.assertEqual(
+            json.loads("".join(flux_geojson(Site.objects.none()))), {"type": "FeatureCollection", "features": []}
+        )
+        self.assertEqual("".join(flux_ndjson(Site.objects.none())), "")
+        donnees = json.loads(self.contenu(self.get("home:site_feed", operateur=0)))
+        self.assertEqual(donnees["features"], [])
+
+    def test_proprietes(self):
+        self.assertEqual(parse_proprietes(None), PROPRIETES_DEFAUT)
+        self.assertEqual(parse_proprietes("nom,,commune "), ["nom", "commune"])
+        with self.assertRaisesMessage(ValueError, "Propriété(s) inconnue(s) : latitude, secret"):
+            parse_proprietes("nom,latitude,secret")
+
+        reponse = self.get("home:site_feed", proprietes="nom,secret")
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn("secret", reponse.json()["error"])
+        self.assertEqual(self.get("home:site_feed", format="kml").status_code, 400)
+
+
+class CarteFormatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mtn = Operateur.objects.create(nom="MTN", couleur="#ffcc00")
+        moov = Operateur.objects.create(nom="MOOV", couleur="#0066cc")
+        commune = Commune.objects.create(nom="cotonou", departement=Departement.objects.create(nom="littoral"))
+        localites = [
+            Localite.objects.create(localite=nom, commune=commune) for nom in ("akpakpa", "cadjehoun")
+        ]
+        coordonnees = [
+            (Decimal("6.365432123456"), Decimal("2.418765432109")),
+            (Decimal("-6.5"), Decimal("-2.000001")),
+            (Decimal("6.4"), Decimal("2.5")),
+            (Decimal("89.999999"), Decimal("179.999999")),
+            (Decimal("6.37"), Decimal("2.39")),
+        ]
+        statuts = [True, False, None, None, True]
+        for numero, ((latitude, longitude), statut) in enumerate(zip(coordonnees, statuts)):
+            site = Site.objects.create(
+                nom=f"S-{numero}",
+                operateur=(mtn, moov)[numero % 2],
+                localite=localites[numero % 2] if numero != 2 else None,
+                latitude=latitude,
+                longitude=longitude,
+            )
+            if statut is not None:
+                Conformite.objects.create(
+                    site=site, rapport="Uploads/pdf/r.pdf", date_inspection=date(2023, 6, 1), statut=statut,
+                )
+        # Sans coordonnées : absent de la carte
+        Site.objects.create(nom="S-sans", operateur=mtn)
+
+    def carte(self, **parametres):
+        reponse = self.client.get(
+            reverse("home:map"), {"zoom": 15, **parametres}, headers={"X-Requested-With": "XMLHttpRequest"}
+        )
+        self.assertEqual(reponse.status_code, 200)
+        return reponse
+
+    def test_binaire_identique_au_compact(self):
+        compact = self.carte(format="compact").json()
+        reponse = self.carte(format="binaire")
+        self.assertEqual(reponse["Content-Type"], "application/octet-stream")
+
+        entete, colonnes = decoder_binaire(reponse.content)
+
+        self.assertEqual(entete.pop("format"), "binaire")
+        self.assertEqual(compact.pop("format"), "compact")
+        self.assertEqual(entete.pop("nombre"), 5)
+        for nom, _ in COLONNES_BINAIRES:
+            with self.subTest(colonne=nom):
+                self.assertEqual(colonnes[nom].tolist(), compact.pop(nom))
+        self.assertEqual(entete, compact)
+
+    def test_binaire_identique_aux_objets(self):
+        # Les formats en colonnes écartent les sites sans coordonnées
+        objets = [site for site in self.carte().json()["sites"] if site["latitude"] is not None]
+        entete, colonnes = decoder_binaire(self.carte(format="binaire").content)
+        conformites = {
+            site.pk: CODES_CONFORMITE[site.conformite.statut if hasattr(site, "conformite") else None]
+            for site in Site.objects.select_related("conformite")
+        }
+
+        self.assertEqual(sorted(site["id"] for site in objets), colonnes["ids"].tolist())
+        par_id = {site["id"]: site for site in objets}
+        for rang, identifiant in enumerate(colonnes["ids"].tolist()):
+            site = par_id[identifiant]
+            with self.subTest(site=site["nom"]):
+                self.assertEqual(entete["noms"][rang], site["nom"])
+                self.assertAlmostEqual(
+                    colonnes["latitudes"][rang] / ECHELLE_COORDONNEES, float(site["latitude"]), places=6
+                )
+                self.assertAlmostEqual(
+                    colonnes["longitudes"][rang] / ECHELLE_COORDONNEES, float(site["longitude"]), places=6
+                )
+                operateur = entete["operateurs"][colonnes["operateurs_index"][rang]]
+                self.assertEqual(operateur["nom"], site["operateur_nom"])
+                localite = colonnes["localites_index"][rang]
+                self.assertEqual(entete["localites"][localite] if localite >= 0 else "", site["localite"])
+                self.assertEqual(colonnes["conformites"][rang], conformites[identifiant])
+
+    def test_emprise_vide(self):
+        # Emprise sans aucun site
+        parametres = {"bbox": "10,40,11,41"}
+        compact = self.carte(format="compact", **parametres).json()
+        entete, colonnes = decoder_binaire(self.carte(format="binaire", **parametres).content)
+
+        self.assertEqual(entete["nombre"], 0)
+        self.assertEqual(
+            {cle: entete[cle] for cle in ("operateurs", "localites", "noms")},
+            {"operateurs": [], "localites": [], "noms": []},
+        )
+        for nom, type_ in COLONNES_BINAIRES:
+            with self.subTest(colonne=nom):
+                self.assertEqual(colonnes[nom].dtype, np.dtype(type_))
+                self.assertEqual(len(colonnes[nom]), 0)
+                self.assertEqual(compact[nom], [])
+        self.assertEqual(self.carte(**parametres).json()["sites"], [])
+
+    def test_page_niveaux_simplification(self):
+        reponse = self.client.get(reverse("home:map"))
+
+        self.assertContains(
+            reponse,
+            '<script id="zooms-simplification" type="application/json">[7, 9, 11, 13, null]</script>',
+            html=True,
+        )
+
+    def test_format_inconnu(self):
+        reponse = self.client.get(
+            reverse("home:map"), {"format": "csv"}, headers={"X-Requested-With": "XMLHttpRequest"}
+        )
+
+        self.assertEqual(reponse.status_code, 400)
+
+
+def carre(ouest, sud, est, nord):
+    """Anneau fermé d'un rectangle."""
+    return [[ouest, sud], [est, sud], [est, nord], [ouest, nord], [ouest, sud]]
+
+
+def couche_geojson(dossier, nom, zones):
+    """Écrit une couche GeoJSON de zones (nom, géométrie) et retourne son chemin."""
+    chemin = os.path.join(dossier, f"{nom}.json")
+    with open(chemin, "w", encoding="utf-8") as fichier:
+        json.dump(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "properties": {"NOM": nom_zone}, "geometry": geometrie}
+                    for nom_zone, geometrie in zones
+                ],
+            },
+            fichier,
+        )
+    return chemin
+
+
+class GeometrieAuditTests(SimpleTestCase):
+    def test_arbre_r(self):
+        # 100 boîtes qui se chevauchent : plusieurs niveaux de nœuds
+        boites = np.array([[i, j, i + 1.5, j + 1.5] for i in range(10) for j in range(10)], dtype=float)
+        arbre = ArbreR(boites, capacite=4)
+        generateur = np.random.default_rng(0)
+        x, y = generateur.uniform(-1, 12, 500), generateur.uniform(-1, 12, 500)
+
+        trouves = {(indice, int(p)) for indice, positions in arbre.candidats(x, y) for p in positions}
+
+        attendus = {
+            (indice, p)
+            for indice, (xmin, ymin, xmax, ymax) in enumerate(boites)
+            for p in range(len(x))
+            if xmin <= x[p] <= xmax and ymin <= y[p] <= ymax
+        }
+        self.assertEqual(trouves, attendus)
+
+    def test_points_dans_polygone(self):
+        troue = _anneaux({"type": "Polygon", "coordinates": [carre(0, 0, 10, 10), carre(4, 4, 6, 6)]})
+        # Anneaux non fermés : _anneaux les ferme
+        multiple = _anneaux(
+            {
+                "type": "MultiPolygon",
+                "coordinates": [[carre(0, 0, 2, 2)[:-1]], [[[5, 5], [9, 5], [7, 9]]]],
+            }
+        )
+        cas = [
+            ("polygone troué", troue, [(2, 2), (5, 5), (4.5, 8), (11, 5), (-1, 5)], [True, False, True, False, False]),
+            ("multipolygone", multiple, [(1, 1), (7, 6), (3, 3), (5.5, 8)], [True, True, False, False]),
+        ]
+        for nom, anneaux, points, attendu in cas:
+            with self.subTest(nom):
+                x, y = (np.array(c, dtype=float) for c in zip(*points))
+                self.assertEqual(points_dans_polygone(x, y, anneaux).tolist(), attendu)
+
+
+class AuditTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dossier = tempfile.mkdtemp()
+        cls.couches = {
+            "BENIN_DEPARTEMENT": couche_geojson(
+                cls.dossier,
+                "BENIN_DEPARTEMENT",
+                [
+                    ("OUEME", {"type": "Polygon", "coordinates": [carre(2, 6, 3, 7)]}),
+                    ("LITTORAL", {"type": "Polygon", "coordinates": [carre(1, 6, 2, 7)]}),
+                ],
+            ),
+            "BENIN_COMMUNE": couche_geojson(
+                cls.dossier,
+                "BENIN_COMMUNE",
+                [
+                    # Trou : hors de toute commune, mais dans l'Ouémé
+                    (
+                        "SEME-KPODJI",
+                        {"type": "Polygon", "coordinates": [carre(2, 6, 2.8, 6.8), carre(2.3, 6.3, 2.5, 6.5)]},
+                    ),
+                    ("ADJARRA", {"type": "Polygon", "coordinates": [carre(2.8, 6, 3, 7)]}),
+                    (
+                        "COTONOU",
+                        {"type": "MultiPolygon", "coordinates": [[carre(1, 6, 1.4, 6.4)], [carre(1.6, 6.6, 2, 7)]]},
+                    ),
+                ],
+            ),
+        }
+        cls.enterClassContext(mock.patch("apps.home.audit.chemin_couche", side_effect=cls.couches.get))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.dossier, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        operateur = Operateur.objects.create(nom="MTN")
+        localites = {}
+        for commune, departement in (("sèmè-kpodji", "ouémé"), ("cotonou", "littoral")):
+            departement, _ = Departement.objects.get_or_create(nom=departement)
+            commune = Commune.objects.create(nom=commune, departement=departement)
+            localites[commune.nom] = Localite.objects.create(localite=f"centre {commune.nom}", commune=commune)
+        sites = [
+            ("accents", "6.1", "2.1", "sèmè-kpodji"),
+            ("trou", "6.4", "2.4", "sèmè-kpodji"),
+            ("seconde-partie", "6.8", "1.8", "cotonou"),
+            ("hors-benin", "9.0", "2.0", "cotonou"),
+            ("autre-departement", "6.2", "1.2", "sèmè-kpodji"),
+            ("autre-commune", "6.5", "2.9", "sèmè-kpodji"),
+        ]
+        for nom, latitude, longitude, commune in sites:
+            Site.objects.create(
+                nom=nom,
+                operateur=operateur,
+                localite=localites[commune],
+                latitude=Decimal(latitude),
+                longitude=Decimal(longitude),
+            )
+        Site.objects.create(nom="sans-coordonnees", operateur=operateur, localite=localites["cotonou"])
+
+    def test_motifs(self):
+        compteurs = {}
+        ecarts = {ecart["site"]: ecart for ecart in auditer_sites(taille_lot=4, compteurs=compteurs)}
+
+        self.assertEqual(
+            {nom: ecart["motif"] for nom, ecart in ecarts.items()},
+            {
+                "trou": HORS_COMMUNE,
+                "hors-benin": HORS_BENIN,
+                "autre-departement": DEPARTEMENT_DIFFERENT,
+                "autre-commune": COMMUNE_DIFFERENTE,
+            },
+        )
+        self.assertEqual(
+            compteurs,
+            {"audites": 6, HORS_COMMUNE: 1, HORS_BENIN: 1, DEPARTEMENT_DIFFERENT: 1, COMMUNE_DIFFERENTE: 1},
+        )
+        cas = [
+            ("trou", "", "OUEME"),
+            ("hors-benin", "", ""),
+            ("autre-departement", "COTONOU", "LITTORAL"),
+            ("autre-commune", "ADJARRA", "OUEME"),
+        ]
+        for nom, commune, departement in cas:
+            with self.subTest(nom):
+                self.assertEqual(ecarts[nom]["commune_geometrique"], commune)
+                self.assertEqual(ecarts[nom]["departement_geometrique"], departement)
+                self.assertEqual(ecarts[nom]["commune_declaree"], Site.objects.get(nom=nom).localite.commune.nom)
+
+
+def photo_appareil(largeur=400, hauteur=200):
+    """Photo JPEG d'appareil : pivotée de 90° (EXIF), avec des coordonnées GPS."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation : à tourner de 90° dans le sens horaire
+    exif[0x8825] = {1: "N", 2: (6.0, 22.0, 30.0)}  # GPSInfo
+    tampon = io.BytesIO()
+    Image.new("RGB", (largeur, hauteur), "red").save(tampon, format="JPEG", exif=exif.tobytes())
+    return tampon.getvalue()
+
+
+class DerivesImagesTests(SimpleTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+
+    def test_derives_redresses_sans_exif(self):
+        derives = calculer_derives(photo_appareil(), DERIVES["photo"])
+
+        # 400 × 200 pivotée : 200 × 400, réduite sans agrandissement
+        tailles = {"vignette": (120, 240), "detail": (200, 400)}
+        for taille, dimensions in tailles.items():
+            for format_, format_pillow in (("webp", "WEBP"), ("jpeg", "JPEG")):
+                with self.subTest(taille=taille, format=format_):
+                    image = Image.open(io.BytesIO(derives[taille][format_]))
+                    self.assertEqual(image.format, format_pillow)
+                    self.assertEqual(image.size, dimensions)
+                    self.assertNotIn("exif", image.info)
+                    self.assertEqual(dict(image.getexif()), {})
+
+    def test_noms_par_empreinte(self):
+        champ = Site._meta.get_field("photo")
+        derives = {"vignette": {"webp": b"contenu webp", "jpeg": b"contenu jpeg"}}
+
+        noms = enregistrer_derives(champ, "Sites/p.jpg", derives)
+
+        empreinte = hashlib.sha256(b"contenu webp").hexdigest()[:20]
+        self.assertEqual(noms["source"], "Sites/p.jpg")
+        self.assertEqual(noms["vignette"]["webp"], f"Sites/derives/vignette-{empreinte}.webp")
+        self.assertTrue(noms["vignette"]["jpeg"].endswith(".jpg"))
+        with champ.storage.open(noms["vignette"]["webp"]) as fichier:
+            self.assertEqual(fichier.read(), b"contenu webp")
+        # Même contenu, même fichier : rien de plus n'est écrit
+        self.assertEqual(enregistrer_derives(champ, "Sites/autre.jpg", derives)["vignette"], noms["vignette"])
+        self.assertEqual(len(os.listdir(os.path.join(self.media, "Sites", "derives"))), 2)
+
+    def test_urls_derive(self):
+        a_jour = {"source": "Sites/p.jpg", "vignette": {"webp": "Sites/derives/v.webp", "jpeg": "Sites/derives/v.jpg"}}
+        originale = {"webp": None, "jpeg": "/media/Sites/p.jpg"}
+        cas = [
+            ("sans image", None, a_jour, "vignette", {"webp": None, "jpeg": None}),
+            ("sans dérivés", "Sites/p.jpg", {}, "vignette", originale),
+            ("autre source", "Sites/p.jpg", {**a_jour, "source": "Sites/ancienne.jpg"}, "vignette", originale),
+            ("taille absente", "Sites/p.jpg", a_jour, "detail", originale),
+            (
+                "à jour",
+                "Sites/p.jpg",
+                a_jour,
+                "vignette",
+                {"webp": "/media/Sites/derives/v.webp", "jpeg": "/media/Sites/derives/v.jpg"},
+            ),
+        ]
+        for nom, photo, derives, taille, attendu in cas:
+            with self.subTest(nom):
+                site = Site(photo=photo, photo_derives=derives)
+                self.assertEqual(urls_derive(site.photo, site.photo_derives, taille), attendu)
+
+
+class DerivesSignalTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+        self.operateur = Operateur.objects.create(nom="MTN")
+
+    def site_avec_photo(self):
+        site = Site(nom="S-photo", operateur=self.operateur)
+        site.photo.save("p.jpg", ContentFile(photo_appareil()), save=False)
+        return site
+
+    def test_derives_calcules_apres_validation(self):
+        site = self.site_avec_photo()
+        with mock.patch("apps.home.signals.threading.Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                site.save()
+                thread.assert_not_called()
+
+        self.assertEqual(Site.objects.get(pk=site.pk).photo_derives, {})
+        # Exécution du thread, sans fermer la connexion du test
+        with mock.patch("apps.home.signals.connection"):
+            thread.call_args.kwargs["target"]()
+        derives = Site.objects.get(pk=site.pk).photo_derives
+        self.assertEqual(derives["source"], site.photo.name)
+        self.assertEqual(set(derives) - {"source"}, set(DERIVES["photo"]))
+
+        # Dérivés à jour : rien à recalculer
+        site.refresh_from_db()
+        with self.captureOnCommitCallbacks() as rappels:
+            site.description = "Toit"
+            site.save()
+        self.assertEqual(rappels, [])
+
+    def test_ecriture_annulee_sans_derives(self):
+        site = self.site_avec_photo()
+        with self.captureOnCommitCallbacks(execute=True) as rappels:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                site.save()
+                raise RuntimeError("annulation")
+
+        self.assertEqual(rappels, [])
+        self.assertFalse(os.path.exists(os.path.join(self.media, "Sites", "derives")))
+
+
+class GrilleSpatialeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operateur = Operateur.objects.create(nom="MTN")
+        # Sites sur les bords des cellules (pas de 0,05°) et juste à côté
+        latitudes = ["6.35", "6.349999999999", "6.350000000001", "6.4", "6.45"]
+        longitudes = ["2.4", "2.399999999999", "2.400000000001", "2.45", "2.5"]
+        coordonnees = [(lat, lon) for lat in latitudes for lon in longitudes]
+        coordonnees += [("0", "0"), ("-0.05", "-0.05"), ("-0.000000000001", "-0.000000000001"), ("90", "180")]
+        for numero, (latitude, longitude) in enumerate(coordonnees):
+            Site.objects.create(
+                nom=f"G-{numero}", operateur=operateur, latitude=Decimal(latitude), longitude=Decimal(longitude)
+            )
+
+    def test_prefiltre_identique_au_filtre_des_coordonnees(self):
+        emprises = [
+            (2.4, 6.35, 2.45, 6.4),
+            (2.4, 6.35, 2.4, 6.35),
+            (2.400000000001, 6.350000000001, 2.45, 6.45),
+            (2.399999999999, 6.349999999999, 2.400000000001, 6.350000000001),
+            (2.35, 6.3, 2.5, 6.5),
+            (2.41, 6.36, 2.44, 6.39),
+            (-0.05, -0.05, 0.0, 0.0),
+            (-0.000000000001, -0.000000000001, 0.0, 0.0),
+            (179.95, 89.95, 180.0, 90.0),
+            # Trop de lignes de grille : filtre des coordonnées seul
+            (-180.0, -90.0, 180.0, 90.0),
+        ]
+        for emprise in emprises:
+            with self.subTest(emprise=emprise):
+                ouest, sud, est, nord = emprise
+                attendu = Site.objects.filter(
+                    latitude__gte=sud, latitude__lte=nord, longitude__gte=ouest, longitude__lte=est
+                )
+                self.assertEqual(
+                    set(filtrer_par_emprise(Site.objects.all(), emprise).values_list("nom", flat=True)),
+                    set(attendu.values_list("nom", flat=True)),
+                )
+
+    def test_cellule_mise_a_jour_par_save_partiel(self):
+        site = Site.objects.get(nom="G-0")
+        cas = [
+            (["latitude"], {"latitude": Decimal("7.1")}),
+            (["longitude"], {"longitude": Decimal("1.9")}),
+            (["latitude", "longitude"], {"latitude": None}),
+        ]
+        for champs, valeurs in cas:
+            with self.subTest(champs=champs):
+                for champ, valeur in valeurs.items():
+                    setattr(site, champ, valeur)
+                site.save(update_fields=champs)
+                enregistre = Site.objects.get(pk=site.pk)
+                self.assertEqual(enregistre.cellule_grille, cellule_grille(site.latitude, site.longitude))
+        self.assertIsNone(Site.objects.get(pk=site.pk).cellule_grille)
+
+
+@override_settings(
+    MAP_CLUSTER_MAX_ZOOM=12,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class CarteClustersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mtn = Operateur.objects.create(nom="MTN", couleur="#ffcc00")
+        moov = Operateur.objects.create(nom="MOOV", couleur="#0066cc")
+        # Au zoom 8, les cellules de cluster font 0,35° : deux groupes de sites
+        sites = [
+            ("C-1", mtn, "6.36", "2.40", True),
+            ("C-2", mtn, "6.38", "2.42", False),
+            ("C-3", moov, "6.40", "2.44", None),
+            ("P-1", moov, "9.30", "2.60", True),
+            ("P-2", moov, "9.34", "2.62", None),
+        ]
+        for nom, operateur, latitude, longitude, statut in sites:
+            site = Site.objects.create(
+                nom=nom, operateur=operateur, latitude=Decimal(latitude), longitude=Decimal(longitude)
+            )
+            if statut is not None:
+                Conformite.objects.create(
+                    site=site, rapport="Uploads/pdf/r.pdf", date_inspection=date(2023, 6, 1), statut=statut
+                )
+        Site.objects.create(nom="S-sans", operateur=mtn)
+
+    def carte(self, **parametres):
+        reponse = self.client.get(reverse("home:map"), parametres, headers={"X-Requested-With": "XMLHttpRequest"})
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def clusters(self, **parametres):
+        donnees = self.carte(zoom=8, **parametres)
+        self.assertEqual(donnees["mode"], "clusters")
+        return sorted(donnees["clusters"], key=lambda cluster: cluster["latitude"])
+
+    def test_clusters(self):
+        cotonou, parakou = self.clusters()
+
+        self.assertEqual(cotonou["count"], 3)
+        self.assertAlmostEqual(cotonou["latitude"], 6.38)
+        self.assertAlmostEqual(cotonou["longitude"], 2.42)
+        self.assertEqual(cotonou["operateurs"], {"MTN": 2, "MOOV": 1})
+        self.assertEqual(cotonou["conformite"], {CONFORME: 1, NON_CONFORME: 1, SANS_RAPPORT: 1})
+        self.assertEqual(parakou["count"], 2)
+        self.assertAlmostEqual(parakou["latitude"], 9.32)
+        self.assertAlmostEqual(parakou["longitude"], 2.61)
+        self.assertEqual(parakou["operateurs"], {"MOOV": 2})
+        self.assertEqual(parakou["conformite"], {CONFORME: 1, NON_CONFORME: 0, SANS_RAPPORT: 1})
+        ouest, sud, est, nord = cotonou["bbox"]
+        self.assertTrue(ouest <= 2.40 and 2.44 <= est and sud <= 6.36 and 6.40 <= nord)
+
+    def test_conformite_identique_aux_sites_filtres(self):
+        clusters = self.clusters()
+        for etat in (CONFORME, NON_CONFORME, SANS_RAPPORT):
+            with self.subTest(etat):
+                for cluster in clusters:
+                    ouest, sud, est, nord = cluster["bbox"]
+                    attendu = get_filtered_sites(conformite=[etat]).filter(
+                        latitude__gte=sud, latitude__lt=nord, longitude__gte=ouest, longitude__lt=est
+                    )
+                    self.assertEqual(cluster["conformite"][etat], attendu.count())
+                # Le filtre de conformité de la carte garde les mêmes sites
+                filtres = self.clusters(conformite=etat)
+                self.assertEqual(
+                    sum(cluster["count"] for cluster in filtres),
+                    sum(cluster["conformite"][etat] for cluster in clusters),
+                )
+
+    def test_filtre_operateur_et_emprise(self):
+        moov = Operateur.objects.get(nom="MOOV")
+        clusters = self.clusters(operateur=moov.pk)
+        self.assertEqual([cluster["operateurs"] for cluster in clusters], [{"MOOV": 1}, {"MOOV": 2}])
+
+        clusters = self.clusters(bbox="2.0,9.0,3.0,10.0")
+        self.assertEqual([cluster["count"] for cluster in clusters], [2])
+
+    def test_bascule_vers_les_sites(self):
+        cas = [(11, "clusters"), (12, "sites"), (15, "sites")]
+        for zoom, mode in cas:
+            with self.subTest(zoom=zoom):
+                donnees = self.carte(zoom=zoom)
+                self.assertEqual(donnees["mode"], mode)
+                if mode == "sites":
+                    # Sans emprise, tous les sites sont envoyés
+                    self.assertEqual(len(donnees["sites"]), Site.objects.count())
+                    self.assertNotIn("clusters", donnees)
+        with override_settings(MAP_CLUSTER_MAX_ZOOM=8):
+            self.assertEqual(self.carte(zoom=8)["mode"], "sites")
+            self.assertEqual(self.carte(zoom=7)["mode"], "clusters")
+
+
+class ProximiteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mtn = Operateur.objects.create(nom="MTN")
+        cls.moov = Operateur.objects.create(nom="MOOV")
+        cls.t4g = Technologie.objects.create(nom="4G")
+        # Sites alignés vers le nord, espacés d'environ 1,1 km
+        for numero in range(5):
+            Site.objects.create(
+                nom=f"S-{numero}",
+                operateur=(cls.mtn, cls.moov)[numero % 2],
+                latitude=Decimal("6.36") + Decimal("0.01") * numero,
+                longitude=Decimal("2.42"),
+            )
+
+    def setUp(self):
+        proximite._index = proximite._version = None
+        self.addCleanup(setattr, proximite, "_index", None)
+
+    def change_positions(self, ecriture):
+        """Indique si ``ecriture`` change la version des positions, une fois validée."""
+        avant = version_positions()
+        with self.captureOnCommitCallbacks(execute=True):
+            ecriture()
+        return version_positions() != avant
+
+    def test_version_des_positions(self):
+        site = Site.objects.get(nom="S-0")
+
+        def modifier(**champs):
+            def ecriture():
+                for champ, valeur in champs.items():
+                    setattr(site, champ, valeur)
+                site.save()
+            return ecriture
+
+        cas = [
+            ("description", modifier(description="Toit"), False),
+            ("mêmes coordonnées", modifier(latitude="6.360"), False),
+            ("latitude", modifier(latitude=Decimal("6.5")), True),
+            ("opérateur", modifier(operateur=self.moov), True),
+            ("conformité", lambda: Conformite.objects.create(
+                site=site, rapport="Uploads/pdf/r.pdf", date_inspection=date(2023, 6, 1), statut=True,
+            ), False),
+            ("ajout de technologie", lambda: site.technologies.add(self.t4g), True),
+            ("retrait de technologie", lambda: site.technologies.remove(self.t4g), True),
+            ("création", lambda: Site.objects.create(nom="S-9", operateur=self.mtn), True),
+            ("suppression", lambda: Site.objects.get(nom="S-9").delete(), True),
+        ]
+        for nom, ecriture, attendu in cas:
+            with self.subTest(nom):
+                self.assertEqual(self.change_positions(ecriture), attendu)
+
+    def test_index_obsolete_servi_pendant_la_reconstruction(self):
+        ancien = proximite.index_proximite()
+        nouveau = proximite.IndexProximite([], [], [], [])
+        debut, fin = threading.Event(), threading.Event()
+
+        def construire():
+            debut.set()
+            fin.wait(5)
+            return nouveau
+
+        with mock.patch.object(proximite.IndexProximite, "depuis_base", side_effect=construire) as depuis_base:
+            with self.captureOnCommitCallbacks(execute=True):
+                Site.objects.filter(nom="S-4").delete()
+
+            self.assertIs(proximite.index_proximite(), ancien)
+            self.assertTrue(debut.wait(5))
+            # Une seule reconstruction à la fois
+            self.assertIs(proximite.index_proximite(), ancien)
+            reconstruction = proximite._reconstruction
+            fin.set()
+            reconstruction.join(5)
+
+        self.assertEqual(depuis_base.call_count, 1)
+        self.assertIs(proximite.index_proximite(), nouveau)
+        self.assertIsNone(proximite._reconstruction)
+
+    def test_index_a_jour_non_reconstruit(self):
+        index = proximite.index_proximite()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Site.objects.filter(nom="S-0").update(description="Toit")
+            Site.objects.get(nom="S-1").save()
+
+        with mock.patch.object(proximite.IndexProximite, "depuis_base") as depuis_base:
+            self.assertIs(proximite.index_proximite(), index)
+        depuis_base.assert_not_called()
+
+    def test_attendre_reconstruit_pendant_la_requete(self):
+        proximite.index_proximite()
+        with self.captureOnCommitCallbacks(execute=True):
+            site = Site.objects.get(nom="S-0")
+            site.latitude = Decimal("7")
+            site.save()
+
+        index = proximite.index_proximite(attendre=True)
+
+        self.assertEqual(index.latitudes[index.ids == site.pk].tolist(), [7.0])
+
+    def test_vue_proximite(self):
+        proximite.index_proximite()
+        # Supprimé après la construction de l'index : ignoré dans la réponse
+        Site.objects.filter(nom="S-1").delete()
+
+        reponse = self.client.get(
+            reverse("home:site_proximite"), {"lat": "6.36", "lon": "2.42", "rayon": "2500"}
+        )
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()["total"], 3)
+        self.assertEqual([site["nom"] for site in reponse.json()["sites"]], ["S-0", "S-2"])
+        self.assertEqual(reponse.json()["sites"][0]["distance"], 0.0)
+
+        reponse = self.client.get(
+            reverse("home:site_proximite"),
+            {"lat": "6.36", "lon": "2.42", "k": "2", "operateur": self.moov.pk},
+        )
+        self.assertEqual([site["nom"] for site in reponse.json()["sites"]], ["S-3"])
+
+
+class ContoursTests(SimpleTestCase):
+    def contours(self, encodages):
+        reponse = self.client.get(
+            reverse("home:geojson_contours", args=["BENIN_PAYS"]),
+            {"zoom": 8},
+            headers={"Accept-Encoding": encodages},
+        )
+        self.assertEqual(reponse.status_code, 200)
+        return reponse
+
+    def test_compression_negociee(self):
+        brut = self.contours("identity").content
+        cas = [
+            ("br, gzip", "br", brotli.decompress),
+            ("gzip, deflate, br;q=0", "gzip", gzip.decompress),
+            ("gzip;q=0.5, br;q=0.8", "br", brotli.decompress),
+        ]
+        for encodages, attendu, decompresser in cas:
+            with self.subTest(encodages):
+                reponse = self.contours(encodages)
+                self.assertEqual(reponse["Content-Encoding"], attendu)
+                self.assertLess(len(reponse.content), len(brut))
+                self.assertEqual(decompresser(reponse.content), brut)
+                self.assertIn("Accept-Encoding", reponse["Vary"])
+
+        self.assertEqual(json.loads(brut)["type"], "FeatureCollection")
+
+    def test_frontieres_communes_alignees(self):
+        with open(chemin_couche("BENIN_COMMUNE"), encoding="utf-8") as fichier:
+            donnees = json.load(fichier)
+        proprietaires = {}
+        for indice, feature in enumerate(donnees["features"]):
+            for anneau in anneaux_collection({"features": [feature]}):
+                for x, y, *_ in anneau:
+                    proprietaires.setdefault((x, y), set()).add(indice)
+        partages = {point: communes for point, communes in proprietaires.items() if len(communes) > 1}
+
+        for niveau, (_zoom, tolerance, decimales) in enumerate(NIVEAUX_SIMPLIFICATION[:-1]):
+            with self.subTest(tolerance=tolerance):
+                simplifiee = simplifier_collection(donnees, niveau)
+                points = [
+                    {tuple(point) for anneau in anneaux_collection({"features": [feature]}) for point in anneau}
+                    for feature in simplifiee["features"]
+                ]
+                self.assertLess(len(set().union(*points)), len(proprietaires))
+                # Un sommet de frontière est gardé par toutes les communes qui le partagent, ou par aucune
+                for (x, y), communes in partages.items():
+                    point = (round(x, decimales), round(y, decimales))
+                    self.assertEqual(len({point in points[indice] for indice in communes}), 1, point)
+
+
+class TableauDeBordTests(TestCase):
+    @override_settings(DASHBOARD_RECENT_SITES=3)
+    def test_derniers_sites(self):
+        operateur = Operateur.objects.create(nom="MTN")
+        sites = [Site.objects.create(nom=f"S-{numero}", operateur=operateur) for numero in range(5)]
+        Conformite.objects.create(
+            site=sites[4], rapport="Uploads/pdf/r.pdf", date_inspection=date(2023, 6, 1), statut=False,
+        )
+
+        reponse = self.client.get(reverse("home:home"))
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(
+            [(item["site"].nom, item["has_conformite"]) for item in reponse.context["site_data"]],
+            [("S-4", True), ("S-3", False), ("S-2", False)],
+        )
+        self.assertContains(reponse, reverse("home:site_list"))
+
+
+class IndexSitesLiesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operateur = Operateur.objects.create(nom="MTN", couleur="#ffcc00")
+        cls.departement = Departement.objects.create(nom="littoral")
+        cls.commune = Commune.objects.create(nom="cotonou", departement=cls.departement)
+        cls.localite = Localite.objects.create(localite="akpakpa", commune=cls.commune)
+        for numero in range(3):
+            Site.objects.create(nom=f"S-{numero}", operateur=cls.operateur, localite=cls.localite)
+
+    def index(self):
+        return set(IndexRechercheSite.objects.values_list("operateur", "localite"))
+
+    def test_renommage_reindexe_apres_validation(self):
+        cas = [
+            (self.operateur, "nom", "MTN Bénin", {("MTN Bénin", "akpakpa, cotonou, littoral")}),
+            (self.localite, "localite", "akpakpa-nord", {("MTN", "akpakpa-nord, cotonou, littoral")}),
+            (self.commune, "nom", "cotonou ii", {("MTN", "akpakpa, cotonou ii, littoral")}),
+            (self.departement, "nom", "atlantique", {("MTN", "akpakpa, cotonou, atlantique")}),
+        ]
+        for instance, champ, valeur, attendu in cas:
+            with self.subTest(modele=type(instance).__name__):
+                ancien = getattr(instance, champ)
+                with self.captureOnCommitCallbacks() as rappels:
+                    setattr(instance, champ, valeur)
+                    instance.save()
+                    # Rien n'est réindexé avant la validation
+                    self.assertEqual(self.index(), {("MTN", "akpakpa, cotonou, littoral")})
+                self.assertEqual(len(rappels), 1)
+                rappels[0]()
+                self.assertEqual(self.index(), attendu)
+
+                setattr(instance, champ, ancien)
+                with self.captureOnCommitCallbacks(execute=True):
+                    instance.save()
+
+    def test_changement_de_commune(self):
+        autre = Commune.objects.create(nom="porto-novo", departement=Departement.objects.create(nom="oueme"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.localite.commune = autre
+            self.localite.save()
+
+        self.assertEqual(self.index(), {("MTN", "akpakpa, porto-novo, oueme")})
+
+    def test_champ_non_indexe_sans_reindexation(self):
+        with mock.patch("apps.home.signals.indexer_sites") as indexer:
+            with self.captureOnCommitCallbacks(execute=True) as rappels:
+                self.operateur.couleur = "#000000"
+                self.operateur.save()
+                self.commune.save()
+                # Création : aucun site lié à réindexer
+                Operateur.objects.create(nom="MOOV")
+
+        self.assertEqual(rappels, [])
+        indexer.assert_not_called()
+
+
+class MetriquesVueTests(SimpleTestCase):
+    def metriques(self, adresse="127.0.0.1", **entetes):
+        return self.client.get(reverse("home:metriques"), REMOTE_ADDR=adresse, headers=entetes)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_desactivees(self):
+        self.assertEqual(self.metriques().status_code, 404)
+
+    @override_settings(METRICS_TOKEN="s3cret", METRICS_ALLOWED_NETWORKS=["127.0.0.0/8", "10.0.0.0/8", "::1/128"])
+    def test_acces(self):
+        cas = [
+            ("127.0.0.1", {}, 200),
+            ("10.2.3.4", {}, 200),
+            ("::1", {}, 200),
+            ("203.0.113.5", {}, 403),
+            ("203.0.113.5", {"Authorization": "Bearer s3cret"}, 200),
+            ("203.0.113.5", {"Authorization": "Bearer autre"}, 403),
+            ("203.0.113.5", {"Authorization": "s3cret"}, 403),
+            ("inconnue", {}, 403),
+        ]
+        for adresse, entetes, statut in cas:
+            with self.subTest(adresse=adresse, **entetes):
+                reponse = self.metriques(adresse, **entetes)
+                self.assertEqual(reponse.status_code, statut)
+                if statut == 200:
+                    self.assertTrue(reponse["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+    @override_settings(METRICS_TOKEN="")
+    def test_jeton_vide_refuse(self):
+        self.assertEqual(self.metriques("203.0.113.5", Authorization="Bearer ").status_code, 403)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class MetriquesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pids = threading.local()
+        self.enterContext(mock.patch("apps.home.metriques.os.getpid", lambda: self.pids.pid))
+        self.enterContext(mock.patch("apps.home.metriques.registre", Registre()))
+        self.pids.pid = 1
+
+    def worker(self, pid, requetes=1):
+        """Registre d'un worker ayant servi ``requetes`` requêtes, publié."""
+        self.pids.pid = pid
+        registre = Registre()
+        for _ in range(requetes):
+            registre.enregistrer("home:index", "GET", 200, 0.01, MesureSQL(), 10)
+        registre.publier()
+        self.pids.pid = 1
+        return registre
+
+    def total(self):
+        self.pids.pid = 1
+        instantane, processus = instantane_global()
+        return instantane["compteurs"].get(
+            ("http_requests_total", (("view", "home:index"), ("method", "GET"), ("status", "200"))), 0
+        ), processus
+
+    def test_enregistrements_concurrents(self):
+        workers = 16
+        depart = threading.Barrier(workers)
+
+        def demarrer(pid):
+            self.pids.pid = pid
+            registre = Registre()
+            registre.enregistrer("home:index", "GET", 200, 0.01, MesureSQL(), 10)
+            depart.wait()
+            registre.publier()
+
+        threads = [threading.Thread(target=demarrer, args=(100 + n,)) for n in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Aucun worker perdu : le processus de la vue compte en plus
+        self.assertEqual(self.total(), (workers, workers + 1))
+
+    def test_emplacements(self):
+        premier = self.worker(101, requetes=2)
+        second = self.worker(102, requetes=3)
+        self.assertEqual(self.total(), (5, 3))
+        self.assertEqual(cache.get(CLE_EMPLACEMENTS), 3)
+
+        # Republication : même emplacement
+        self.pids.pid = 101
+        premier.publier()
+        self.assertEqual(premier.emplacement, (101, 0))
+
+        # Worker arrêté : son emplacement expire et est réutilisé
+        cache.delete(cle_emplacement(second.emplacement[1]))
+        troisieme = self.worker(103)
+        self.assertEqual(troisieme.emplacement, (103, second.emplacement[1]))
+        self.assertEqual(self.total(), (3, 3))
+        self.assertEqual(cache.get(CLE_EMPLACEMENTS), 3)
+
+        # Emplacement expiré puis repris par un autre worker : le premier en
+        # réserve un nouveau au lieu d'écraser l'instantané de l'autre
+        cache.delete(cle_emplacement(0))
+        quatrieme = self.worker(104)
+        self.pids.pid = 101
+        premier.publier()
+        self.assertEqual(quatrieme.emplacement, (104, 0))
+        self.assertEqual(premier.emplacement, (101, 3))
+        self.assertEqual(self.total(), (4, 4))
+
+        # Compteur d'emplacements évincé du cache : rétabli à la publication
+        cache.delete(CLE_EMPLACEMENTS)
+        self.pids.pid = 101
+        premier.publier()
+        self.assertEqual(self.total(), (4, 4))
+
+    def test_emplacement_herite_d_un_fork(self):
+        parent = self.worker(101)
+        self.pids.pid = 102
+        parent.publier()
+
+        self.assertEqual(parent.emplacement, (102, 1))
+        self.assertEqual(cache.get(cle_emplacement(0))["pid"], 101)
+
+    # Latence des requêtes mesurée sans le middleware des métriques
+    @override_settings(METRICS_ENABLED=False)
+    def test_surcout_inferieur_a_un_pourcent(self):
+        operateur = Operateur.objects.create(nom="MTN")
+        for numero in range(50):
+            Site.objects.create(nom=f"S-{numero:02d}", operateur=operateur)
+        url = reverse("home:site_table")
+        self.client.get(url)
+
+        latences = []
+        for _ in range(30):
+            mesure = MesureSQL()
+            with connection.execute_wrapper(mesure):
+                debut = time.perf_counter()
+                self.client.get(url)
+                latences.append(time.perf_counter() - debut)
+        latence = sorted(latences)[len(latences) // 2]
+
+        # Travail des métriques pour autant de requêtes SQL, rapporté à la latence
+        self.assertLess(cout_instrumentation(mesure.nombre), latence / 100)
+
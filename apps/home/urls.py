@@ -1,7 +1,7 @@
 # -*- encoding: utf-8 -*-
 from django.urls import path
 from apps.home import views
-from apps.home.utils import recherche_ajax
+from apps.home.utils import get_statistics_breakdown, recherche_ajax
 
 app_name = "home"
 
@@ -14,9 +14,12 @@ urlpatterns = [
     
     # File Upload URLs
     path('file-upload/', views.file_upload_view, name='file_upload'),
+    path('import/<int:pk>/progression/', views.import_progress, name='import_progress'),
     
     #Cartographie daes  sites   
     path('map/', views.map_view, name='map'),
+    path('geojson/<str:nom>/', views.geojson_contours, name='geojson_contours'),
+    path('geojson/benin/<str:geojson_type>/', views.get_geojson, name='get_geojson'),
     
     # Operateur URLs
     path('operateurs/', views.operateur_list, name='operateur_list'),
@@ -47,6 +50,11 @@ urlpatterns = [
 
     # Site URLs
     path('site/', views.site_list, name='site_list'),
+    path('site/table/', views.site_table, name='site_table'),
+    path('site/export/', views.site_export, name='site_export'),
+    path('site/flux/', views.site_feed, name='site_feed'),
+    path('site/proximite/', views.site_proximite, name='site_proximite'),
+    path('site/densite/', views.site_densite, name='site_densite'),
     path('site/<int:pk>/', views.site_detail, name='site_detail'),
     path('site/create/', views.site_create, name='site_create'),
     path('site/update/<int:pk>/', views.site_update, name='site_update'),
@@ -60,7 +68,9 @@ urlpatterns = [
 
     path('statistics/', views.statistics, name='statistics'),
     path('statistics/data/', views.get_statistics_data, name='get_statistics_data'),     
+    path('statistics/breakdown/', get_statistics_breakdown, name='get_statistics_breakdown'),
      
     path('ajax/recherche/', recherche_ajax, name='recherche_ajax'),
     path('get_communes/', views.get_communes, name='get_communes'),
+    path('metrics', views.metriques, name='metriques'),
 ]
\ No newline at end of file
@@ -1,17 +1,28 @@
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.models import Count, Q
 from django.http import JsonResponse
-from django.db import IntegrityError
 from django.contrib import messages
-from datetime import datetime
+from datetime import date, datetime
 
 from django.shortcuts import render
 from .models import *
+from .cache import cle_cache
+from .importation import ImportateurSites, LigneImport
+from .recherche import parse_limite, rechercher
+from .statistiques import (
+    DIMENSIONS,
+    compter_statistiques,
+    parse_date,
+    ventiler_statistiques,
+)
+import numpy as np
 import pandas as pd
 import unicodedata
 import openpyxl
 import logging
+import os
 import re
 
 logger = logging.getLogger(__name__)
@@ -27,53 +38,85 @@ def handle_message(request, message, level="success"):
 # Vue pour récupérer les données statistiques avec filtrage
 @login_required(login_url="authentication:login")
 def get_statistics_data(request):
-    date_from = request.GET.get("date_from")
-    date_to = request.GET.get("date_to")
     operateur_id = request.GET.get("operateur")
+    if operateur_id and not operateur_id.isdigit():
+        return JsonResponse({"error": f"Opérateur invalide : {operateur_id}"}, status=400)
     conformite_status = request.GET.get("conformite")
 
-    # Création des requêtes de base pour les sites
-    sites_query = Site.objects.all()
+    try:
+        date_from = parse_date(request.GET.get("date_from"))
+        date_to = parse_date(request.GET.get("date_to"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Comptage à partir de la table d'agrégats (mois complets) et des sites
+    # pour les éventuels mois partiels en bord de période
+    data = compter_statistiques(
+        date_debut=date_from,
+        date_fin=date_to,
+        operateur_id=int(operateur_id) if operateur_id else None,
+        conformite=conformite_status,
+    )
 
-    # Filtrage par date pour les sites
-    if date_from:
-        sites_query = sites_query.filter(date_autorisation__gte=date_from)
+    return JsonResponse(data)
 
-    if date_to:
-        sites_query = sites_query.filter(date_autorisation__lte=date_to)
 
-    # Filtrage par opérateur
-    if operateur_id:
-        sites_query = sites_query.filter(operateur_id=operateur_id)
+# Vue pour ventiler les statistiques selon plusieurs dimensions
+@login_required(login_url="authentication:login")
+def get_statistics_breakdown(request):
+    # group_by peut être répété ou contenir une liste séparée par des virgules
+    dimensions = []
+    for valeur in request.GET.getlist("group_by"):
+        for dimension in valeur.split(","):
+            dimension = dimension.strip()
+            if dimension and dimension not in dimensions:
+                dimensions.append(dimension)
+
+    inconnues = [dim for dim in dimensions if dim not in DIMENSIONS]
+    if not dimensions or inconnues:
+        return JsonResponse(
+            {
+                "error": f"Dimensions invalides : {', '.join(inconnues) or 'aucune'}",
+                "dimensions": list(DIMENSIONS),
+            },
+            status=400,
+        )
 
-    # Création de la requête de base pour les conformités liées aux sites filtrés
-    conformite_query = Conformite.objects.filter(site__in=sites_query)
+    operateur_id = request.GET.get("operateur")
+    if operateur_id and not operateur_id.isdigit():
+        return JsonResponse({"error": f"Opérateur invalide : {operateur_id}"}, status=400)
+    conformite_status = request.GET.get("conformite")
 
-    # Filtrage par statut de conformité
-    if conformite_status:
-        conformite_filter = (
-            Q(statut=True) if conformite_status == "conforme" else Q(statut=False)
-        )
-        conformite_query = conformite_query.filter(conformite_filter)
-
-    # Comptage des résultats
-    sites_count = sites_query.count()
-    conformite_count = conformite_query.count()
-    operateurs_count = sites_query.values("operateur").distinct().count()
-
-    # Comptage des sites conformes et non conformes
-    conformes_count = conformite_query.filter(statut=True).count()
-    non_conformes_count = conformite_query.filter(statut=False).count()
-
-    data = {
-        "sites_count": sites_count,
-        "conformite_count": conformite_count,
-        "operateurs_count": operateurs_count,
-        "conformes_count": conformes_count,
-        "non_conformes_count": non_conformes_count,
+    try:
+        date_from = parse_date(request.GET.get("date_from"))
+        date_to = parse_date(request.GET.get("date_to"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Clé de cache construite sur les filtres normalisés
+    filtres = {
+        "dimensions": dimensions,
+        "date_from": date_from.isoformat() if date_from else None,
+        "date_to": date_to.isoformat() if date_to else None,
+        "operateur": int(operateur_id) if operateur_id else None,
+        "conformite": (
+            None
+            if not conformite_status
+            else "conforme" if conformite_status == "conforme" else "non-conforme"
+        ),
     }
+    resultats = cache.get_or_set(
+        cle_cache("ventilation", **filtres),
+        lambda: ventiler_statistiques(
+            dimensions,
+            date_debut=date_from,
+            date_fin=date_to,
+            operateur_id=filtres["operateur"],
+            conformite=filtres["conformite"],
+        ),
+    )
 
-    return JsonResponse(data)
+    return JsonResponse({"dimensions": dimensions, "resultats": resultats})
 
 
 login_required(login_url="authentication:login")
@@ -144,296 +187,517 @@ def safe_strip(value):
     return value  # Retourner la valeur telle quelle pour les valeurs None ou autres
 
 
-def clean_row_values(row):
+# Dictionnaire de correspondance pour les valeurs booléennes possibles
+CAMOUFLAGE_MAPPING = {
+    "oui": True,
+    "yes": True,
+    "true": True,
+    "1": True,
+    "non": False,
+    "no": False,
+    "false": False,
+    "": False,
+    "0": False,
+}
+
+
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y"]
+
+# Colonnes du fichier copiées telles quelles dans les champs du site
+SITE_COLUMNS = {
+    "avis_arcep": "avis_de_larcep_benin",
+    "observation": "observations",
+    "type_pylone": "type_pylone",
+    "hauteur_antenne": "hauteur_antenne",
+    "description": "description",
+    "proprietaire": "proprietaire_site",
+    "num_dossier": "n_dossier",
+    "ref_courrier": "ref_courrier",
+}
+
+
+IMPORTED_COLUMNS = [
+    "id_du_site",
+    "departement",
+    "communes",
+    "localite",
+    "operateur",
+    "emplacement",
+    "latitude_du_candidat",
+    "longitude_du_candidat",
+    "date_autorisation",
+    "date_mise_en_service",
+    "camouflage",
+    *SITE_COLUMNS.values(),
+]
+
+
+def map_unique(values, func):
+    """
+    Applique ``func`` à chaque valeur distincte d'une colonne.
+
+    Les colonnes d'un inventaire (département, commune, opérateur, dates...)
+    ont peu de valeurs distinctes : la fonction n'est appelée qu'une fois par
+    valeur, le résultat étant ensuite réparti sur toutes les lignes. Les
+    valeurs manquantes donnent None.
+    """
+    codes, uniques = pd.factorize(values)
+    results = np.empty(len(uniques) + 1, dtype=object)
+    results[: len(uniques)] = [func(value) for value in uniques]
+    results[-1] = None
+    return pd.Series(results[codes], index=values.index, dtype=object)
+
+
+def clean_values(values):
+    """
+    Nettoie une liste de valeurs : chaînes nettoyées comme par safe_strip,
+    valeurs vides ou fausses remplacées par None.
+
+    Les chaînes sont nettoyées d'un seul tenant : jointes par un séparateur,
+    traitées par une seule substitution, puis redécoupées.
     """
-    Nettoie les valeurs d'une ligne de données en remplaçant les valeurs vides ou NaN par None,
-    et en nettoyant les chaînes de caractères.
+    strings = [value.strip() for value in values if isinstance(value, str)]
+    joined = "\x00".join(strings)
+    if "\x00" in "".join(strings):
+        cleaned = iter([safe_strip(value) for value in strings])
+    else:
+        joined = re.sub(r"\s+", " ", joined).replace("\xa0", "").replace("\u200b", "")
+        cleaned = iter(joined.split("\x00") if strings else [])
+    return [
+        (next(cleaned) if isinstance(value, str) else value) or None for value in values
+    ]
+
+
+def clean_columns(df):
+    """
+    Nettoie les valeurs de chaque colonne, une fois par valeur distincte.
 
     Args:
-        row (dict): La ligne de données à nettoyer.
+        df (DataFrame): Les lignes à nettoyer.
 
     Returns:
-        dict: La ligne nettoyée.
+        DataFrame: Les lignes nettoyées, valeurs vides remplacées par None.
     """
-    for key, value in row.items():
-        if pd.isna(value) or value == "":
-            logger.debug(
-                f"Valeur manquante pour la colonne '{key}', remplacée par None."
-            )
-            row[key] = None
-        else:
-            cleaned_value = safe_strip(value)
-            if cleaned_value != value:
-                logger.debug(
-                    f"Valeur pour la colonne '{key}' nettoyée : '{value}' -> '{cleaned_value}'."
-                )
-            row[key] = cleaned_value or None
-    return row
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values):
+            # Colonne sans chaîne : seuls NaN et zéro deviennent None
+            columns[column] = values.astype(object).where(values.notna() & (values != 0), None)
+            continue
+        codes, uniques = pd.factorize(values)
+        results = np.empty(len(uniques) + 1, dtype=object)
+        results[: len(uniques)] = clean_values(list(uniques))
+        results[-1] = None
+        columns[column] = pd.Series(results[codes], index=df.index, dtype=object)
+    return pd.DataFrame(columns, index=df.index)
 
 
-# Nettoyage des valeurs numériques
-def clean_numeric_value(value):
-    if pd.isna(value) or value == "":
-        return None
-    value = safe_strip(value)  # Supprimer les espaces insécables s'il y en a
-    try:
-        return float(value)
-    except ValueError:
+def parse_numeric_column(values):
+    """
+    Convertit une colonne en nombres ; les valeurs non numériques deviennent
+    NaN et sont signalées dans le journal.
+    """
+    # to_numeric repère les valeurs valides ; astype(float) les convertit
+    # ensuite avec la même précision que float()
+    valid = pd.to_numeric(values, errors="coerce").notna()
+    numbers = pd.Series(np.nan, index=values.index)
+    if valid.any():
+        numbers[valid] = values[valid].astype(float)
+    for value in values[values.notna() & ~valid]:
         logger.warning(f"Valeur numérique invalide : {value}")
-        return None
+    return numbers
 
 
-def validate_latitude_longitude(lat, long):
-    lat = clean_numeric_value(lat)
-    long = clean_numeric_value(long)
+def parse_date_column(values):
+    """
+    Convertit une colonne en dates : les cellules déjà datées sont gardées,
+    puis chaque format de DATE_FORMATS est essayé à son tour sur les chaînes
+    restantes.
 
-    if lat is not None and not (-90 <= lat <= 90):
-        raise ValidationError(f"Latitude invalide: {lat}")
-    if long is not None and not (-180 <= long <= 180):
-        raise ValidationError(f"Longitude invalide: {long}")
+    Returns:
+        tuple: Les dates (date ou None) et le masque des valeurs présentes
+        mais dans aucun des formats.
+    """
+    types = values.map(type)
+    is_date = types.isin([pd.Timestamp, datetime, date])
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(values[is_date], errors="coerce")
+    remaining = types == str
+    for fmt in DATE_FORMATS:
+        if not remaining.any():
+            break
+        parsed[remaining] = pd.to_datetime(values[remaining], format=fmt, errors="coerce")
+        remaining &= parsed.isna()
+    invalid = values.notna() & parsed.isna()
+    # Conversion en dates Python une seule fois par date distincte
+    codes, uniques = pd.factorize(parsed)
+    dates = np.empty(len(uniques) + 1, dtype=object)
+    dates[: len(uniques)] = uniques.date
+    dates[-1] = None
+    return pd.Series(dates[codes], index=values.index, dtype=object), invalid
+
+
+def prepare_rows(df):
+    """
+    Nettoie et valide un lot de lignes colonne par colonne.
 
-    return lat, long
+    Nettoyage, conversions et contrôles (lieu, opérateur, coordonnées,
+    dates) portent sur des colonnes entières. Une ligne invalide est rejetée
+    avec le message de son premier contrôle en échec, dans le même ordre et
+    avec le même texte qu'une validation ligne par ligne.
 
+    Args:
+        df (DataFrame): Un lot de read_file_chunks, indexé par numéro de
+            ligne, aux noms de colonnes normalisés.
 
-def validate_date(date_value, formats=["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y"]):
-    if isinstance(date_value, pd.Timestamp):
-        return date_value
+    Returns:
+        tuple: La liste des LigneImport valides et celle des messages d'erreur.
+    """
+    if df.empty:
+        return [], []
+    numbers = df.index
+    # Seules les colonnes importées sont nettoyées
+    df = clean_columns(df[[name for name in IMPORTED_COLUMNS if name in df.columns]])
+
+    def column(name):
+        if name in df.columns:
+            return df[name]
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+    # Premier message d'erreur de chaque ligne
+    messages = pd.Series(None, index=df.index, dtype=object)
+
+    def reject(mask, build, *columns):
+        mask = mask & messages.isna()
+        if mask.any():
+            messages[mask] = [
+                str(ValidationError(build(*values)))
+                for values in zip(*(c[mask] for c in columns))
+            ]
+
+    location = lambda value: safe_strip(str(value or "").lower())
+    departements = map_unique(column("departement"), location).fillna("")
+    communes = map_unique(column("communes"), location).fillna("")
+    localites = map_unique(column("localite"), location).fillna("")
+    reject(
+        (departements == "") | (communes == "") | (localites == ""),
+        lambda d, c, l: (
+            f"Département, commune et localité requis "
+            f"(Département: {d}, Commune: {c}, Localité: {l})"
+        ),
+        departements,
+        communes,
+        localites,
+    )
 
-    for fmt in formats:
-        try:
-            return pd.Timestamp(datetime.strptime(date_value, fmt))
-        except ValueError:
-            continue
-    raise ValidationError(f"Format de date incorrect: {date_value}")
+    # Mise en majuscule du nom de l'opérateur
+    operateurs = map_unique(column("operateur"), lambda v: str(v).strip().upper())
+    operateurs = operateurs.fillna("")
+    reject(operateurs == "", lambda _: "Opérateur requis", operateurs)
+
+    latitudes = parse_numeric_column(column("latitude_du_candidat"))
+    longitudes = parse_numeric_column(column("longitude_du_candidat"))
+    reject(
+        latitudes.notna() & ~latitudes.between(-90, 90),
+        lambda lat: f"Latitude invalide: {lat}",
+        latitudes,
+    )
+    reject(
+        longitudes.notna() & ~longitudes.between(-180, 180),
+        lambda long: f"Longitude invalide: {long}",
+        longitudes,
+    )
 
+    dates = {}
+    for name in ("date_autorisation", "date_mise_en_service"):
+        dates[name], invalid = parse_date_column(column(name))
+        reject(invalid, lambda v: f"Format de date incorrect: {v}", column(name))
+
+    # Valeur absente du dictionnaire : False par défaut
+    camouflages = map_unique(
+        column("camouflage"),
+        lambda v: CAMOUFLAGE_MAPPING.get(str(v).replace("\xa0", "").strip().lower(), False),
+    ).eq(True)
+    emplacements = map_unique(column("emplacement"), lambda v: str(v).strip() or None)
+    if "id_du_site" in df.columns:
+        noms = df["id_du_site"]
+    else:
+        noms = pd.Series([f"Site_{n}" for n in numbers], index=df.index)
+
+    valid = messages.isna()
+    site = {
+        "nom": noms,
+        "latitude": latitudes.astype(object).where(latitudes.notna(), None),
+        "longitude": longitudes.astype(object).where(longitudes.notna(), None),
+        "camouflage": camouflages,
+        **dates,
+        **{field: column(name) for field, name in SITE_COLUMNS.items()},
+    }
+    lignes = [
+        LigneImport(numero, departement, commune, localite, operateur, emplacement,
+                    dict(zip(site, values)))
+        for numero, departement, commune, localite, operateur, emplacement, *values in zip(
+            *(
+                values[valid].tolist()
+                for values in (
+                    pd.Series(numbers, index=df.index),
+                    departements,
+                    communes,
+                    localites,
+                    operateurs,
+                    emplacements,
+                    *site.values(),
+                )
+            )
+        )
+    ]
 
-# Récupérer ou créer un objet clé étrangère
-def get_or_create_foreign_key(model_class, field_name, value):
+    errors = []
+    for number, message in messages[~valid].items():
+        logger.warning(f"Erreur de validation à la ligne {number}: {message}")
+        errors.append(f"Ligne {number}: {message}")
+    return lignes, errors
+
+
+# Taille des lots de lignes lues et validées dans les fichiers importés
+CHUNK_SIZE = 10000
+
+
+def chunk_frame(df):
     """
-    Récupère ou crée une instance d'un modèle en fonction d'une clé étrangère.
+    Normalise les noms de colonnes d'un lot (voir normalize_column_name).
 
-    Args:
-        model_class (Model): La classe de modèle à utiliser.
-        field_name (str): Le nom du champ à utiliser pour la recherche.
-        value (any): La valeur à rechercher ou à créer.
+    Les colonnes sans nom sont écartées ; de deux colonnes de même nom
+    normalisé, la dernière l'emporte.
+    """
+    df.columns = [
+        normalize_column_name(str(col)) if col is not None else None for col in df.columns
+    ]
+    return df.loc[:, df.columns.notna() & ~df.columns.duplicated(keep="last")]
 
-    Returns:
-        tuple: L'instance du modèle et un booléen indiquant si elle a été créée.
 
-    Raises:
-        ValidationError: Si une erreur se produit lors de la récupération ou de la création.
+def read_excel_chunks(uploaded_file, chunk_size=CHUNK_SIZE):
     """
+    Lit la première feuille d'un fichier Excel en flux, par lots de lignes.
+
+    Le classeur est ouvert en lecture seule (openpyxl ``read_only``) : les
+    lignes sont lues au fil de l'eau et la mémoire utilisée ne dépend que de
+    la taille des lots, pas de celle du fichier.
 
-    lookup = {field_name: value}
+    Args:
+        uploaded_file: Le fichier Excel (chemin ou objet fichier).
+        chunk_size (int): Le nombre de lignes par lot.
 
+    Yields:
+        DataFrame: Des lots de lignes indexés par numéro de ligne, à partir
+        de 1 sans compter l'en-tête.
+    """
+    if hasattr(uploaded_file, "seek"):
+        uploaded_file.seek(0)
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
     try:
-        instance, created = model_class.objects.get_or_create(**lookup)
-        return instance, created
-    except IntegrityError as e:
-        logger.error(
-            f"Erreur d'intégrité avec {model_class.__name__} ({field_name}={value}): {e}"
-        )
-        raise ValidationError(
-            f"Erreur d'intégrité avec {model_class.__name__} ({field_name}={value})"
-        )
-    except Exception as e:
-        logger.error(f"Erreur avec {model_class.__name__} ({field_name}={value}): {e}")
-        raise ValidationError(
-            f"Erreur avec {model_class.__name__} ({field_name}={value})"
-        )
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        logger.debug(f"Colonnes dans le fichier Excel avant normalisation : {header}")
+        # Les lignes lues peuvent être plus courtes que l'en-tête
+        width = len(header)
+
+        def frame(values, numbers):
+            return chunk_frame(pd.DataFrame.from_records(values, index=numbers, columns=header))
+
+        chunk, numbers = [], []
+        for index, values in enumerate(rows):
+            # Lignes entièrement vides (souvent en fin de feuille)
+            if all(value is None or value == "" for value in values):
+                continue
+            if len(values) != width:
+                values = (tuple(values) + (None,) * width)[:width]
+            chunk.append(values)
+            numbers.append(index + 1)
+            if len(chunk) >= chunk_size:
+                yield frame(chunk, numbers)
+                chunk, numbers = [], []
+        if chunk:
+            yield frame(chunk, numbers)
+    finally:
+        workbook.close()
+
+
+def read_csv_chunks(uploaded_file, chunk_size=CHUNK_SIZE):
+    """
+    Lit un fichier CSV en flux, par lots de lignes.
 
+    Le séparateur (virgule, point-virgule ou tabulation) et l'encodage
+    (UTF-8, sinon Windows-1252) sont déduits du début du fichier. Toutes les
+    valeurs sont lues comme du texte, converties ensuite par prepare_rows
+    comme les cellules Excel.
 
-def get_or_create_localite(row):
-    departement_nom = safe_strip((row.get("departement") or "").lower())
-    commune_nom = safe_strip((row.get("communes") or "").lower())
-    localite_nom = safe_strip((row.get("localite") or "").lower())
+    Args:
+        uploaded_file: Le fichier CSV (chemin ou objet fichier binaire).
+        chunk_size (int): Le nombre de lignes par lot.
 
-    logger.debug(
-        f"Département: '{departement_nom}', Commune: '{commune_nom}', Localité: '{localite_nom}'"
+    Yields:
+        DataFrame: Des lots de lignes indexés par numéro de ligne, à partir
+        de 1 sans compter l'en-tête.
+    """
+    if hasattr(uploaded_file, "seek"):
+        uploaded_file.seek(0)
+        sample = uploaded_file.read(65536)
+        uploaded_file.seek(0)
+    else:
+        with open(uploaded_file, "rb") as f:
+            sample = f.read(65536)
+    try:
+        sample.decode("utf-8")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Un caractère multi-octets peut être coupé en fin d'échantillon
+        encoding = "utf-8-sig" if e.start >= len(sample) - 3 else "cp1252"
+    first_line = sample.split(b"\n", 1)[0].decode(encoding, errors="replace")
+    separator = max((",", ";", "\t"), key=first_line.count)
+
+    reader = pd.read_csv(
+        uploaded_file,
+        sep=separator,
+        encoding=encoding,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        chunksize=chunk_size,
     )
+    with reader:
+        for df in reader:
+            df.index += 1
+            # Lignes ne contenant que des séparateurs
+            df = df.dropna(how="all")
+            if not df.empty:
+                yield chunk_frame(df)
 
-    if not departement_nom or not commune_nom or not localite_nom:
-        raise ValidationError(
-            f"Département, commune et localité requis "
-            f"(Département: {departement_nom}, Commune: {commune_nom}, Localité: {localite_nom})"
-        )
 
-    # def get_or_create_localite(row):
-    #     departement_nom = safe_strip(row.get('departement').lower())
-    #     commune_nom = safe_strip(row.get('communes').lower())
-    #     localite_nom = safe_strip(row.get('localite').lower())
+def read_parquet_chunks(uploaded_file, chunk_size=CHUNK_SIZE):
+    """
+    Lit un fichier Parquet par lots de lignes, groupe de lignes après
+    groupe de lignes (pyarrow ``iter_batches``).
 
-    logger.debug(
-        f"Département: '{departement_nom}', Commune: '{commune_nom}', Localité: '{localite_nom}'"
-    )
+    Les colonnes gardent leur type (nombres, dates, texte) ; la mémoire
+    utilisée dépend de la taille des groupes de lignes du fichier.
+
+    Args:
+        uploaded_file: Le fichier Parquet (chemin ou objet fichier binaire).
+        chunk_size (int): Le nombre maximal de lignes par lot.
+
+    Yields:
+        DataFrame: Des lots de lignes indexés par numéro de ligne, à partir
+        de 1.
 
-    if not departement_nom or not commune_nom or not localite_nom:
+    Raises:
+        ValidationError: Si pyarrow n'est pas installé.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
         raise ValidationError(
-            f"Département, commune et localité requis (Département: {departement_nom}, Commune: {commune_nom}, Localité: {localite_nom})"
+            "La lecture des fichiers Parquet nécessite le paquet pyarrow."
         )
 
-    try:
-        # Récupérer ou créer le département
-        departement_instance, _ = Departement.objects.get_or_create(nom=departement_nom)
+    if hasattr(uploaded_file, "seek"):
+        uploaded_file.seek(0)
+    parquet = pq.ParquetFile(uploaded_file)
+    start = 1
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        df = batch.to_pandas()
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield chunk_frame(df)
 
-        # Récupérer ou créer la commune
-        commune_instance, created_com = Commune.objects.get_or_create(
-            nom=commune_nom, departement=departement_instance
-        )
 
-        # Récupérer ou créer la localité
-        localite_instance, created_loc = Localite.objects.get_or_create(
-            localite=localite_nom, commune=commune_instance
-        )
+# Lecteurs par extension de fichier
+FILE_READERS = {
+    ".xlsx": read_excel_chunks,
+    ".xlsm": read_excel_chunks,
+    ".csv": read_csv_chunks,
+    ".parquet": read_parquet_chunks,
+}
 
-        if created_loc:
-            logger.info(
-                f"Nouvelle localité créée: {localite_nom} dans la commune {commune_nom}"
-            )
-        else:
-            logger.debug(
-                f"Localité existante trouvée: {localite_nom} dans la commune {commune_nom}"
-            )
 
-        return localite_instance
+def read_file_chunks(uploaded_file, file_name, chunk_size=CHUNK_SIZE):
+    """
+    Lit un fichier importé par lots, selon son extension (voir FILE_READERS).
 
-    except IntegrityError as e:
-        logger.error(
-            f"Erreur d'intégrité lors de la création de la localité {localite_nom}: {e}"
-        )
-        raise ValidationError(f"Erreur d'intégrité: {e}")
-    except Exception as e:
-        logger.error(
-            f"Erreur inconnue lors de la création de la localité {localite_nom}: {e}"
+    Raises:
+        ValidationError: Si le format du fichier n'est pas pris en charge.
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    reader = FILE_READERS.get(extension)
+    if reader is None:
+        raise ValidationError(
+            f"Format de fichier non pris en charge : {extension or file_name} "
+            f"(formats acceptés : {', '.join(FILE_READERS)})"
         )
-        raise ValidationError(f"Erreur inconnue: {e}")
-
+    return reader(uploaded_file, chunk_size)
 
-# Récupération ou création d'un emplacement
-def get_or_create_emplacement(row):
-    type_emplacement = row.get("emplacement", "").strip()
 
-    # Si type_emplacement est vide, retourner None
-    if not type_emplacement:
-        return None
+def process_import_file(uploaded_file, progress=None, simulation=False):
+    """
+    Importe les sites d'un fichier Excel, CSV ou Parquet.
 
-    emplacement, created = Emplacement.objects.get_or_create(
-        type_emplacement=type_emplacement
-    )
-    return emplacement
+    Le fichier est lu en flux par lots (voir read_file_chunks) ; chaque lot
+    est validé colonne par colonne (voir prepare_rows) puis importé (voir
+    importation.ImportateurSites), sans jamais charger le fichier entier.
+    Les sites inchangés depuis la dernière importation ne sont pas réécrits.
 
+    Args:
+        uploaded_file: Le fichier (chemin ou objet fichier nommé) ; son
+            format est déduit de son extension.
+        progress (callable): Appelée après chaque lot importé avec le nombre
+            de lignes traitées et le nombre de lignes en erreur.
+        simulation (bool): Comparer le fichier aux sites existants sans rien
+            écrire.
 
-def process_excel_file(uploaded_file):
+    Returns:
+        tuple: Les messages d'erreur des lignes non importées et le rapport
+        de l'importation (sites créés, mis à jour, inchangés et disparus).
+    """
+    file_name = str(getattr(uploaded_file, "name", uploaded_file))
+    chunks = read_file_chunks(uploaded_file, file_name)
     errors = []
-    try:
-        df = pd.read_excel(uploaded_file, engine="openpyxl", header=0)
-        logger.debug(
-            f"Colonnes dans le fichier Excel avant normalisation : {df.columns.tolist()}"
-        )
 
-        df.columns = [normalize_column_name(col) for col in df.columns]
-        df = df.fillna("")  # Utilise None pour les valeurs manquantes
-
-        for index, row in df.iterrows():
-            row = clean_row_values(row)
-            logger.debug(f"Traitement de la ligne {index + 1}: {row}")
-
-            try:
-                localite_instance = get_or_create_localite(row)
-                emplacement_instance = get_or_create_emplacement(row)
-                operateur_nom = (
-                    row.get("operateur", "").strip().upper()
-                )  # Mise en majuscule du nom de l'opérateur
-                operateur_instance, _ = get_or_create_foreign_key(
-                    Operateur, "nom", operateur_nom
-                )
-
-                latitude, longitude = validate_latitude_longitude(
-                    row.get("latitude_du_candidat"), row.get("longitude_du_candidat")
-                )
-
-                # Log pour vérifier la date
-                logger.debug(
-                    f"Date autorisation brute pour la ligne {index + 1}: {row.get('date_autorisation')}"
-                )
-
-                date_autorisation = (
-                    validate_date(row.get("date_autorisation"))
-                    if row.get("date_autorisation")
-                    else None
-                )
-                date_mise_en_service = (
-                    validate_date(row.get("date_mise_en_service"))
-                    if row.get("date_mise_en_service")
-                    else None
-                )
+    def report(importateur):
+        progress(
+            importateur.lignes_traitees + len(errors),
+            len(importateur.erreurs) + len(errors),
+        )
 
-                # Dictionnaire de correspondance pour les valeurs booléennes possibles
-                camouflage_mapping = {
-                    "oui": True,
-                    "yes": True,
-                    "true": True,
-                    "1": True,
-                    "non": False,
-                    "no": False,
-                    "false": False,
-                    "": False,
-                    "0": False,
-                }
-
-                # Obtenir la valeur de 'camouflage' dans la ligne (si None, utilise une chaîne vide '')
-                camouflage_value = row.get("camouflage", "")
-
-                # Assurer qu'il s'agit d'une chaîne de caractères et nettoyer les espaces inutiles
-                camouflage_value = (
-                    str(camouflage_value).replace("\xa0", "").strip().lower()
-                )
+    importateur = ImportateurSites(
+        progression=report if progress else None, simulation=simulation
+    )
 
-                # Mapper la valeur selon le dictionnaire ou utiliser False par défaut si la clé est absente
-                camouflage = camouflage_mapping.get(camouflage_value, False)
-
-                site_data = {
-                    "nom": row.get("id_du_site", f"Site_{index + 1}"),
-                    "localite": localite_instance,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "avis_arcep": row.get("avis_de_larcep_benin"),
-                    "observation": row.get("observations"),
-                    "emplacement": emplacement_instance,
-                    "type_pylone": row.get("type_pylone"),
-                    "hauteur_antenne": row.get("hauteur_antenne"),
-                    "camouflage": camouflage,
-                    "description": row.get("description"),
-                    "proprietaire": row.get("proprietaire_site"),
-                    "operateur": operateur_instance,
-                    "num_dossier": row.get("n_dossier"),
-                    "ref_courrier": row.get("ref_courrier"),
-                    "date_autorisation": date_autorisation,
-                    "date_mise_en_service": date_mise_en_service,
-                }
-                site_data_filtered = {
-                    key: value for key, value in site_data.items() if value is not None
-                }
-
-                Site.objects.update_or_create(
-                    nom=site_data_filtered["nom"], defaults=site_data_filtered
-                )
-                logger.info(
-                    f"Site '{site_data_filtered['nom']}' créé/mis à jour avec succès."
-                )
+    def prepared_rows():
+        for chunk in chunks:
+            lignes, chunk_errors = prepare_rows(chunk)
+            errors.extend(chunk_errors)
+            yield from lignes
 
-            except ValidationError as ve:
-                logger.warning(f"Erreur de validation à la ligne {index + 1}: {ve}")
-                errors.append(f"Ligne {index + 1}: {ve}")
-            except Exception as e:
-                logger.error(f"Erreur inattendue à la ligne {index + 1}: {e}")
-                errors.append(f"Ligne {index + 1}: {e}")
+    try:
+        importateur.importer(prepared_rows())
+        importateur.terminer()
+        logger.info(
+            f"{'Simulation : ' if simulation else ''}"
+            f"{importateur.crees} site(s) créé(s), {importateur.mis_a_jour} mis à jour, "
+            f"{importateur.inchanges} inchangé(s), {importateur.disparus} disparu(s)."
+        )
 
+    except ValidationError:
+        raise
     except Exception as e:
-        logger.error(f"Erreur lors du traitement du fichier Excel: {e}")
-        raise ValidationError(f"Erreur lors du traitement du fichier Excel: {e}")
+        logger.error(f"Erreur lors du traitement du fichier {file_name}: {e}")
+        raise ValidationError(f"Erreur lors du traitement du fichier: {e}")
 
-    return errors
+    return errors + importateur.erreurs, importateur.rapport()
 
 
 def get_filtered_sites(
@@ -476,29 +740,16 @@ def get_filtered_sites(
 
 @login_required(login_url="authentication:login")
 def recherche_ajax(request):
+    """
+    Recherche de sites pour la barre de navigation.
+
+    Paramètres GET : ``q`` (texte recherché, sans tenir compte des accents)
+    et ``limite`` (nombre maximal de résultats, voir recherche.LIMITE_MAX).
+    """
     query = request.GET.get("q", "")
-    resultats = []
-
-    if query:
-        sites = Site.objects.filter(
-            Q(nom__icontains=query)
-            | Q(description__icontains=query)
-            | Q(proprietaire__icontains=query)
-            | Q(operateur__nom__icontains=query)
-            | Q(localite__localite__icontains=query)
-            | Q(localite__commune__nom__icontains=query)
-            | Q(localite__commune__departement__nom__icontains=query)
-        ).distinct()
-
-        resultats = [
-            {
-                "id": site.id,
-                "nom": site.nom,
-                "description": site.description,
-                "localite": str(site.localite),
-                "operateur": site.operateur.nom,
-            }
-            for site in sites
-        ]
-
-    return JsonResponse({"resultats": resultats})
+    try:
+        limite = parse_limite(request.GET.get("limite"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({"resultats": rechercher(query, limite)})
@@ -3,23 +3,74 @@ from django.core.exceptions import ObjectDoesNotExist
 import json
 import os
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.contrib import messages
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 
-from core import settings
+from django.conf import settings
 from .models import *
 import logging
 from .utils import (
     handle_message,
-    process_excel_file,
     get_communes,
     get_statistics_data,
     get_filtered_sites,
+    FILE_READERS,
+)
+from .cache import cle_cache
+from .carte import (
+    FORMAT_BINAIRE,
+    FORMAT_COMPACT,
+    colonnes_sites,
+    donnees_compactes,
+    encoder_binaire,
+    parse_format_carte,
+)
+from .dashboard import obtenir_instantane
+from .densite import couche_densite
+from .export import fichier_xlsx, flux_csv, flux_geojson, flux_ndjson, parse_proprietes
+from .geojson import (
+    NIVEAUX_SIMPLIFICATION,
+    couche_benin,
+    couche_simplifiee,
+    reponse_geojson,
+)
+from .metriques import acces_autorise, exposer, instantane_global
+from .pagination import page_keyset, parse_taille_page
+from .spatial import (
+    CONFORME,
+    NON_CONFORME,
+    SANS_RAPPORT,
+    calculer_clusters,
+    clusters_dans_emprise,
+    filtrer_par_emprise,
+    parse_emprise,
+    parse_zoom,
 )
+from .proximite import (
+    K_MAX,
+    LIMITE_DEFAUT,
+    LIMITE_MAX,
+    RAYON_MAX,
+    index_proximite,
+    parse_coordonnees,
+    parse_entier,
+)
+from .statistiques import annoter_etat
+from .taches import lancer_dans_le_processus
 
 logger = logging.getLogger(__name__)
 
@@ -37,12 +88,10 @@ def custom_error_view(request):
 # Vue dashbord
 # @login_required(login_url='authentication:login')
 def index(request):
-    # Récupérer tous les sites
-    sites = (
-        Site.objects.select_related("operateur", "localite", "emplacement")
-        .prefetch_related("conformite")
-        .all()
-    )
+    # Derniers sites ajoutés ; la liste complète est paginée par site_table
+    sites = Site.objects.select_related("conformite").order_by("-add_at", "-id")[
+        : settings.DASHBOARD_RECENT_SITES
+    ]
 
     site_data = [
         {
@@ -52,116 +101,126 @@ def index(request):
         for site in sites
     ]
 
-    # Calcul du nombre total de sites
-    total_sites = sites.count()
-
-    current_year = datetime.now().year
-    new_sites_per_month = {
-        month: 0 for month in range(1, 13)
-    }  # Initialise le dictionnaire pour chaque mois
+    # Chiffres du tableau de bord (requêtes agrégées, mises en cache)
+    context = obtenir_instantane().contexte()
+    context["site_data"] = site_data
 
-    new_sites = Site.objects.filter(date_autorisation__year=current_year)
-    for site in new_sites:
-        if site.date_autorisation:
-            new_sites_per_month[site.date_autorisation.month] += 1
-
-    total_conforme = Conformite.objects.filter(statut=True).count()
-
-    # Calcul du pourcentage de conformité
-    compliance_percentage = (
-        (total_conforme / total_sites) * 100 if total_sites > 0 else 0
-    )
-
-    # Récupération de tous les opérateurs
-    operateurs = Operateur.objects.all()
+    return render(request, "home/index.html", context)
 
-    # Préparation des données pour le graphique des statistiques des opérateurs
-    operateur_statistics_labels = [operateur.nom for operateur in operateurs]
-    operateur_statistics_counts = [
-        sites.filter(operateur=operateur).count() for operateur in operateurs
-    ]
-    operateur_statistics_non_conform_counts = [
-        sites.filter(operateur=operateur, conformite__statut=False).count()
-        for operateur in operateurs
-    ]
-    operateur_statistics_colors = [operateur.couleur for operateur in operateurs]
 
-    # Calcul du nombre total de sites non conformes
-    non_compliant_sites_count = sites.filter(conformite__statut=False).count()
+def serialiser_site_carte(site):
+    """Prépare les données d'un site pour l'affichage d'un marqueur sur la carte."""
+    if hasattr(site, "conformite") and site.conformite is not None:
+        site_conformite_statut = site.conformite.statut
+    else:
+        site_conformite_statut = None
 
-    # Préparation du contexte pour le template
-    context = {
-        "total_sites": total_sites,
-        "new_sites": new_sites,
-        "compliance_percentage": compliance_percentage,
-        "non_compliant_sites_count": non_compliant_sites_count,
-        "operator_statistics_labels": operateur_statistics_labels,
-        "operator_statistics_counts": operateur_statistics_counts,
-        "operator_statistics_non_conform_counts": operateur_statistics_non_conform_counts,
-        "operator_statistics_colors": operateur_statistics_colors,
-        "new_sites_per_month": new_sites_per_month,
-        "site_data": site_data,
+    # Détermine la couleur de l'icône en fonction de la conformité
+    if site_conformite_statut is True:
+        icon_color = site.operateur.couleur
+    elif site_conformite_statut is False:
+        icon_color = "red"
+    else:
+        icon_color = "grey"
+
+    logo = site.operateur.logo_marqueur
+    return {
+        "id": site.id,
+        "nom": site.nom,
+        "latitude": site.latitude,
+        "longitude": site.longitude,
+        "localite": site.localite.localite if site.localite else "",
+        "operateur_nom": site.operateur.nom,
+        # Dérivé du logo à la taille des marqueurs, plutôt que l'original
+        "operateur_logo": (
+            logo["webp"] or logo["jpeg"] or "/static/assets/img/brand/arcep.png"
+        ),
+        "icon_color": icon_color,
     }
 
-    return render(request, "home/index.html", context)
 
+def filtres_sites(request):
+    """
+    Lit les filtres de get_filtered_sites dans les paramètres GET
+    (``departement``, ``commune``, ``operateur``, ``conformite``, répétables).
 
-# @login_required
-def map_view(request):
-    # Récupère les paramètres de l'URL pour les filtres
+    Returns:
+        tuple: Les listes d'IDs de départements, de communes, d'opérateurs
+        et la liste des états de conformité.
+    """
     departements = [
         int(dep) for dep in request.GET.getlist("departement") if dep.isdigit()
     ]
     communes = [int(com) for com in request.GET.getlist("commune") if com.isdigit()]
     operateurs = [int(op) for op in request.GET.getlist("operateur") if op.isdigit()]
     conformite = request.GET.getlist("conformite")
+    return departements, communes, operateurs, conformite
 
-    # Si des filtres sont fournis, appliquez-les
-    if departements or communes or operateurs or conformite:
-        sites = get_filtered_sites(departements, communes, operateurs, conformite)
-    else:
-        # Sinon, récupère tous les sites
-        sites = Site.objects.select_related("operateur", "localite", "conformite").all()
-
-    # Préparer les données des sites
-    sites_data = []
 
-    for site in sites:
-        if hasattr(site, "conformite") and site.conformite is not None:
-            site_conformite_statut = site.conformite.statut
-        else:
-            site_conformite_statut = None
+# @login_required
+def map_view(request):
+    # Récupère les paramètres de l'URL pour les filtres
+    departements, communes, operateurs, conformite = filtres_sites(request)
 
-        # Détermine la couleur de l'icône en fonction de la conformité
-        if site_conformite_statut is True:
-            icon_color = site.operateur.couleur
-        elif site_conformite_statut is False:
-            icon_color = "red"
+    # Si requête AJAX, retourne uniquement les sites filtrés visibles à l'écran
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        try:
+            emprise = parse_emprise(request.GET.get("bbox"))
+            zoom = parse_zoom(request.GET.get("zoom"))
+            format_carte = parse_format_carte(request.GET.get("format"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        # Si des filtres sont fournis, appliquez-les
+        if departements or communes or operateurs or conformite:
+            sites = get_filtered_sites(departements, communes, operateurs, conformite)
         else:
-            icon_color = "grey"
+            # Sinon, récupère tous les sites
+            sites = Site.objects.select_related(
+                "operateur", "localite", "conformite"
+            ).all()
+
+        # Aux faibles zooms, renvoie des clusters précalculés plutôt que les sites
+        if zoom is not None and zoom < settings.MAP_CLUSTER_MAX_ZOOM:
+            cle = cle_cache(
+                "clusters",
+                departements=sorted(departements),
+                communes=sorted(communes),
+                operateurs=sorted(operateurs),
+                conformite=sorted(conformite),
+                zoom=zoom,
+            )
+            clusters = cache.get(cle)
+            if clusters is None:
+                clusters = calculer_clusters(sites, zoom)
+                cache.set(cle, clusters)
+            return JsonResponse(
+                {
+                    "mode": "clusters",
+                    "clusters": clusters_dans_emprise(clusters, emprise),
+                    "sites": [],
+                    "zoom": zoom,
+                }
+            )
 
-        sites_data.append(
-            {
-                "id": site.id,
-                "nom": site.nom,
-                "latitude": site.latitude,
-                "longitude": site.longitude,
-                "localite": site.localite.localite if site.localite else "",
-                "operateur_nom": site.operateur.nom,
-                "operateur_logo": (
-                    site.operateur.logo.url
-                    if site.operateur.logo
-                    else "/static/assets/img/brand/arcep.png"
-                ),
-                "icon_color": icon_color,
-            }
-        )
+        # Restreint la requête à l'emprise de la carte (index en grille)
+        if emprise:
+            sites = filtrer_par_emprise(sites, emprise)
+
+        # Formats compacts : dictionnaires envoyés une fois, sites en colonnes
+        if format_carte == FORMAT_COMPACT:
+            return JsonResponse(donnees_compactes(colonnes_sites(sites), zoom))
+        if format_carte == FORMAT_BINAIRE:
+            return HttpResponse(
+                encoder_binaire(colonnes_sites(sites), zoom),
+                content_type="application/octet-stream",
+            )
 
-    # Si requête AJAX, retourne les sites filtrés
-    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-        return JsonResponse({"sites": sites_data})
+        sites_data = [serialiser_site_carte(site) for site in sites]
+        return JsonResponse({"mode": "sites", "sites": sites_data, "zoom": zoom})
 
-    # Sinon, retourne tous les sites dans le contexte pour le chargement initial
+    # Sinon, la page est rendue sans sites : la carte les charge par AJAX
+    # selon l'emprise affichée
     context = {
         "departements": Departement.objects.all(),
         "communes": (
@@ -170,7 +229,9 @@ def map_view(request):
             else []
         ),
         "operateurs": Operateur.objects.all(),
-        "sites": sites_data,  # Tous les sites pour le chargement initial
+        "technologies": Technologie.objects.all(),
+        # Zoom maximal de chaque niveau de simplification des contours
+        "zooms_simplification": [zoom_max for zoom_max, *_ in NIVEAUX_SIMPLIFICATION],
     }
 
     return render(request, "home/map.html", context)
@@ -178,15 +239,24 @@ def map_view(request):
 
 # @login_required(login_url='authentication:login')
 def get_geojson(request, geojson_type):
-    file_path = os.path.join(
-        settings.BASE_DIR, "static/geojson", f"BENIN_{geojson_type.upper()}.json"
-    )
+    actif = couche_benin(geojson_type)
+    if actif is None:
+        return JsonResponse({"error": "Fichier GeoJSON introuvable"}, status=404)
+    return reponse_geojson(request, actif)
+
+
+# Contours administratifs simplifiés selon le zoom de la carte
+# @login_required(login_url='authentication:login')
+def geojson_contours(request, nom):
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        return JsonResponse(data)
-    except FileNotFoundError:
+        zoom = parse_zoom(request.GET.get("zoom"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    actif = couche_simplifiee(nom, zoom)
+    if actif is None:
         return JsonResponse({"error": "Fichier GeoJSON introuvable"}, status=404)
+    return reponse_geojson(request, actif)
 
 
 # Vues CRUD pour les opérateurs
@@ -517,6 +587,24 @@ def localite_delete(request, pk):
 
 
 # Vues pour  CRUD les sites
+ETATS_CONFORMITE = (
+    (CONFORME, "Conforme"),
+    (NON_CONFORME, "Non Conforme"),
+    (SANS_RAPPORT, "N/A"),
+)
+
+# Colonnes triables et filtrables du tableau des sites : nom de la colonne
+# projetée pour chacune. Les colonnes nullables sont ramenées à "" pour que
+# la clé de tri (valeur, id) reste totalement ordonnée.
+COLONNES_TABLE_SITES = {
+    "nom": "nom",
+    "operateur": "operateur_nom",
+    "localite": "localite_nom",
+    "emplacement": "emplacement_nom",
+    "conformite": "etat",
+}
+
+
 # @login_required(login_url='authentication:login')
 def site_list(request):
     if ids := request.POST.getlist("ids"):
@@ -532,23 +620,267 @@ def site_list(request):
                 )
             return redirect("home:site_list")
 
-    sites = Site.objects.all()
-
-    site_data = [
-        {
-            "site": site,
-            "has_conformite": hasattr(site, "conformite"),
-        }
-        for site in sites
-    ]
+    # Les lignes sont chargées page par page par la vue site_table
     context = {
-        "sites": site_data,
+        "operateurs": Operateur.objects.order_by("nom").values_list("nom", flat=True),
+        "etats": ETATS_CONFORMITE,
+        "tailles_page": (10, 20, 30, 40),
         "messages": messages.get_messages(request),
     }
 
     return render(request, "home/site_list.html", context)
 
 
+def lignes_table_sites(filtres):
+    """
+    Construit la requête projetée du tableau des sites.
+
+    Les jointures vers l'opérateur, la localité, l'emplacement et la
+    conformité sont résolues dans une seule requête ``values()``.
+
+    Args:
+        filtres (dict): Filtres par colonne (clés de COLONNES_TABLE_SITES).
+
+    Returns:
+        QuerySet: Les lignes du tableau sous forme de dictionnaires.
+    """
+    lignes = annoter_etat(Site.objects.all()).annotate(
+        operateur_nom=F("operateur__nom"),
+        localite_nom=Coalesce(F("localite__localite"), Value("")),
+        emplacement_nom=Coalesce(F("emplacement__type_emplacement"), Value("")),
+    )
+    for colonne, valeur in filtres.items():
+        champ = COLONNES_TABLE_SITES[colonne]
+        # L'opérateur et la conformité sont choisis dans une liste
+        if colonne in ("operateur", "conformite"):
+            lignes = lignes.filter(**{champ: valeur})
+        else:
+            lignes = lignes.filter(**{f"{champ}__icontains": valeur})
+    return lignes.values("id", *COLONNES_TABLE_SITES.values())
+
+
+# Vue JSON paginée du tableau des sites (pagination par clé)
+# @login_required(login_url='authentication:login')
+def site_table(request):
+    """
+    Retourne une page du tableau des sites.
+
+    Paramètres GET : ``tri`` (colonne, préfixée de "-" pour un tri
+    décroissant), ``apres`` / ``avant`` (curseurs renvoyés par la page
+    précédente), ``taille`` et un filtre par colonne (``nom``, ``operateur``,
+    ``localite``, ``emplacement``, ``conformite``).
+    """
+    tri = request.GET.get("tri") or "nom"
+    descendant = tri.startswith("-")
+    colonne_tri = tri.lstrip("-")
+    if colonne_tri not in COLONNES_TABLE_SITES:
+        return JsonResponse({"error": f"Colonne de tri invalide : {colonne_tri}"}, status=400)
+
+    filtres = {
+        colonne: valeur.strip()
+        for colonne in COLONNES_TABLE_SITES
+        if (valeur := request.GET.get(colonne, "")).strip()
+    }
+    if filtres.get("conformite", CONFORME) not in dict(ETATS_CONFORMITE):
+        return JsonResponse({"error": "Filtre de conformité invalide."}, status=400)
+
+    try:
+        page = page_keyset(
+            lignes_table_sites(filtres),
+            COLONNES_TABLE_SITES[colonne_tri],
+            descendant=descendant,
+            apres=request.GET.get("apres"),
+            avant=request.GET.get("avant"),
+            taille=parse_taille_page(request.GET.get("taille")),
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse(
+        {
+            "sites": [
+                {
+                    "id": ligne["id"],
+                    "nom": ligne["nom"],
+                    "operateur": ligne["operateur_nom"],
+                    "localite": ligne["localite_nom"],
+                    "emplacement": ligne["emplacement_nom"],
+                    "conformite": ligne["etat"],
+                }
+                for ligne in page["lignes"]
+            ],
+            "suivant": page["suivant"],
+            "precedent": page["precedent"],
+        }
+    )
+
+
+# Export des sites filtrés, en flux
+# @login_required(login_url='authentication:login')
+def site_export(request):
+    """
+    Exporte les sites en CSV ou en XLSX.
+
+    Paramètres GET : ``format`` (``csv`` par défaut, ou ``xlsx``) et les
+    filtres de get_filtered_sites (voir filtres_sites).
+    """
+    format_export = request.GET.get("format", "csv")
+    if format_export not in ("csv", "xlsx"):
+        return JsonResponse({"error": f"Format d'export invalide : {format_export}"}, status=400)
+
+    sites = get_filtered_sites(*filtres_sites(request))
+    nom_fichier = f"sites_{date.today():%Y%m%d}.{format_export}"
+    if format_export == "xlsx":
+        return FileResponse(
+            fichier_xlsx(sites),
+            as_attachment=True,
+            filename=nom_fichier,
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+
+    response = StreamingHttpResponse(flux_csv(sites), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+# Flux GeoJSON des sites filtrés, pour les outils SIG (QGIS...)
+FLUX_SITES = {
+    "geojson": (flux_geojson, "application/geo+json"),
+    "ndjson": (flux_ndjson, "application/x-ndjson"),
+}
+
+
+# @login_required(login_url='authentication:login')
+def site_feed(request):
+    """
+    Flux GeoJSON des sites.
+
+    Paramètres GET : ``format`` (``geojson`` pour une FeatureCollection, par
+    défaut, ou ``ndjson`` pour une entité par ligne), ``proprietes`` (noms
+    séparés par des virgules, voir export.PROPRIETES_FLUX) et les filtres de
+    get_filtered_sites (voir filtres_sites).
+    """
+    format_flux = request.GET.get("format", "geojson")
+    if format_flux not in FLUX_SITES:
+        return JsonResponse({"error": f"Format de flux invalide : {format_flux}"}, status=400)
+    try:
+        proprietes = parse_proprietes(request.GET.get("proprietes"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    flux, content_type = FLUX_SITES[format_flux]
+    sites = get_filtered_sites(*filtres_sites(request))
+    return StreamingHttpResponse(flux(sites, proprietes), content_type=content_type)
+
+
+# Sites proches d'un point (index de proximité en mémoire)
+# @login_required(login_url='authentication:login')
+def site_proximite(request):
+    """
+    Sites dans un rayon autour d'un point, ou les k plus proches.
+
+    Paramètres GET : ``lat``, ``lon`` (degrés), puis ``rayon`` (mètres) ou
+    ``k`` (nombre de sites) ; ``limite`` (résultats du rayon) ; filtres
+    ``operateur`` et ``exclure_operateur`` (IDs d'opérateurs) et
+    ``technologie`` (IDs de technologies, toutes requises), répétables.
+    """
+    try:
+        lat, lon = parse_coordonnees(request.GET.get("lat"), request.GET.get("lon"))
+        rayon = parse_entier(request.GET.get("rayon"), "Rayon", RAYON_MAX)
+        k = parse_entier(request.GET.get("k"), "Nombre de sites", K_MAX)
+        limite = parse_entier(request.GET.get("limite"), "Limite", LIMITE_MAX, LIMITE_DEFAUT)
+        if (rayon is None) == (k is None):
+            raise ValueError("Indiquer soit un rayon (mètres), soit un nombre de sites k.")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    def ids(parametre):
+        return [int(v) for v in request.GET.getlist(parametre) if v.isdigit()]
+
+    filtres = {
+        "operateurs": ids("operateur"),
+        "exclure_operateurs": ids("exclure_operateur"),
+        "technologies": ids("technologie"),
+    }
+    index = index_proximite()
+    if rayon is not None:
+        site_ids, distances = index.dans_rayon(lat, lon, rayon, **filtres)
+    else:
+        site_ids, distances = index.plus_proches(lat, lon, k, **filtres)
+    total = len(site_ids)
+    site_ids, distances = site_ids[:limite].tolist(), distances[:limite].tolist()
+
+    details = Site.objects.filter(id__in=site_ids).values_list(
+        "id", "nom", "latitude", "longitude", "operateur__nom"
+    )
+    details = {ligne[0]: ligne for ligne in details}
+    sites = []
+    for site_id, distance in zip(site_ids, distances):
+        # Un site supprimé depuis la construction de l'index est ignoré
+        if site_id not in details:
+            continue
+        _, nom, latitude, longitude, operateur = details[site_id]
+        sites.append(
+            {
+                "id": site_id,
+                "nom": nom,
+                "operateur": operateur,
+                "latitude": float(latitude),
+                "longitude": float(longitude),
+                "distance": round(distance, 1),
+            }
+        )
+    return JsonResponse({"total": total, "sites": sites})
+
+
+# Métriques des vues pour Prometheus (voir metriques.py)
+def metriques(request):
+    """
+    Expose les métriques de tous les workers.
+
+    Introuvable (404) si METRICS_ENABLED est faux ; réservée au réseau
+    interne ou au porteur du jeton (voir metriques.acces_autorise).
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not acces_autorise(request):
+        return HttpResponseForbidden()
+    instantane, nombre_processus = instantane_global()
+    return HttpResponse(
+        exposer(instantane, nombre_processus),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+# Carte de chaleur : grille de densité précalculée (voir densite.py)
+# @login_required(login_url='authentication:login')
+def site_densite(request):
+    """
+    Couche de la carte de chaleur des sites.
+
+    Paramètres GET : ``operateur`` ou ``technologie`` (un ID) ; sans l'un ni
+    l'autre, la couche de tous les sites.
+    """
+    operateur = request.GET.get("operateur") or None
+    technologie = request.GET.get("technologie") or None
+    for valeur in (operateur, technologie):
+        if valeur is not None and not valeur.isdigit():
+            return JsonResponse({"error": f"ID invalide : {valeur}"}, status=400)
+    if operateur and technologie:
+        return JsonResponse(
+            {"error": "Indiquer soit un opérateur, soit une technologie."}, status=400
+        )
+
+    cle = cle_cache("densite", operateur=operateur, technologie=technologie)
+    couche = cache.get(cle)
+    if couche is None:
+        couche = couche_densite(
+            int(operateur) if operateur else None, int(technologie) if technologie else None
+        )
+        cache.set(cle, couche)
+    return JsonResponse(couche)
+
+
 # Vue pour afficher les détails d'un site
 # @login_required(login_url='authentication:login')
 def site_detail(request, pk):
@@ -1084,7 +1416,10 @@ def delete_conformite(request, site_id):
 # @login_required(login_url='authentication:login')
 def file_upload_view(request):
     if request.method != "POST":
-        return render(request, "home/file_upload.html")
+        job = None
+        if (job_id := request.GET.get("job", "")).isdigit():
+            job = ImportJob.objects.filter(pk=job_id).first()
+        return render(request, "home/file_upload.html", {"job": job})
 
     uploaded_file = request.FILES.get("file")
 
@@ -1092,31 +1427,58 @@ def file_upload_view(request):
         handle_message(request, "Aucun fichier sélectionné.")
         return redirect("home:file_upload")
 
+    if os.path.splitext(uploaded_file.name)[1].lower() not in FILE_READERS:
+        handle_message(
+            request,
+            f"Format de fichier non pris en charge (formats acceptés : {', '.join(FILE_READERS)}).",
+            level="error",
+        )
+        return redirect("home:file_upload")
+
     try:
-        # Sauvegarde du fichier téléversé
+        # Sauvegarde du fichier téléversé ; l'importation est exécutée en
+        # arrière-plan par la commande traiter_imports, ou à défaut par un
+        # thread de ce processus
         instance = UploadedFile(file=uploaded_file)
         instance.save()
-
-        # Processus de traitement basé sur le type de fichier sélectionné
-        errors = process_excel_file(uploaded_file)
-
-        if errors:
-            for error in errors:
-                handle_message(request, error)
-            handle_message(
-                request,
-                "Certaines lignes n'ont pas pu être importées. Consultez les messages d'erreur.",
-            )
-        else:
-            handle_message(request, "Fichier téléversé et traité avec succès.")
-            return redirect("home:home")
-    except ValidationError as ve:
-        handle_message(request, f"Erreur lors du traitement du fichier : {ve}")
-        logger.error(f"Erreur lors du traitement du fichier {uploaded_file.name}: {ve}")
+        job = ImportJob.objects.create(
+            fichier=instance, simulation=bool(request.POST.get("simulation"))
+        )
+        if not settings.IMPORT_WORKER_EXTERNE:
+            lancer_dans_le_processus(job)
     except Exception as e:
         handle_message(request, f"Une erreur inattendue s'est produite : {e}")
         logger.exception(
-            f"Erreur imprévue lors du téléversement ou du traitement du fichier {uploaded_file.name}: {e}"
+            f"Erreur imprévue lors du téléversement du fichier {uploaded_file.name}: {e}"
         )
+        return redirect("home:file_upload")
 
-    return redirect("home:file_upload")
+    handle_message(
+        request,
+        "Fichier téléversé, simulation en cours."
+        if job.simulation
+        else "Fichier téléversé, importation en cours.",
+    )
+    return redirect(f"{reverse('home:file_upload')}?job={job.pk}")
+
+
+# Progression d'une importation, interrogée par la page de téléversement
+# @login_required(login_url='authentication:login')
+def import_progress(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    termine = job.statut in (ImportJob.TERMINE, ImportJob.ECHEC)
+    return JsonResponse(
+        {
+            "id": job.pk,
+            "statut": job.statut,
+            "statut_libelle": job.get_statut_display(),
+            "termine": termine,
+            "lignes_traitees": job.lignes_traitees,
+            "lignes_en_erreur": job.lignes_en_erreur,
+            "debit": round(job.debit, 1),
+            "message": job.message,
+            "simulation": job.simulation,
+            "rapport": job.rapport,
+            "erreurs": job.erreurs if termine else [],
+        }
+    )
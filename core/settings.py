@@ -1,6 +1,6 @@
 # -*- encoding: utf-8 -*-
 import os
-from decouple import config
+from decouple import Csv, config
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -28,12 +28,14 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
-    "apps.home",  # Enable the inner home (home)
+    "apps.home.config.MyConfig",  # Enable the inner home (home)
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Après WhiteNoise : les fichiers statiques ne sont pas mesurés
+    "apps.home.middleware.MetriquesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -105,6 +107,38 @@ DATABASES = {
 #     )
 # }
 
+# Cache partagé entre les workers gunicorn (versions des données, résultats agrégés)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": config("CACHE_DIR", default=os.path.join(BASE_DIR, ".cache")),
+        "TIMEOUT": 3600,
+    }
+}
+
+# Cartographie : en dessous de ce zoom, les sites sont regroupés en clusters
+MAP_CLUSTER_MAX_ZOOM = config("MAP_CLUSTER_MAX_ZOOM", default=12, cast=int)
+
+# Tableau de bord : nombre de derniers sites ajoutés affichés (la liste
+# complète est paginée par la page des sites)
+DASHBOARD_RECENT_SITES = config("DASHBOARD_RECENT_SITES", default=50, cast=int)
+
+# Métriques des vues (latence, requêtes SQL) exposées sur /metrics
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# Nombre d'exécutions d'une même requête SQL dans une requête HTTP à partir
+# duquel elle est comptée comme répétée (N+1)
+METRICS_REPEATED_QUERY_THRESHOLD = config("METRICS_REPEATED_QUERY_THRESHOLD", default=10, cast=int)
+# Accès à /metrics : adresses des réseaux autorisés (séparés par des
+# virgules), ou jeton attendu dans l'en-tête « Authorization: Bearer ».
+# Derrière un proxy, l'adresse vue est celle du proxy : utiliser le jeton.
+METRICS_ALLOWED_NETWORKS = config("METRICS_ALLOWED_NETWORKS", default="127.0.0.0/8,::1/128", cast=Csv())
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# Importations : True si la commande traiter_imports tourne à côté du site,
+# sur la même base et les mêmes fichiers téléversés ; sinon chaque
+# importation est exécutée dans un thread du processus web
+IMPORT_WORKER_EXTERNE = config("IMPORT_WORKER_EXTERNE", default=False, cast=bool)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {